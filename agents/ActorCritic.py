@@ -14,7 +14,7 @@ class ActorCritic(REINFORCE):
       'critic':  getattr(torch.optim, cfg['optimizer']['name'])(self.network.critic_params, **cfg['optimizer']['critic_kwargs'])
     }
     # Set replay buffer
-    self.replay = FiniteReplay(self.cfg['steps_per_epoch']+1, keys=['reward', 'mask', 'v', 'log_pi', 'ret', 'adv'])
+    self.replay = RolloutStorage(self.cfg['steps_per_epoch']+1, keys=['state', 'action', 'reward', 'mask', 'v', 'log_pi'])
 
   def createNN(self, input_type):
     # Set feature network
@@ -39,6 +39,7 @@ class ActorCritic(REINFORCE):
     return NN
     
   def run_steps(self, render=False):
+    assert self.num_envs == 1, f'{self.agent_name} does not support num_envs > 1.'
     # Run for multiple episodes
     self.step_count = 0
     self.episode_count = 0
@@ -47,18 +48,26 @@ class ActorCritic(REINFORCE):
     self.episode_return_list = {'Train': [], 'Test': []}
     mode = 'Train'
     self.start_time = time.time()
+    self.resume_from_checkpoint()
     self.reset_game('Train')
     self.reset_game('Test')
     while self.step_count < self.train_steps:
+      if self.check_checkpoint():
+        break
       if mode == 'Train' and self.cfg['test_per_epochs'] > 0 and self.epoch_count % self.cfg['test_per_epochs'] == 0:
         mode = 'Test'
       else:
         mode = 'Train'
         self.epoch_count += 1
+      if mode == 'Test' and self.test_workers > 0:
+        # Evaluate in the Test workers and continue training
+        self.submit_test()
+        continue
       # Set network back to training/evaluation mode
       self.set_net_mode(mode)
       # Run for one epoch
       self.run_epoch(mode, render)
+      self.save_test_results()
 
   def run_epoch(self, mode, render):
     if mode == 'Train':
@@ -113,11 +122,17 @@ class ActorCritic(REINFORCE):
       self.save_episode_result(mode)
       self.reset_game(mode)
 
+  def get_acting_numpy_net(self, mode):
+    # The rollout storage keeps no autograd graph (learn recomputes log_pi and v), so Train actions can use the mirror too
+    return self.get_numpy_net(self.network)
+
   def save_experience(self, prediction):
-    # Save reward, mask, v, log_pi
+    # Save state, action, reward, mask, v, log_pi
     mode = 'Train'
     if self.reward[mode] is not None:
       prediction = {
+        'state': to_tensor(self.state[mode], self.device),
+        'action': to_tensor(self.action[mode], self.device),
         'reward': to_tensor(self.reward[mode], self.device),
         'mask': to_tensor(1-self.done[mode], self.device),
         'v': prediction['v'],
@@ -125,30 +140,35 @@ class ActorCritic(REINFORCE):
       }
       self.replay.add(prediction)
     else:
-      self.replay.add({'v':prediction['v']})
+      self.replay.add({'v': prediction['v']})
+
+  def compute_return_and_advantage(self):
+    '''
+    Compute returns and advantages of one epoch in one pass
+    '''
+    steps = self.cfg['steps_per_epoch']
+    entries = self.replay.get(['reward', 'mask'], steps)
+    v = self.replay.get(['v'], steps+1, detach=True).v
+    ret = compute_returns(entries.reward, entries.mask, v[-1], self.discount)
+    if self.cfg['gae'] < 0:
+      adv = ret - v[:-1]
+    else:
+      adv = compute_gae(entries.reward, entries.mask, v, self.discount, self.cfg['gae'])
+    return ret.detach(), adv.detach()
 
   def learn(self):
     mode = 'Train'
-    # Compute return and advantage
-    adv = torch.tensor(0.0)
-    ret = self.replay.v[-1].detach()
-    for i in reversed(range(self.cfg['steps_per_epoch'])):
-      ret = self.replay.reward[i] + self.discount * self.replay.mask[i] * ret
-      if self.cfg['gae'] < 0:
-        adv = ret - self.replay.v[i].detach()
-      else:
-        td_error = self.replay.reward[i] + self.discount * self.replay.mask[i] * self.replay.v[i+1] - self.replay.v[i]
-        adv = self.discount * self.cfg['gae'] * self.replay.mask[i] * adv + td_error
-      print('adv len: ', len(self.replay.adv))
-      self.replay.adv[i] = adv.detach()
-      self.replay.ret[i] = ret.detach()
     # Get training data
-    entries = self.replay.get(['log_pi', 'v', 'ret', 'adv'], self.cfg['steps_per_epoch'])
+    entries = self.replay.get(['state', 'action'], self.cfg['steps_per_epoch'])
+    # Compute return and advantage
+    ret, adv = self.compute_return_and_advantage()
     # # Normalize advantages
-    # entries.adv.copy_((entries.adv - entries.adv.mean()) / entries.adv.std())
+    # adv = (adv - adv.mean()) / adv.std()
+    # Recompute log_pi and v in one batch since the rollout storage keeps no autograd graph
+    prediction = self.network(entries.state, entries.action)
     # Compute losses
-    actor_loss = -(entries.log_pi * entries.adv).mean()
-    critic_loss = (entries.ret - entries.v).pow(2).mean()
+    actor_loss = -(prediction['log_pi'] * adv).mean()
+    critic_loss = (ret - prediction['v']).pow(2).mean()
     # Take an optimization step for actor
     self.optimizer['actor'].zero_grad()
     actor_loss.backward()
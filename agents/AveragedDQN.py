@@ -10,24 +10,29 @@ class AveragedDQN(VanillaDQN):
     self.k = cfg['agent']['target_networks_num'] # number of target networks
     # Create target Q value network
     self.Q_net_target = [None] * self.k
+    # Keep the parameters of all networks in flat tensors so that a target network sync is one copy_
+    flatten_parameters(self.Q_net[0])
     for i in range(self.k):
-      self.Q_net_target[i] = self.createNN(cfg['env']['input_type']).to(self.device)
+      self.Q_net_target[i] = flatten_parameters(self.createNN(cfg['env']['input_type']).to(self.device))
       # Load target Q value network
-      self.Q_net_target[i].load_state_dict(self.Q_net[0].state_dict())
+      hard_update(self.Q_net_target[i], self.Q_net[0])
       self.Q_net_target[i].eval()
     self.update_target_net_index = 0
+    # Evaluate all target Q_nets in one batched pass
+    self.Q_net_target_ensemble = EnsembleDQNNet()
   
   def update_target_net(self):
     if self.step_count % self.cfg['target_network_update_steps'] == 0:
-      self.Q_net_target[self.update_target_net_index].load_state_dict(self.Q_net[self.update_Q_net_index].state_dict())
+      hard_update(self.Q_net_target[self.update_target_net_index], self.Q_net[self.update_Q_net_index])
       self.update_target_net_index = (self.update_target_net_index + 1) % self.k
  
+  def compute_q_and_target(self, batch):
+    # q_target is computed with the target Q_nets, so Q_net is evaluated separately
+    return self.compute_q(batch), self.compute_q_target(batch)
+
   def compute_q_target(self, batch):
     with torch.no_grad():
-      q_sum = self.Q_net_target[0](batch.next_state).clone()
-      for i in range(1, self.k):
-        q = self.Q_net_target[i](batch.next_state)
-        q_sum = q_sum + q
+      q_sum = self.Q_net_target_ensemble(batch.next_state, self.Q_net_target).sum(0)
       q_next = q_sum.max(1)[0] / self.k
       q_target = batch.reward + self.discount * q_next * batch.mask
     return q_target
\ No newline at end of file
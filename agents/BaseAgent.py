@@ -9,8 +9,323 @@ import torch.optim as optim
 from gym.spaces.box import Box
 from gym.spaces.discrete import Discrete
 
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
 from utils.logger import *
+from utils.helper import *
+from components.inference import make_numpy_net
+
+
+# The agent copy in a Test worker process, see BaseAgent.get_test_pool
+test_agent = None
+# Normalizers with statistics (e.g. MeanStdNormalizer in PPO and RPG), sent to the Test workers with the networks
+normalizer_keys = ['state_normalizer', 'reward_normalizer']
+
+def init_test_worker(agent):
+  '''
+  Initialize a forked Test worker: act on CPU with the CPU copies of the networks,
+  and keep Test returns in the worker instead of saving them to files.
+  '''
+  global test_agent
+  test_agent = agent
+  set_one_thread()
+  agent.device = 'cpu'
+  # Keep a reference to the training networks so that they are not freed in the forked process
+  agent.learner_nets = agent.get_eval_nets()
+  agent.set_eval_nets(agent.test_nets)
+  # Normalizer statistics come from the learner with each snapshot and are not updated with Test states
+  for key in normalizer_keys:
+    if hasattr(agent, key):
+      getattr(agent, key).set_read_only()
+  agent.test_returns = []
+  agent.save_episode_result = lambda mode, episode_return=None: agent.test_returns.append(agent.episode_return[mode] if episode_return is None else episode_return)
+
+def run_test_worker(snapshot, seed):
+  # Run one Test episode with a snapshot of the networks, normalizers and step count, and return the episode return
+  agent = test_agent
+  for net, state_dict in zip(agent.get_eval_nets(), snapshot['nets']):
+    net.load_state_dict(state_dict)
+  for key, state_dict in snapshot['normalizers'].items():
+    getattr(agent, key).load_state_dict(state_dict)
+  # Agents that act randomly during exploration (e.g. SAC and DDPG) check step_count
+  agent.step_count = snapshot['step_count']
+  set_random_seed(seed)
+  agent.env['Test'].seed(seed)
+  agent.reset_game('Test')
+  agent.set_net_mode('Test')
+  agent.run_episode('Test', False)
+  return agent.test_returns.pop()
+
+
+def has_state(x):
+  # Whether x is saved in checkpoints with its state_dict: networks, optimizers, replay buffers, normalizers, etc.
+  return hasattr(x, 'state_dict') and hasattr(x, 'load_state_dict') and not isinstance(x, type)
+
 
 class BaseAgent(object):
+  # Counters and results saved in checkpoints, besides the attributes with a state_dict
+  checkpoint_keys = ['step_count', 'episode_count', 'epoch_count', 'update_Q_net_index', 'update_target_net_index', 'test_count', 'result', 'episode_return_list']
+  # Attributes not saved in checkpoints: copies of the networks for other processes, and the Test pool
+  checkpoint_exclude = ['test_nets', 'learner_nets', 'learner_Q_net', 'shared_Q_net', 'test_pool']
+
   def __init__(self, cfg):
-    self.logger = Logger(cfg['logs_dir'])
\ No newline at end of file
+    # Append to the log of a resumed run
+    self.logger = Logger(cfg['logs_dir'], filemode='a' if cfg['resume'] else 'w')
+    self.test_workers = cfg['test_workers']
+    self.test_episodes = cfg['test_episodes']
+    self.test_pool = None
+    self.test_jobs = []
+    self.test_count = 0
+    self.numpy_acting = cfg['numpy_acting']
+    self.numpy_nets = {}
+    # Checkpoints: saved every checkpoint_steps steps (if > 0) and when requested (see Experiment.run)
+    self.resume = cfg['resume']
+    self.checkpoint_path = cfg['checkpoint_path']
+    self.checkpoint_steps = int(cfg['checkpoint_steps'])
+    self.checkpoint_step = 0
+    self.checkpoint_requested = False
+    self.stopped = False
+    self.resumed_time = 0
+    # Run status (see utils/status.py), set by Experiment.run
+    self.status = None
+
+  def update_target_net(self):
+    pass
+
+  def run_vec_steps(self, render=False):
+    '''
+    Run for multiple steps with num_envs Train environments (see envs.vec_env):
+      - Actions of all environments are selected in one batch and their transitions are saved in one batch.
+      - step_count counts the transitions of all environments. Learning and target network updates
+        are checked after every transition, the same as with a single environment.
+      - Each finished episode is saved and counted separately.
+    '''
+    mode = 'Train'
+    self.step_count = 0
+    self.episode_count = 0
+    self.result = {'Train': [], 'Test': []}
+    self.episode_return_list = {'Train': [], 'Test': []}
+    self.start_time = time.time()
+    self.resume_from_checkpoint()
+    self.original_state = self.env[mode].reset()
+    self.state[mode] = self.state_normalizer(self.original_state)
+    self.episode_return[mode] = np.zeros(self.num_envs)
+    self.episode_step_count[mode] = np.zeros(self.num_envs, dtype=int)
+    self.reset_game('Test')
+    if self.cfg['test_per_episodes'] > 0:
+      self.run_test_episode(render)
+    while self.step_count < self.train_steps:
+      if self.check_checkpoint():
+        break
+      self.run_vec_step(render)
+
+  def run_vec_step(self, render):
+    mode = 'Train'
+    self.set_net_mode(mode)
+    self.action[mode] = self.get_vec_action()
+    if self.action_type == 'CONTINUOUS':
+      action = np.clip(self.action[mode], self.action_min, self.action_max)
+    else:
+      action = self.action[mode]
+    # Take a step in all environments
+    next_state, reward, self.done[mode], info = self.env[mode].step(action)
+    next_state_normalized = self.state_normalizer(next_state)
+    # For finished episodes, the next state is the terminal observation
+    self.original_next_state = next_state.copy()
+    self.next_state[mode] = next_state_normalized.copy()
+    for i in np.nonzero(self.done[mode])[0]:
+      self.original_next_state[i] = info[i]['terminal_observation']
+      self.next_state[mode][i] = self.state_normalizer(info[i]['terminal_observation'])
+    self.reward[mode] = self.reward_normalizer(reward)
+    self.episode_return[mode] += self.reward[mode]
+    self.episode_step_count[mode] += 1
+    # Save experience of all environments
+    self.save_vec_experience()
+    for _ in range(self.num_envs):
+      # Update policy
+      if self.time_to_learn():
+        self.learn()
+      # Update target network
+      self.update_target_net()
+      self.step_count += 1
+    # Update state
+    self.original_state = next_state
+    self.state[mode] = next_state_normalized
+    self.save_test_results()
+    # End of episodes
+    for i in np.nonzero(self.done[mode])[0]:
+      self.save_episode_result(mode, self.episode_return[mode][i])
+      self.episode_count += 1
+      self.episode_return[mode][i] = 0
+      self.episode_step_count[mode][i] = 0
+      if self.cfg['test_per_episodes'] > 0 and self.episode_count % self.cfg['test_per_episodes'] == 0:
+        self.run_test_episode(render)
+
+  def run_test_episode(self, render):
+    if self.test_workers > 0:
+      self.submit_test()
+      return
+    self.set_net_mode('Test')
+    self.run_episode('Test', render)
+    self.set_net_mode('Train')
+
+  def get_numpy_net(self, net):
+    '''
+    Return the NumPy mirror of net for acting (see components.inference), or None if numpy_acting is off
+    or net is not supported. Mirrors are cached per network and rebuilt when they are stale.
+    '''
+    if not self.numpy_acting:
+      return None
+    cached_net, numpy_net = self.numpy_nets.get(id(net), (None, None))
+    if cached_net is not net or (numpy_net is not None and not numpy_net.is_current()):
+      numpy_net = make_numpy_net(net)
+      self.numpy_nets[id(net)] = (net, numpy_net)
+    return numpy_net
+
+  def get_eval_nets(self):
+    # Return the networks used to select Test actions
+    raise NotImplementedError
+
+  def set_eval_nets(self, nets):
+    raise NotImplementedError
+
+  def get_test_pool(self):
+    '''
+    Return the pool of test_workers processes, forked from the agent when it is first used.
+    Workers act with CPU copies of the networks, made before forking.
+    '''
+    if self.test_pool is None:
+      self.test_nets = [copy.deepcopy(net).cpu() for net in self.get_eval_nets()]
+      self.test_pool = ProcessPoolExecutor(self.test_workers, mp_context=mp.get_context('fork'), initializer=init_test_worker, initargs=(self,))
+    return self.test_pool
+
+  def submit_test(self):
+    '''
+    Evaluate a snapshot of the networks, normalizer statistics and step count with test_episodes Test episodes in the Test workers.
+    Training continues; results are saved by save_test_results with the step at which the snapshot was taken.
+    '''
+    test_pool = self.get_test_pool()
+    snapshot = {
+      'nets': [{k: v.detach().cpu().clone() for k, v in net.state_dict().items()} for net in self.get_eval_nets()],
+      'normalizers': {key: copy.deepcopy(getattr(self, key).state_dict()) for key in normalizer_keys if hasattr(self, key)},
+      'step_count': self.step_count
+    }
+    futures = []
+    for _ in range(self.test_episodes):
+      futures.append(test_pool.submit(run_test_worker, snapshot, self.cfg['seed'] + self.test_count))
+      self.test_count += 1
+    self.test_jobs.append((self.step_count, self.episode_count, futures))
+
+  def save_test_results(self, wait=False):
+    # Save results of finished Test jobs in the order they were submitted
+    while len(self.test_jobs) > 0:
+      step_count, episode_count, futures = self.test_jobs[0]
+      if not wait and not all(future.done() for future in futures):
+        break
+      self.test_jobs.pop(0)
+      # Attribute the results to the step of the snapshot
+      current_step_count, current_episode_count = self.step_count, self.episode_count
+      self.step_count, self.episode_count = step_count, episode_count
+      for future in futures:
+        self.save_episode_result('Test', future.result())
+      self.step_count, self.episode_count = current_step_count, current_episode_count
+
+  def close_test_pool(self):
+    # Wait for all Test jobs, save their results and stop the Test workers
+    self.save_test_results(wait=True)
+    if self.test_pool is not None:
+      self.test_pool.shutdown()
+      self.test_pool = None
+
+  def state_dict(self):
+    '''
+    Return the training state of the agent: the state_dicts of networks, optimizers, replay buffer, normalizers
+    (and of lists or dicts of them), counters and results, and the states of the random number generators
+    '''
+    state_dict = {'modules': {}, 'counters': {}}
+    for key, value in vars(self).items():
+      if key in self.checkpoint_exclude:
+        continue
+      if has_state(value):
+        state_dict['modules'][key] = value.state_dict()
+      elif isinstance(value, list) and len(value) > 0 and all(has_state(x) for x in value):
+        state_dict['modules'][key] = [x.state_dict() for x in value]
+      elif isinstance(value, dict) and len(value) > 0 and all(has_state(x) for x in value.values()):
+        state_dict['modules'][key] = {k: x.state_dict() for k, x in value.items()}
+    for key in self.checkpoint_keys:
+      if hasattr(self, key):
+        state_dict['counters'][key] = getattr(self, key)
+    state_dict['rng'] = get_rng_state()
+    state_dict['env_rng'] = {}
+    for mode, env in self.env.items():
+      try:
+        state_dict['env_rng'][mode] = (get_np_random_state(env.unwrapped.np_random), get_np_random_state(env.action_space.np_random))
+      except AttributeError:
+        # e.g. vectorized environments
+        pass
+    state_dict['time_elapsed'] = time.time() - self.start_time
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    for key, value in state_dict['modules'].items():
+      if isinstance(value, list):
+        for x, x_state_dict in zip(getattr(self, key), value):
+          x.load_state_dict(x_state_dict)
+      elif isinstance(value, dict) and not has_state(getattr(self, key)):
+        for k, x_state_dict in value.items():
+          getattr(self, key)[k].load_state_dict(x_state_dict)
+      else:
+        getattr(self, key).load_state_dict(value)
+    for key, value in state_dict['counters'].items():
+      setattr(self, key, value)
+    set_rng_state(state_dict['rng'])
+    for mode, (env_state, action_space_state) in state_dict['env_rng'].items():
+      set_np_random_state(self.env[mode].unwrapped.np_random, env_state)
+      set_np_random_state(self.env[mode].action_space.np_random, action_space_state)
+
+  def save_checkpoint(self):
+    '''
+    Save the training state to checkpoint_path (atomically, see atomic_save).
+    Checkpoints are saved between episodes (or epochs), after the results of all Test jobs are saved.
+    Environments are not saved: a resumed run starts new episodes.
+    '''
+    start_time = time.time()
+    self.save_test_results(wait=True)
+    atomic_save(self.state_dict(), self.checkpoint_path)
+    self.checkpoint_step = self.step_count
+    self.logger.info(f'<{self.config_idx}> Checkpoint at step {self.step_count} saved in {time.time()-start_time:.2f} seconds')
+
+  def update_status(self):
+    # Record the progress in the run status (written at most every status_interval seconds)
+    if self.status is not None:
+      self.status.update(self.step_count, time.time()-self.start_time)
+
+  def check_checkpoint(self):
+    '''
+    Called at every iteration of the training loop: update the run status, then save a checkpoint if checkpoint_steps steps
+    passed since the last one, or if one is requested (e.g. by a signal before the time limit of a job). Return True if the run should stop: after a requested checkpoint.
+    '''
+    self.update_status()
+    if self.checkpoint_requested:
+      self.save_checkpoint()
+      self.stopped = True
+      return True
+    if self.checkpoint_steps > 0 and self.step_count - self.checkpoint_step >= self.checkpoint_steps:
+      self.save_checkpoint()
+    return False
+
+  def resume_from_checkpoint(self):
+    # Load the training state from checkpoint_path when resuming; called by run_steps after setting counters and start_time
+    if not self.resume:
+      return
+    state_dict = load_checkpoint(self.checkpoint_path, self.device)
+    self.load_state_dict(state_dict)
+    self.checkpoint_step = self.step_count
+    self.resumed_time = state_dict['time_elapsed']
+    self.start_time -= self.resumed_time
+    self.logger.info(f'<{self.config_idx}> Resume from the checkpoint at step {self.step_count}')
+
+  def remove_checkpoint(self):
+    if os.path.exists(self.checkpoint_path):
+      os.remove(self.checkpoint_path)
@@ -1,5 +1,4 @@
 from agents.DQN import *
-from collections import Counter
 
 
 class BootstrappedDQN(DQN):
@@ -15,7 +14,7 @@ class BootstrappedDQN(DQN):
     if input_type == 'pixel':
       layer_dims = [self.cfg['feature_dim']] + self.cfg['hidden_layers'] + [self.action_size]
       if 'MinAtar' in self.env_name:
-        feature_net = Conv2d_MinAtar(in_channels=self.env['Train'].game.state_shape()[2], feature_dim=layer_dims[0])
+        feature_net = Conv2d_MinAtar(in_channels=self.env['Train'].observation_space.shape[0], feature_dim=layer_dims[0])
       else:
         feature_net = Conv2d_Atari(in_channels=4, feature_dim=layer_dims[0])
     elif input_type == 'feature':
@@ -23,39 +22,43 @@ class BootstrappedDQN(DQN):
       feature_net = nn.Identity()
     # Set value network
     assert self.action_type == 'DISCRETE', f'{self.agent_name} only supports discrete action spaces.'    
-    heads_net = nn.ModuleList([
-      MLPCritic(layer_dims=layer_dims, hidden_act=self.cfg['hidden_act'], output_act=self.cfg['output_act'], last_w_scale=1.0)
-      for _ in range(self.k)
-    ])
+    heads_net = MultiHeadMLPCritic(self.k, layer_dims=layer_dims, hidden_act=self.cfg['hidden_act'], output_act=self.cfg['output_act'], last_w_scale=1.0)
     NN = BootstrappedDQNNet(feature_net, heads_net)
     return NN
 
   def get_action(self, mode='Train'):
     '''
     Uses the local Q network to pick an action
-    PyTorch only accepts mini-batches and not single observations so we have to use unsqueeze to add
+    Networks only accept mini-batches and not single observations so we have to use expand_dims to add
     a "fake" dimension to make it a mini-batch rather than a single observation
     '''
-    state = to_tensor(self.state[mode], device=self.device)
-    state = state.unsqueeze(0) # Add a batch dimension (Batch, Channel, Height, Width)
+    state = np.expand_dims(self.state[mode], 0) # Add a batch dimension (Batch, Channel, Height, Width)
     if mode == 'Test':
-      q_values_all = self.Q_net[0](state)
-      actions = [np.argmax(to_numpy(q_values).flatten()) for q_values in q_values_all]
-      action, _ = Counter(actions).most_common()[0]
+      # Majority vote of all heads; ties go to the action first chosen by a head, the same as Counter.most_common
+      actions = self.Q_net[0](to_tensor(state, device=self.device))[:, 0].argmax(1)
+      counts = torch.bincount(actions, minlength=self.action_size)[actions]
+      action = actions[torch.argmax((counts == counts.max()).int())].item()
     elif mode == 'Train':
       q_values = self.get_action_selection_q_values(state)
       action = np.argmax(q_values)
     return action
 
+  def get_vec_action(self):
+    state = self.state['Train']
+    q_values = self.get_action_selection_q_values(state).reshape(self.num_envs, -1)
+    return np.argmax(q_values, axis=1)
+
   def learn(self):
     mode = 'Train'
     batch = self.replay.sample(['state', 'action', 'reward', 'next_state', 'mask'], self.cfg['batch_size'])
     qs, q_targets = self.compute_q(batch), self.compute_q_target(batch)
-    # Compute loss
-    loss = 0
-    for i in range(self.k):
-      loss += self.loss(qs[i], q_targets[i])
-    loss /= self.k
+    # Compute loss: the mean over (k, B) is the average of the loss of each head
+    if self.replay.prioritized:
+      # Weight the loss of all heads with importance sampling weights and update priorities with TD errors averaged over heads
+      loss = (batch.weight * self.element_loss(qs, q_targets)).mean()
+      self.replay.update_priority(batch.idx, (q_targets - qs).abs().mean(0))
+    else:
+      loss = self.loss(qs, q_targets)
     # Take an optimization step
     self.optimizer[0].zero_grad()
     loss.backward()
@@ -66,27 +69,23 @@ class BootstrappedDQN(DQN):
       self.logger.add_scalar(f'Loss', loss.item(), self.step_count)  
   
   def compute_q_target(self, batch):
-    q_targets = []
+    # Q targets of all heads in (k, B)
     with torch.no_grad():
-      q_nexts = self.Q_net_target[0](batch.next_state)
-      for i in range(self.k):
-        q_next = q_nexts[i].max(1)[0]
-        q_target = batch.reward + self.discount * q_next * batch.mask
-        q_targets.append(q_target)
-    return q_targets
+      q_next = self.Q_net_target[0](batch.next_state).max(2)[0]
+      q_target = batch.reward + self.discount * q_next * batch.mask
+    return q_target
     
   def compute_q(self, batch):
     # Convert actions to long so they can be used as indexes
-    action = batch.action.long().unsqueeze(1)
-    q_outputs = self.Q_net[0](batch.state)
-    qs = []
-    for i in range(self.k):
-      q = q_outputs[i].gather(1, action).squeeze()
-      qs.append(q)
-    return qs
+    action = batch.action.long().view(1, -1, 1).expand(self.k, -1, 1)
+    q = self.Q_net[0](batch.state).gather(2, action).squeeze(-1)
+    return q
 
   def get_action_selection_q_values(self, state):
     head_idx = random.randrange(self.k)
-    q_values = self.Q_net[0](state, head_idx)
+    numpy_net = self.get_numpy_net(self.Q_net[0])
+    if numpy_net is not None:
+      return numpy_net(state, head_idx).flatten()
+    q_values = self.Q_net[0](to_tensor(state, device=self.device), head_idx)
     q_values = to_numpy(q_values).flatten()
     return q_values
\ No newline at end of file
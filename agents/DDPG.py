@@ -35,13 +35,33 @@ class DDPG(SAC):
     if self.step_count <= self.cfg['exploration_steps']:
       prediction = {'action': torch.as_tensor(self.env[mode].action_space.sample())}
     else:
-      state = to_tensor(self.state[mode], self.device)
-      prediction = self.network(state)
+      numpy_net = self.get_numpy_net(self.network)
+      if numpy_net is not None:
+        prediction = numpy_net(self.state[mode])
+      else:
+        prediction = self.network(to_tensor(self.state[mode], self.device))
     # Add noise
     if mode == 'Train': 
       prediction['action'] += self.cfg['action_noise'] * torch.randn(self.action_size)
     return prediction
 
+  def get_vec_action(self):
+    '''
+    Pick actions for all Train environments with one batched forward pass
+    '''
+    mode = 'Train'
+    if self.step_count <= self.cfg['exploration_steps']:
+      action = torch.as_tensor(np.stack([self.env[mode].action_space.sample() for _ in range(self.num_envs)]))
+    else:
+      numpy_net = self.get_numpy_net(self.network)
+      if numpy_net is not None:
+        action = numpy_net(self.state[mode])['action']
+      else:
+        action = self.network(to_tensor(self.state[mode], self.device))['action']
+    # Add noise
+    action = action + self.cfg['action_noise'] * torch.randn_like(action)
+    return to_numpy(action)
+
   def compute_actor_loss(self, batch):
     q = self.network(batch.state)['q']
     actor_loss = - q.mean()
@@ -8,6 +8,17 @@ class DDQN(DQN):
   def __init__(self, cfg):
     super().__init__(cfg)
 
+  def compute_q_and_target(self, batch):
+    # Q_net selects the best next actions, so it is evaluated on state and next_state in one forward pass
+    action = batch.action.long().unsqueeze(1)
+    q_all, q_next_all = shared_forward(self.Q_net[0], [batch.state, batch.next_state])
+    q = q_all.gather(1, action).squeeze()
+    with torch.no_grad():
+      best_actions = q_next_all.argmax(1).unsqueeze(1)
+      q_next = self.Q_net_target[0](batch.next_state).gather(1, best_actions).squeeze()
+      q_target = batch.reward + self.discount * q_next * batch.mask
+    return q, q_target
+
   def compute_q_target(self, batch):
     with torch.no_grad():
       best_actions = self.Q_net[0](batch.next_state).argmax(1).unsqueeze(1)
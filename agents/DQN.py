@@ -9,14 +9,20 @@ class DQN(VanillaDQN):
     super().__init__(cfg)
     # Create target Q value network
     self.Q_net_target = [None]
-    self.Q_net_target[0] = self.createNN(cfg['env']['input_type']).to(self.device)
+    self.Q_net_target[0] = flatten_parameters(self.createNN(cfg['env']['input_type']).to(self.device))
+    # Keep the parameters of Q_net in one flat tensor so that a target network sync is one copy_
+    flatten_parameters(self.Q_net[0])
     # Load target Q value network
-    self.Q_net_target[0].load_state_dict(self.Q_net[0].state_dict())
+    hard_update(self.Q_net_target[0], self.Q_net[0])
     self.Q_net_target[0].eval()
 
   def update_target_net(self):
     if self.step_count % self.cfg['target_network_update_steps'] == 0:
-      self.Q_net_target[self.update_Q_net_index].load_state_dict(self.Q_net[self.update_Q_net_index].state_dict())
+      hard_update(self.Q_net_target[self.update_Q_net_index], self.Q_net[self.update_Q_net_index])
+
+  def compute_q_and_target(self, batch):
+    # q_target is computed with Q_net_target, so Q_net is evaluated separately
+    return self.compute_q(batch), self.compute_q_target(batch)
 
   def compute_q_target(self, batch):
     with torch.no_grad():
@@ -13,18 +13,12 @@ class EnsembleDQN(MaxminDQN):
 
   def compute_q_target(self, batch):
     with torch.no_grad():
-      q_ensemble = self.Q_net_target[0](batch.next_state).clone()
-      for i in range(1, self.k):
-        q = self.Q_net_target[i](batch.next_state)
-        q_ensemble = q_ensemble + q
+      q_ensemble = self.Q_net_target_ensemble(batch.next_state, self.Q_net_target).sum(0)
       q_next = q_ensemble.max(1)[0] / self.k
       q_target = batch.reward + self.discount * q_next * batch.mask
     return q_target
   
   def get_action_selection_q_values(self, state):
-    q_ensemble = self.Q_net[0](state)
-    for i in range(1, self.k):
-      q = self.Q_net[i](state)
-      q_ensemble = q_ensemble + q
+    q_ensemble = self.Q_net_ensemble(to_tensor(state, device=self.device), self.Q_net).sum(0)
     q_ensemble = to_numpy(q_ensemble / self.k).flatten()
     return q_ensemble
\ No newline at end of file
@@ -12,16 +12,20 @@ class MaxminDQN(VanillaDQN):
     super().__init__(cfg)
     self.k = cfg['agent']['target_networks_num'] # number of target networks
     # Create k different: Q value network, Target Q value network and Optimizer
+    # Parameters are kept in flat tensors so that a target network sync is one copy_
     self.Q_net = [None] * self.k
     self.Q_net_target = [None] * self.k
     self.optimizer = [None] * self.k
     for i in range(self.k):
-      self.Q_net[i] = self.createNN(cfg['env']['input_type']).to(self.device)
-      self.Q_net_target[i] = self.createNN(cfg['env']['input_type']).to(self.device)
+      self.Q_net[i] = flatten_parameters(self.createNN(cfg['env']['input_type']).to(self.device))
+      self.Q_net_target[i] = flatten_parameters(self.createNN(cfg['env']['input_type']).to(self.device))
       self.optimizer[i] = getattr(torch.optim, cfg['optimizer']['name'])(self.Q_net[i].parameters(), **cfg['optimizer']['kwargs'])
       # Load target Q value network
-      self.Q_net_target[i].load_state_dict(self.Q_net[i].state_dict())
+      hard_update(self.Q_net_target[i], self.Q_net[i])
       self.Q_net_target[i].eval()
+    # Evaluate all Q_nets (or all target Q_nets) in one batched pass
+    self.Q_net_ensemble = EnsembleDQNNet()
+    self.Q_net_target_ensemble = EnsembleDQNNet()
 
   def learn(self):
     # Choose a Q_net to udpate
@@ -31,22 +35,20 @@ class MaxminDQN(VanillaDQN):
   def update_target_net(self):
     if self.step_count % self.cfg['target_network_update_steps'] == 0:
       for i in range(self.k):
-        self.Q_net_target[i].load_state_dict(self.Q_net[i].state_dict())
+        hard_update(self.Q_net_target[i], self.Q_net[i])
+
+  def compute_q_and_target(self, batch):
+    # q_target is computed with the target Q_nets, so Q_net is evaluated separately
+    return self.compute_q(batch), self.compute_q_target(batch)
 
   def compute_q_target(self, batch):
     with torch.no_grad():
-      q_min = self.Q_net_target[0](batch.next_state).clone()
-      for i in range(1, self.k):
-        q = self.Q_net_target[i](batch.next_state)
-        q_min = torch.min(q_min, q)
+      q_min = self.Q_net_target_ensemble(batch.next_state, self.Q_net_target).min(0)[0]
       q_next = q_min.max(1)[0]
       q_target = batch.reward + self.discount * q_next * batch.mask
     return q_target
   
   def get_action_selection_q_values(self, state):
-    q_min = self.Q_net[0](state)
-    for i in range(1, self.k):
-      q = self.Q_net[i](state)
-      q_min = torch.min(q_min, q)
+    q_min = self.Q_net_ensemble(to_tensor(state, device=self.device), self.Q_net).min(0)[0]
     q_min = to_numpy(q_min).flatten()
     return q_min
\ No newline at end of file
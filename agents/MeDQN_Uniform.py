@@ -10,7 +10,9 @@ class MeDQN_Uniform(DQN):
     if 'consod_batch_size' not in cfg['agent'].keys():
       cfg['agent']['consod_batch_size'] = cfg['batch_size']
     super().__init__(cfg)
-    self.replay = getattr(components.replay, cfg['memory_type'])(cfg['memory_size'], keys=['state', 'action', 'next_state', 'reward', 'mask'])
+    self.replay = getattr(components.replay, cfg['memory_type'])(cfg['memory_size'], keys=['state', 'action', 'next_state', 'reward', 'mask'], **cfg['memory_kwargs'])
+    if self.replay.prioritized:
+      raise ValueError(f"{self.agent_name} learns from all transitions in its buffer, so {cfg['memory_type']} can not prioritize them: use a uniform replay.")
     # Set uniform state sampler for knowledge consolidation
     if 'MinAtar' in self.env_name:
       self.state_sampler = DiscreteUniformSampler(
@@ -36,17 +38,29 @@ class MeDQN_Uniform(DQN):
     super().save_experience()
     self.state_sampler.update_bound(self.original_state)
 
+  def save_vec_experience(self):
+    super().save_vec_experience()
+    self.state_sampler.update_bound(self.original_state.min(axis=0))
+    self.state_sampler.update_bound(self.original_state.max(axis=0))
+
   def learn(self):
     mode = 'Train'
     batch = self.replay.get(['state', 'action', 'reward', 'next_state', 'mask'], self.cfg['memory_size'])
-    q_target = self.compute_q_target(batch)
     lamda = self.consolidate.get_epsilon(self.step_count) # Compute consolidation regularization parameter
-    for _ in range(self.cfg['agent']['consod_epoch']):
-      q = self.compute_q(batch)
-      sample_state = self.state_sampler.sample(self.cfg['agent']['consod_batch_size'])
+    # Sample states for all consolidation epochs, in the same order as sampling them epoch by epoch
+    sample_states = [self.state_sampler.sample(self.cfg['agent']['consod_batch_size']) for _ in range(self.cfg['agent']['consod_epoch'])]
+    # Q_net_target is fixed during learning: evaluate it on next_state and all sampled states in one forward pass
+    with torch.no_grad():
+      q_next_all, *q_sample_targets = shared_forward(self.Q_net_target[0], [batch.next_state] + sample_states)
+      q_target = batch.reward + self.discount * q_next_all.max(1)[0] * batch.mask
+    action = batch.action.long().unsqueeze(1)
+    for sample_state, q_sample_target in zip(sample_states, q_sample_targets):
+      # Evaluate Q_net on state and sampled states in one forward pass
+      q_all, q_sample = shared_forward(self.Q_net[0], [batch.state, sample_state])
+      q = q_all.gather(1, action).squeeze()
       # Compute loss
       loss = self.loss(q, q_target)
-      loss += lamda * self.consolidation_loss(sample_state)
+      loss += lamda * self.consolidation_loss(q_sample, q_sample_target)
       # Take an optimization step
       self.optimizer[0].zero_grad()
       loss.backward()
@@ -56,8 +70,6 @@ class MeDQN_Uniform(DQN):
     if self.show_tb:
       self.logger.add_scalar(f'Loss', loss.item(), self.step_count)
 
-  def consolidation_loss(self, state):
-    q_values = self.Q_net[0](state).squeeze()
-    q_target_values = self.Q_net_target[0](state).squeeze().detach()
-    loss = nn.MSELoss(reduction='mean')(q_values, q_target_values)
+  def consolidation_loss(self, q_values, q_target_values):
+    loss = nn.MSELoss(reduction='mean')(q_values.squeeze(), q_target_values.squeeze())
     return loss
\ No newline at end of file
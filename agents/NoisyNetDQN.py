@@ -14,7 +14,7 @@ class NoisyNetDQN(DQN):
     if input_type == 'pixel':
       layer_dims = [self.cfg['feature_dim']] + self.cfg['hidden_layers'] + [self.action_size]
       if 'MinAtar' in self.env_name:
-        feature_net = Conv2d_MinAtar(in_channels=self.env['Train'].game.state_shape()[2], feature_dim=layer_dims[0])
+        feature_net = Conv2d_MinAtar(in_channels=self.env['Train'].observation_space.shape[0], feature_dim=layer_dims[0])
       else:
         feature_net = Conv2d_Atari(in_channels=4, feature_dim=layer_dims[0])
     elif input_type == 'feature':
@@ -29,17 +29,22 @@ class NoisyNetDQN(DQN):
   def get_action(self, mode='Train'):
     '''
     Uses the local Q network to pick an action
-    PyTorch only accepts mini-batches and not single observations so we have to use unsqueeze to add
+    Networks only accept mini-batches and not single observations so we have to use expand_dims to add
     a "fake" dimension to make it a mini-batch rather than a single observation
     '''
-    state = to_tensor(self.state[mode], device=self.device)
-    state = state.unsqueeze(0) # Add a batch dimension (Batch, Channel, Height, Width)
+    state = np.expand_dims(self.state[mode], 0) # Add a batch dimension (Batch, Channel, Height, Width)
     if mode == 'Train':
       self.Q_net[0].value_net.reset_noise()
     q_values = self.get_action_selection_q_values(state)
     action = np.argmax(q_values)
     return action
 
+  def get_vec_action(self):
+    state = self.state['Train']
+    self.Q_net[0].value_net.reset_noise()
+    q_values = self.get_action_selection_q_values(state).reshape(self.num_envs, -1)
+    return np.argmax(q_values, axis=1)
+
   def compute_q_target(self, batch):
     self.Q_net_target[0].value_net.reset_noise()
     return super().compute_q_target(batch)
@@ -15,12 +15,17 @@ class REINFORCE(BaseAgent):
     self.cfg = cfg
     self.env_name = cfg['env']['name']
     self.agent_name = cfg['agent']['name']
+    self.num_envs = cfg['num_envs']
     self.env = {
-      'Train': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps'])),
-      'Test': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps']))
+      'Train': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps']), fused_preprocessing=cfg['env']['fused_preprocessing']) if self.num_envs == 1 else make_vec_env(cfg['env']['name'], int(cfg['env']['max_episode_steps']), self.num_envs, cfg['vec_env_type'], cfg['env']['fused_preprocessing']),
+      'Test': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps']), fused_preprocessing=cfg['env']['fused_preprocessing'])
     }
     if cfg['env']['name'] in ['NChain-v1', 'LockBernoulli-v0', 'LockGaussian-v0'] and 'cfg' in cfg['env'].keys():
-      self.env['Train'].init(**cfg['env']['cfg'])
+      if self.num_envs > 1:
+        # Configure every Train environment of the vector environment
+        self.env['Train'].call('init', **cfg['env']['cfg'])
+      else:
+        self.env['Train'].init(**cfg['env']['cfg'])
       self.env['Test'].init(**cfg['env']['cfg'])
     self.config_idx = cfg['config_idx']
     self.device = cfg['device']
@@ -55,7 +60,7 @@ class REINFORCE(BaseAgent):
       'actor': getattr(torch.optim, cfg['optimizer']['name'])(self.network.actor_params, **cfg['optimizer']['actor_kwargs'])
     }
     # Set replay buffer
-    self.replay = InfiniteReplay(keys=['reward', 'mask', 'log_pi', 'ret'])
+    self.replay = InfiniteReplay(keys=['reward', 'mask', 'log_pi'])
     # Set log dict
     for key in ['state', 'next_state', 'action', 'reward', 'done', 'episode_return', 'episode_step_count']:
       setattr(self, key, {'Train': None, 'Test': None})
@@ -91,6 +96,7 @@ class REINFORCE(BaseAgent):
     self.episode_step_count[mode] = 0
 
   def run_steps(self, render=False):
+    assert self.num_envs == 1, f'{self.agent_name} does not support num_envs > 1.'
     # Run for multiple episodes
     self.step_count = 0
     self.episode_count = 0
@@ -98,17 +104,25 @@ class REINFORCE(BaseAgent):
     self.episode_return_list = {'Train': [], 'Test': []}
     mode = 'Train'
     self.start_time = time.time()
+    self.resume_from_checkpoint()
     self.reset_game('Train')
     self.reset_game('Test')
     while self.step_count < self.train_steps:
+      if self.check_checkpoint():
+        break
       if mode == 'Train' and self.cfg['test_per_episodes'] > 0 and self.episode_count % self.cfg['test_per_episodes'] == 0:
         mode = 'Test'
       else:
         mode = 'Train'
+      if mode == 'Test' and self.test_workers > 0:
+        # Evaluate in the Test workers and continue training
+        self.submit_test()
+        continue
       # Set network back to training/evaluation mode
       self.set_net_mode(mode)
       # Run for one episode
       self.run_episode(mode, render)
+      self.save_test_results()
 
   def run_episode(self, mode, render):
     while not self.done[mode]:
@@ -144,18 +158,20 @@ class REINFORCE(BaseAgent):
     # Reset environment
     self.reset_game(mode)
 
-  def save_episode_result(self, mode):
-    self.episode_return_list[mode].append(self.episode_return[mode])
+  def save_episode_result(self, mode, episode_return=None):
+    if episode_return is None:
+      episode_return = self.episode_return[mode]
+    self.episode_return_list[mode].append(episode_return)
     rolling_score = np.mean(self.episode_return_list[mode][-1 * self.rolling_score_window[mode]:])
     result_dict = {'Env': self.env_name,
                    'Agent': self.agent_name,
                    'Episode': self.episode_count, 
                    'Step': self.step_count, 
-                   'Return': self.episode_return[mode],
+                   'Return': episode_return,
                    'Average Return': rolling_score}
     self.result[mode].append(result_dict)
     if self.show_tb:
-      self.logger.add_scalar(f'{mode}_Return', self.episode_return[mode], self.step_count)
+      self.logger.add_scalar(f'{mode}_Return', episode_return, self.step_count)
       self.logger.add_scalar(f'{mode}_Average_Return', rolling_score, self.step_count)
     if mode == 'Test' or self.episode_count % self.display_interval == 0 or self.step_count >= self.train_steps:
       # Save result to files
@@ -166,17 +182,24 @@ class REINFORCE(BaseAgent):
       # Show log
       speed = self.step_count / (time.time() - self.start_time)
       eta = (self.train_steps - self.step_count) / speed / 60 if speed>0 else -1
-      self.logger.info(f'<{self.config_idx}> [{mode}] Episode {self.episode_count}, Step {self.step_count}: Average Return({self.rolling_score_window[mode]})={rolling_score:.2f}, Return={self.episode_return[mode]:.2f}, Speed={speed:.2f} (steps/s), ETA={eta:.2f} (mins)')
+      self.logger.info(f'<{self.config_idx}> [{mode}] Episode {self.episode_count}, Step {self.step_count}: Average Return({self.rolling_score_window[mode]})={rolling_score:.2f}, Return={episode_return:.2f}, Speed={speed:.2f} (steps/s), ETA={eta:.2f} (mins)')
 
   def get_action(self, mode='Train'):
     '''
     Pick an action from policy network
     '''
-    state = to_tensor(self.state[mode], self.device)
     deterministic = True if mode == 'Test' else False
+    numpy_net = self.get_acting_numpy_net(mode)
+    if numpy_net is not None:
+      return numpy_net(self.state[mode], deterministic=deterministic)
+    state = to_tensor(self.state[mode], self.device)
     prediction = self.network(state, deterministic=deterministic)
     return prediction
 
+  def get_acting_numpy_net(self, mode):
+    # REINFORCE learns with the log_pi of Train actions, which needs the autograd graph of the network
+    return self.get_numpy_net(self.network) if mode == 'Test' else None
+
   def save_experience(self, prediction):
     # Save reward, mask, log_pi
     mode = 'Train'
@@ -189,16 +212,12 @@ class REINFORCE(BaseAgent):
 
   def learn(self):
     mode = 'Train'
-    # Compute return
-    self.replay.placeholder(self.episode_step_count[mode])
-    ret = torch.tensor(0.0)
-    for i in reversed(range(self.episode_step_count[mode])):
-      ret = self.replay.reward[i] + self.discount * self.replay.mask[i] * ret
-      self.replay.ret[i] = ret.detach()
     # Get training data
-    entries = self.replay.get(['log_pi', 'ret'], self.episode_step_count[mode])
+    entries = self.replay.get(['log_pi', 'reward', 'mask'], self.episode_step_count[mode])
+    # Compute return
+    ret = compute_returns(entries.reward, entries.mask, 0.0, self.discount).detach()
     # Compute loss
-    actor_loss = -(entries.log_pi * entries.ret).mean()
+    actor_loss = -(entries.log_pi * ret).mean()
     # Take an optimization step for actor
     self.optimizer['actor'].zero_grad()
     actor_loss.backward()
@@ -238,6 +257,12 @@ class REINFORCE(BaseAgent):
       else:
         return self.env[mode].observation_space.n
 
+  def get_eval_nets(self):
+    return [self.network]
+
+  def set_eval_nets(self, nets):
+    self.network = nets[0]
+
   def set_net_mode(self, mode):
     if mode == 'Test':
       self.network.eval() # Set network to evaluation mode
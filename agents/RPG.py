@@ -10,8 +10,6 @@ class RPG(PPO):
     super().__init__(cfg)
     # Set optimizer for reward function
     self.optimizer['reward'] = getattr(torch.optim, cfg['optimizer']['name'])(self.network.reward_params, **cfg['optimizer']['reward_kwargs'])
-    # Set replay buffer
-    self.replay = FiniteReplay(self.cfg['steps_per_epoch']+1, keys=['state', 'action', 'reward', 'mask', 'v', 'log_pi', 'ret', 'adv', 'ppo_adv'])
     # Set state normalizer
     self.state_normalizer = MeanStdNormalizer()
 
@@ -40,45 +38,34 @@ class RPG(PPO):
   def learn(self):
     mode = 'Train'
     # Compute return and advantage
-    adv = torch.tensor(0.0)
-    ret = self.replay.v[-1].detach()
-    self.replay.adv[-2] = ret
-    for i in reversed(range(self.cfg['steps_per_epoch'])):
-      ret = self.replay.reward[i] + self.discount * self.replay.mask[i] * ret
-      self.replay.ret[i] = ret.detach()
-      if self.cfg['gae'] < 0:
-        adv = ret - self.replay.v[i].detach()
-      else:
-        td_error = self.replay.reward[i] + self.discount * self.replay.mask[i] * self.replay.v[i+1] - self.replay.v[i]
-        adv = self.discount * self.cfg['gae'] * self.replay.mask[i] * adv + td_error
-      self.replay.ppo_adv[i] = adv.detach()
-      if i >= 1: # use lambda return as the advantage
-        self.replay.adv[i-1] = (adv + self.replay.v[i]).detach()
+    ret, ppo_adv = self.compute_return_and_advantage()
     # Get training data and detach
-    entries = self.replay.get(['log_pi', 'ret', 'adv', 'state', 'action', 'reward', 'v', 'mask', 'ppo_adv'], self.cfg['steps_per_epoch'], detach=True)
+    data = self.replay.get(['log_pi', 'state', 'action', 'reward'], self.cfg['steps_per_epoch'], detach=True)._asdict()
+    v = self.replay.get(['v'], self.cfg['steps_per_epoch']+1, detach=True).v
+    # Use the lambda return of the next state as the advantage
+    adv = torch.cat([(ppo_adv + v[:-1])[1:], v[-1:]])
     # Compute advantage
-    entries.ppo_adv.copy_((entries.ppo_adv - entries.ppo_adv.mean()) / entries.ppo_adv.std())
-    entries.adv.copy_(self.discount * entries.adv - entries.v)
+    data['ret'] = ret
+    data['ppo_adv'] = (ppo_adv - ppo_adv.mean()) / ppo_adv.std()
+    data['adv'] = self.discount * adv - v[:-1]
     # Optimize for multiple epochs
     for _ in range(self.cfg['optimize_epochs']):
-      batch_idxs = generate_batch_idxs(len(entries.log_pi), self.cfg['batch_size'])
-      for batch_idx in batch_idxs:
-        batch_idx = to_tensor(batch_idx, self.device).long()
-        prediction = self.network(entries.state[batch_idx], entries.action[batch_idx])
+      for batch in self.replay.minibatches(data, self.cfg['batch_size']):
+        prediction = self.network(batch.state, batch.action)
         # Take an optimization step for actor
-        approx_kl = (entries.log_pi[batch_idx] - prediction['log_pi']).mean()
+        approx_kl = (batch.log_pi - prediction['log_pi']).mean()
         if approx_kl <= 1.5 * self.cfg['target_kl']:
           # Freeze reward network to avoid computing gradients for it
           for p in self.network.reward_net.parameters():
             p.requires_grad = False
           # Get predicted reward
-          repara_action = self.network.get_repara_action(entries.state[batch_idx], entries.action[batch_idx])
-          predicted_reward = self.network.get_reward(entries.state[batch_idx], repara_action)
+          repara_action = self.network.get_repara_action(batch.state, batch.action)
+          predicted_reward = self.network.get_reward(batch.state, repara_action)
           # Compute clipped objective
-          ratio = torch.exp(prediction['log_pi'] - entries.log_pi[batch_idx]).detach()
-          obj = predicted_reward + entries.adv[batch_idx] * prediction['log_pi']
-          mask = (entries.ppo_adv[batch_idx]>0) & (ratio > 1+self.cfg['clip_ratio'])
-          mask = mask | ((entries.ppo_adv[batch_idx]<0) & (ratio < 1-self.cfg['clip_ratio']))
+          ratio = torch.exp(prediction['log_pi'] - batch.log_pi).detach()
+          obj = predicted_reward + batch.adv * prediction['log_pi']
+          mask = (batch.ppo_adv>0) & (ratio > 1+self.cfg['clip_ratio'])
+          mask = mask | ((batch.ppo_adv<0) & (ratio < 1-self.cfg['clip_ratio']))
           ratio[mask] = 0.0
           actor_loss = -(ratio*obj).mean()
           self.optimizer['actor'].zero_grad()
@@ -90,15 +77,15 @@ class RPG(PPO):
           for p in self.network.reward_net.parameters():
             p.requires_grad = True
         # Take an optimization step for critic
-        critic_loss = (entries.ret[batch_idx] - prediction['v']).pow(2).mean()
+        critic_loss = (batch.ret - prediction['v']).pow(2).mean()
         self.optimizer['critic'].zero_grad()
         critic_loss.backward()
         if self.gradient_clip > 0:
           nn.utils.clip_grad_norm_(self.network.critic_params, self.gradient_clip)
         self.optimizer['critic'].step()
         # Take an optimization step for reward
-        predicted_reward = self.network.get_reward(entries.state[batch_idx], entries.action[batch_idx])
-        reward_loss = (predicted_reward - entries.reward[batch_idx]).pow(2).mean()
+        predicted_reward = self.network.get_reward(batch.state, batch.action)
+        reward_loss = (predicted_reward - batch.reward).pow(2).mean()
         self.optimizer['reward'].zero_grad()
         reward_loss.backward()
         if self.gradient_clip > 0:
@@ -1,4 +1,5 @@
 from agents.REINFORCE import *
+import components.replay
 
 
 class SAC(REINFORCE):
@@ -8,8 +9,10 @@ class SAC(REINFORCE):
   def __init__(self, cfg):
     super().__init__(cfg)
     # Create target policy network
-    self.network_target = self.createNN(cfg['env']['input_type']).to(self.device)
-    self.network_target.load_state_dict(self.network.state_dict())
+    self.network_target = flatten_parameters(self.createNN(cfg['env']['input_type']).to(self.device))
+    # Keep the parameters of the network in one flat tensor so that polyak averaging is one lerp_
+    flatten_parameters(self.network)
+    hard_update(self.network_target, self.network)
     # Freeze target policy network (only updated via polyak averaging)
     for p in self.network_target.parameters():
       p.requires_grad = False
@@ -20,7 +23,7 @@ class SAC(REINFORCE):
       'critic':  getattr(torch.optim, cfg['optimizer']['name'])(self.network.critic_params, **cfg['optimizer']['critic_kwargs'])
     }
     # Set replay buffer
-    self.replay = FiniteReplay(cfg['memory_size'], keys=['state', 'action', 'next_state', 'reward', 'mask'])
+    self.replay = getattr(components.replay, cfg['memory_type'])(cfg['memory_size'], keys=['state', 'action', 'next_state', 'reward', 'mask'], **cfg['memory_kwargs'])
     self.cfg['exploration_steps'] = int(self.cfg['exploration_steps'])
 
   def createNN(self, input_type):
@@ -55,6 +58,24 @@ class SAC(REINFORCE):
     }
     self.replay.add(prediction)
 
+  def save_vec_experience(self):
+    # Save state, action, next_state, reward, mask of all Train environments
+    mode = 'Train'
+    prediction = {
+      'state': to_tensor(self.state[mode], self.device),
+      'action': to_tensor(self.action[mode], self.device),
+      'next_state': to_tensor(self.next_state[mode], self.device),
+      'reward': to_tensor(self.reward[mode], self.device),
+      'mask': to_tensor(1-self.done[mode], self.device)
+    }
+    self.replay.add_batch(prediction)
+
+  def run_steps(self, render=False):
+    if self.num_envs > 1:
+      self.run_vec_steps(render)
+    else:
+      super().run_steps(render)
+
   def run_episode(self, mode, render):
     while not self.done[mode]:
       prediction = self.get_action(mode)
@@ -91,15 +112,34 @@ class SAC(REINFORCE):
     '''
     Pick an action from policy network
     '''
-    state = to_tensor(self.state[mode], self.device)
     if self.step_count <= self.cfg['exploration_steps']:
+      state = to_tensor(self.state[mode], self.device)
       action = to_tensor(self.env[mode].action_space.sample(), self.device)
       prediction = self.network(state, action=action)
     else:
       deterministic = True if mode == 'Test' else False
-      prediction = self.network(state, deterministic=deterministic)
+      numpy_net = self.get_numpy_net(self.network)
+      if numpy_net is not None:
+        prediction = numpy_net(self.state[mode], deterministic=deterministic)
+      else:
+        prediction = self.network(to_tensor(self.state[mode], self.device), deterministic=deterministic)
     return prediction
 
+  def get_vec_action(self):
+    '''
+    Pick actions for all Train environments with one batched forward pass
+    '''
+    mode = 'Train'
+    if self.step_count <= self.cfg['exploration_steps']:
+      action = np.stack([self.env[mode].action_space.sample() for _ in range(self.num_envs)])
+    else:
+      numpy_net = self.get_numpy_net(self.network)
+      if numpy_net is not None:
+        action = to_numpy(numpy_net(self.state[mode])['action'])
+      else:
+        action = to_numpy(self.network(to_tensor(self.state[mode], self.device))['action'])
+    return action
+
   def time_to_learn(self):
     """
     Return boolean to indicate whether it is time to learn:
@@ -171,7 +211,4 @@ class SAC(REINFORCE):
     return q1, q2
 
   def soft_update(self, network, network_target):
-    with torch.no_grad():
-      for p, p_target in zip(self.network.parameters(), self.network_target.parameters()):
-        p_target.data.mul_(self.cfg['polyak'])
-        p_target.data.add_((1-self.cfg['polyak'])*p.data)
\ No newline at end of file
+    soft_update(network_target, network, self.cfg['polyak'])
\ No newline at end of file
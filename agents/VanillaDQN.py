@@ -1,10 +1,12 @@
 from envs.env import *
 from utils.helper import *
 from agents.BaseAgent import *
+from components.ring import *
 from components.replay import *
 from components.network import *
 from components.normalizer import *
 import components.exploration
+import torch.multiprocessing as mp
 
 
 class VanillaDQN(BaseAgent):
@@ -16,12 +18,18 @@ class VanillaDQN(BaseAgent):
     self.cfg = cfg
     self.env_name = cfg['env']['name']
     self.agent_name = cfg['agent']['name']
+    self.num_envs = cfg['num_envs']
+    self.num_actors = cfg['num_actors']
     self.env = {
-      'Train': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps'])),
-      'Test': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps']))
+      'Train': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps']), fused_preprocessing=cfg['env']['fused_preprocessing']) if self.num_envs == 1 else make_vec_env(cfg['env']['name'], int(cfg['env']['max_episode_steps']), self.num_envs, cfg['vec_env_type'], cfg['env']['fused_preprocessing']),
+      'Test': make_env(cfg['env']['name'], max_episode_steps=int(cfg['env']['max_episode_steps']), fused_preprocessing=cfg['env']['fused_preprocessing'])
     }
     if cfg['env']['name'] in ['NChain-v1', 'LockBernoulli-v0', 'LockGaussian-v0'] and 'cfg' in cfg['env'].keys():
-      self.env['Train'].init(**cfg['env']['cfg'])
+      if self.num_envs > 1:
+        # Configure every Train environment of the vector environment
+        self.env['Train'].call('init', **cfg['env']['cfg'])
+      else:
+        self.env['Train'].init(**cfg['env']['cfg'])
       self.env['Test'].init(**cfg['env']['cfg'])
     self.config_idx = cfg['config_idx']
     self.device = cfg['device']
@@ -69,8 +77,11 @@ class VanillaDQN(BaseAgent):
     self.exploration = getattr(components.exploration, cfg['exploration_type'])(cfg['exploration_steps'], epsilon)
     # Set loss function
     self.loss = getattr(torch.nn, cfg['loss'])(reduction='mean')
+    self.element_loss = getattr(torch.nn, cfg['loss'])(reduction='none')
     # Set replay buffer
-    self.replay = getattr(components.replay, cfg['memory_type'])(cfg['memory_size'], keys=['state', 'action', 'next_state', 'reward', 'mask'])
+    self.replay = getattr(components.replay, cfg['memory_type'])(cfg['memory_size'], keys=['state', 'action', 'next_state', 'reward', 'mask'], **cfg['memory_kwargs'])
+    if isinstance(self.replay, FrameStackReplay) and (self.num_envs > 1 or self.num_actors > 0):
+      raise ValueError(f"{cfg['memory_type']} needs the transitions of a single environment in order: set num_envs to 1 and num_actors to 0.")
     # Set log dict
     for key in ['state', 'next_state', 'action', 'reward', 'done', 'episode_return', 'episode_step_count']:
       setattr(self, key, {'Train': None, 'Test': None})
@@ -80,7 +91,7 @@ class VanillaDQN(BaseAgent):
     if input_type == 'pixel':
       layer_dims = [self.cfg['feature_dim']] + self.cfg['hidden_layers'] + [self.action_size]
       if 'MinAtar' in self.env_name:
-        feature_net = Conv2d_MinAtar(in_channels=self.env['Train'].game.state_shape()[2], feature_dim=layer_dims[0])
+        feature_net = Conv2d_MinAtar(in_channels=self.env['Train'].observation_space.shape[0], feature_dim=layer_dims[0])
       else:
         feature_net = Conv2d_Atari(in_channels=4, feature_dim=layer_dims[0])
     elif input_type == 'feature':
@@ -94,8 +105,10 @@ class VanillaDQN(BaseAgent):
 
   def reset_game(self, mode):
     # Reset the game before a new episode
-    self.original_state = self.env[mode].reset() # state before processed
-    self.state[mode] = self.state_normalizer(self.original_state)
+    original_state = self.env[mode].reset() # state before processed
+    if mode == 'Train':
+      self.original_state = original_state
+    self.state[mode] = self.state_normalizer(original_state)
     self.next_state[mode] = None
     self.action[mode] = None
     self.reward[mode] = None
@@ -110,18 +123,33 @@ class VanillaDQN(BaseAgent):
     self.result = {'Train': [], 'Test': []}
     self.episode_return_list = {'Train': [], 'Test': []}
     mode = 'Train'
+    if self.num_envs > 1:
+      assert self.num_actors == 0, 'num_envs > 1 is not supported with actor processes.'
+      self.run_vec_steps(render)
+      return
+    if self.num_actors > 0:
+      self.run_async_steps(render)
+      return
     self.start_time = time.time()
+    self.resume_from_checkpoint()
     self.reset_game('Train')
     self.reset_game('Test')
     while self.step_count < self.train_steps:
+      if self.check_checkpoint():
+        break
       if mode == 'Train' and self.test_per_episodes > 0 and self.episode_count % self.test_per_episodes == 0:
         mode = 'Test'
       else:
         mode = 'Train'
+      if mode == 'Test' and self.test_workers > 0:
+        # Evaluate in the Test workers and continue training
+        self.submit_test()
+        continue
       # Set Q network to training/evaluation mode
       self.set_net_mode(mode)
       # Run for one episode
       self.run_episode(mode, render)
+      self.save_test_results()
 
   def run_episode(self, mode, render):
     while not self.done[mode]:
@@ -130,6 +158,7 @@ class VanillaDQN(BaseAgent):
         self.env[mode].render()
       # Take a step
       next_state, self.reward[mode], self.done[mode], _ = self.env[mode].step(self.action[mode])
+      self.original_next_state = next_state
       self.next_state[mode] = self.state_normalizer(next_state)
       self.reward[mode] = self.reward_normalizer(self.reward[mode])
       self.episode_return[mode] += self.reward[mode]
@@ -143,9 +172,9 @@ class VanillaDQN(BaseAgent):
         # Update target Q network: used only in DQN variants
         self.update_target_net()
         self.step_count += 1
+        self.original_state = next_state
       # Update state
       self.state[mode] = self.next_state[mode]
-      self.original_state = next_state
     # End of one episode
     self.save_episode_result(mode)
     # Reset environment
@@ -153,18 +182,168 @@ class VanillaDQN(BaseAgent):
     if mode == 'Train':
       self.episode_count += 1
 
-  def save_episode_result(self, mode):
-    self.episode_return_list[mode].append(self.episode_return[mode])
+  def run_async_steps(self, render=False):
+    '''
+    Run with num_actors actor processes and one learner (this process):
+      - Each actor is forked from the agent, steps its own Train environment with a local copy of Q_net,
+        and pushes transitions into its own SharedRing.
+      - The learner moves transitions from the rings into the replay buffer and calls learn() continuously.
+        Every sync_weights_updates updates, Q_net is copied into shared memory and reloaded by the actors.
+      - step_count counts the transitions received by the learner.
+    '''
+    mode = 'Train'
+    if self.resume or self.checkpoint_steps > 0:
+      self.logger.warning(f'<{self.config_idx}> Checkpoints are not supported with actor processes')
+    ctx = mp.get_context('fork')
+    self.update_count = 0
+    # Networks in shared memory, reloaded by the actors whenever weight_version changes
+    # deepcopy gives each parameter its own storage, so flat parameters are rebuilt for one-copy_ syncs
+    self.shared_Q_net = [flatten_parameters(copy.deepcopy(net).cpu()).share_memory() for net in self.Q_net]
+    self.weight_lock = ctx.Lock()
+    self.weight_version = ctx.Value('q', 0, lock=False)
+    self.actor_step_count = ctx.Value('q', 0)
+    self.stop_event = ctx.Event()
+    episode_queue = ctx.Queue()
+    rings = [SharedRing(self.cfg['ring_size'], self.get_transition_specs(), ctx) for _ in range(self.num_actors)]
+    actors = [ctx.Process(target=self.run_actor, args=(i, rings[i], episode_queue), daemon=True) for i in range(self.num_actors)]
+    self.start_time = time.time()
+    for actor in actors:
+      actor.start()
+    self.reset_game('Test')
+    if self.test_per_episodes > 0:
+      self.run_test_episode(render)
+    while self.step_count < self.train_steps:
+      # An actor that exited with an error (e.g. an environment error or OOM) sends no more transitions
+      for i, actor in enumerate(actors):
+        if actor.exitcode not in [None, 0]:
+          self.stop_event.set()
+          raise RuntimeError(f'Actor {i} exited with code {actor.exitcode}')
+      # Move transitions from the rings into the replay buffer
+      for ring in rings:
+        data = ring.get_all()
+        if data is not None:
+          self.save_async_experience(data)
+      self.save_test_results()
+      # Save results of finished episodes
+      while not episode_queue.empty():
+        self.save_episode_result(mode, episode_queue.get())
+        self.episode_count += 1
+        if self.episode_count % self.display_interval == 0:
+          self.log_async_speed()
+        if self.test_per_episodes > 0 and self.episode_count % self.test_per_episodes == 0:
+          self.run_test_episode(render)
+      # Update policy
+      if self.step_count > self.cfg['exploration_steps']:
+        self.learn()
+        self.update_count += 1
+        if self.update_count % self.cfg['sync_weights_updates'] == 0:
+          self.sync_weights()
+      else:
+        time.sleep(1e-3)
+    self.stop_event.set()
+    for actor in actors:
+      actor.join()
+    self.log_async_speed()
+
+  def run_actor(self, actor_idx, ring, episode_queue):
+    mode = 'Train'
+    set_one_thread()
+    seed = self.cfg['seed'] + actor_idx + 1
+    set_random_seed(seed)
+    self.env[mode].seed(seed)
+    self.env[mode].action_space.np_random.seed(seed)
+    # Act on CPU with local copies of the shared networks.
+    # Keep a reference to the learner networks so that they are not freed in the forked process.
+    self.device = 'cpu'
+    self.learner_Q_net, self.Q_net = self.Q_net, [flatten_parameters(copy.deepcopy(net)) for net in self.shared_Q_net]
+    self.set_net_mode(mode)
+    weight_version = -1
+    self.reset_game(mode)
+    while not self.stop_event.is_set():
+      if self.weight_version.value != weight_version:
+        with self.weight_lock:
+          weight_version = self.weight_version.value
+          for net, shared_net in zip(self.Q_net, self.shared_Q_net):
+            hard_update(net, shared_net)
+      # Explore with the total number of steps taken by all actors
+      self.step_count = self.actor_step_count.value
+      self.action[mode] = self.get_action(mode)
+      next_state, reward, self.done[mode], _ = self.env[mode].step(self.action[mode])
+      self.reward[mode] = self.reward_normalizer(reward)
+      transition = {
+        'state': self.original_state,
+        'action': self.action[mode],
+        'next_state': next_state,
+        'reward': self.reward[mode],
+        'mask': 1-self.done[mode]
+      }
+      if not ring.put(transition, self.stop_event):
+        break
+      with self.actor_step_count.get_lock():
+        self.actor_step_count.value += 1
+      self.episode_return[mode] += self.reward[mode]
+      self.original_state = next_state
+      self.state[mode] = self.state_normalizer(next_state)
+      if self.done[mode]:
+        episode_queue.put(self.episode_return[mode])
+        self.reset_game(mode)
+    # Do not wait for unread episode results when exiting
+    episode_queue.cancel_join_thread()
+
+  def get_transition_specs(self):
+    # Shapes and dtypes of one transition in a SharedRing; states are raw observations
+    observation_space = self.env['Train'].observation_space
+    return {
+      'state': (observation_space.shape, observation_space.dtype),
+      'action': ((), np.int64),
+      'next_state': (observation_space.shape, observation_space.dtype),
+      'reward': ((), np.float32),
+      'mask': ((), np.float32)
+    }
+
+  def save_async_experience(self, data):
+    mode = 'Train'
+    self.original_state = data['state'].numpy()
+    self.original_next_state = data['next_state'].numpy()
+    self.state[mode] = self.state_normalizer(self.original_state)
+    self.next_state[mode] = self.state_normalizer(self.original_next_state)
+    self.action[mode] = data['action'].numpy()
+    self.reward[mode] = data['reward'].numpy()
+    self.done[mode] = 1 - data['mask'].numpy()
+    self.save_vec_experience()
+    # Update target Q network once per received transition, the same as in run_episode
+    for _ in range(len(self.reward[mode])):
+      self.update_target_net()
+      self.step_count += 1
+
+  def sync_weights(self):
+    # Copy Q_net into shared memory for the actors
+    with self.weight_lock:
+      for shared_net, net in zip(self.shared_Q_net, self.Q_net):
+        hard_update(shared_net, net)
+      self.weight_version.value += 1
+
+  def log_async_speed(self):
+    duration = time.time() - self.start_time
+    actor_speed = self.actor_step_count.value / duration
+    learner_speed = self.update_count / duration
+    self.logger.info(f'<{self.config_idx}> [Async] Step {self.step_count}, Update {self.update_count}: Actor speed={actor_speed:.2f} (steps/s), Learner speed={learner_speed:.2f} (updates/s)')
+    self.update_status()
+
+  def save_episode_result(self, mode, episode_return=None):
+    if episode_return is None:
+      episode_return = self.episode_return[mode]
+    self.episode_return_list[mode].append(episode_return)
     rolling_score = np.mean(self.episode_return_list[mode][-1 * self.rolling_score_window[mode]:])
     result_dict = {'Env': self.env_name,
                    'Agent': self.agent_name,
                    'Episode': self.episode_count, 
                    'Step': self.step_count, 
-                   'Return': self.episode_return[mode],
+                   'Return': episode_return,
                    'Average Return': rolling_score}
     self.result[mode].append(result_dict)
     if self.show_tb:
-      self.logger.add_scalar(f'{mode}_Return', self.episode_return[mode], self.step_count)
+      self.logger.add_scalar(f'{mode}_Return', episode_return, self.step_count)
       self.logger.add_scalar(f'{mode}_Average_Return', rolling_score, self.step_count)
     if mode == 'Test' or self.episode_count % self.display_interval == 0 or self.step_count >= self.train_steps:
       # Save result to files
@@ -175,16 +354,15 @@ class VanillaDQN(BaseAgent):
       # Show log
       speed = self.step_count / (time.time() - self.start_time)
       eta = (self.train_steps - self.step_count) / speed / 60 if speed>0 else -1
-      self.logger.info(f'<{self.config_idx}> [{mode}] Episode {self.episode_count}, Step {self.step_count}: Average Return({self.rolling_score_window[mode]})={rolling_score:.2f}, Return={self.episode_return[mode]:.2f}, Speed={speed:.2f} (steps/s), ETA={eta:.2f} (mins)')
+      self.logger.info(f'<{self.config_idx}> [{mode}] Episode {self.episode_count}, Step {self.step_count}: Average Return({self.rolling_score_window[mode]})={rolling_score:.2f}, Return={episode_return:.2f}, Speed={speed:.2f} (steps/s), ETA={eta:.2f} (mins)')
 
   def get_action(self, mode='Train'):
     '''
     Uses the local Q network and an epsilon greedy policy to pick an action
-    PyTorch only accepts mini-batches and not single observations so we have to use unsqueeze to add
+    Networks only accept mini-batches and not single observations so we have to use expand_dims to add
     a "fake" dimension to make it a mini-batch rather than a single observation
     '''
-    state = to_tensor(self.state[mode], device=self.device)
-    state = state.unsqueeze(0) # Add a batch dimension (Batch, Channel, Height, Width)
+    state = np.expand_dims(self.state[mode], 0) # Add a batch dimension (Batch, Channel, Height, Width)
     q_values = self.get_action_selection_q_values(state)
     if mode == 'Test':
       action = np.argmax(q_values) # During test, select best action
@@ -192,6 +370,15 @@ class VanillaDQN(BaseAgent):
       action = self.exploration.select_action(q_values, self.step_count)
     return action
 
+  def get_vec_action(self):
+    '''
+    Pick actions for all Train environments with one batched forward pass
+    '''
+    state = self.state['Train']
+    q_values = self.get_action_selection_q_values(state).reshape(self.num_envs, -1)
+    action = [self.exploration.select_action(q_values[i], self.step_count+i) for i in range(self.num_envs)]
+    return np.array(action)
+
   def time_to_learn(self):
     """
     Return boolean to indicate whether it is time to learn:
@@ -209,9 +396,14 @@ class VanillaDQN(BaseAgent):
   def learn(self):
     mode = 'Train'
     batch = self.replay.sample(['state', 'action', 'reward', 'next_state', 'mask'], self.cfg['batch_size'])
-    q, q_target = self.compute_q(batch), self.compute_q_target(batch)
+    q, q_target = self.compute_q_and_target(batch)
     # Compute loss
-    loss = self.loss(q, q_target)
+    if self.replay.prioritized:
+      # Weight the loss with importance sampling weights and update priorities with TD errors
+      loss = (batch.weight * self.element_loss(q, q_target)).mean()
+      self.replay.update_priority(batch.idx, q_target - q)
+    else:
+      loss = self.loss(q, q_target)
     # Take an optimization step
     self.optimizer[self.update_Q_net_index].zero_grad()
     loss.backward()
@@ -221,6 +413,19 @@ class VanillaDQN(BaseAgent):
     if self.show_tb:
       self.logger.add_scalar(f'Loss', loss.item(), self.step_count)
 
+  def compute_q_and_target(self, batch):
+    '''
+    Compute q and q_target with one forward pass of Q_net on both state and next_state.
+    Subclasses that compute q_target with other networks override this to call compute_q and compute_q_target.
+    '''
+    action = batch.action.long().unsqueeze(1)
+    q_all, q_next_all = shared_forward(self.Q_net[0], [batch.state, batch.next_state])
+    q = q_all.gather(1, action).squeeze()
+    with torch.no_grad():
+      q_next = q_next_all.detach().max(1)[0]
+      q_target = batch.reward + self.discount * q_next * batch.mask
+    return q, q_target
+
   def compute_q_target(self, batch):
     with torch.no_grad():
       q_next = self.Q_net[0](batch.next_state).max(1)[0]
@@ -237,13 +442,32 @@ class VanillaDQN(BaseAgent):
     mode = 'Train'
     prediction = {}
     if self.reward[mode] is not None:
-      prediction['state'] = to_tensor(self.state[mode], self.device)
+      if self.replay.raw_state:
+        # Let the replay buffer store raw observations (e.g. uint8 frames)
+        prediction['state'] = self.original_state
+        prediction['next_state'] = self.original_next_state
+      else:
+        prediction['state'] = to_tensor(self.state[mode], self.device)
+        prediction['next_state'] = to_tensor(self.next_state[mode], self.device)
       prediction['action'] = to_tensor(self.action[mode], self.device)
-      prediction['next_state'] = to_tensor(self.next_state[mode], self.device)
       prediction['mask'] = to_tensor(1-self.done[mode], self.device)
       prediction['reward'] = to_tensor(self.reward[mode], self.device)
     self.replay.add(prediction)
 
+  def save_vec_experience(self):
+    mode = 'Train'
+    prediction = {}
+    if self.replay.raw_state:
+      prediction['state'] = self.original_state
+      prediction['next_state'] = self.original_next_state
+    else:
+      prediction['state'] = to_tensor(self.state[mode], self.device)
+      prediction['next_state'] = to_tensor(self.next_state[mode], self.device)
+    prediction['action'] = to_tensor(self.action[mode], self.device)
+    prediction['mask'] = to_tensor(1-self.done[mode], self.device)
+    prediction['reward'] = to_tensor(self.reward[mode], self.device)
+    self.replay.add_batch(prediction)
+
   def get_action_size(self):
     mode = 'Train'
     if isinstance(self.env[mode].action_space, Discrete):
@@ -272,6 +496,12 @@ class VanillaDQN(BaseAgent):
       else:
         return int(np.prod(self.env[mode].observation_space.shape))
 
+  def get_eval_nets(self):
+    return self.Q_net
+
+  def set_eval_nets(self, nets):
+    self.Q_net = nets
+
   def set_net_mode(self, mode):
     if mode == 'Test':
       for i in range(len(self.Q_net)):
@@ -281,7 +511,11 @@ class VanillaDQN(BaseAgent):
         self.Q_net[i].train() # Set Q network back to training mode
   
   def get_action_selection_q_values(self, state):
-    q_values = self.Q_net[0](state)
+    # Action values of a mini-batch of states (an array), computed with the NumPy mirror of Q_net if possible
+    numpy_net = self.get_numpy_net(self.Q_net[0])
+    if numpy_net is not None:
+      return numpy_net(state).flatten()
+    q_values = self.Q_net[0](to_tensor(state, device=self.device))
     q_values = to_numpy(q_values).flatten()
     return q_values
 
@@ -2,6 +2,7 @@ import os
 import math
 from utils.plotter import Plotter
 from utils.sweeper import unfinished_index, time_info, memory_info
+from utils.status import collect_status
 from utils.helper import set_one_thread
 
 
@@ -68,7 +69,8 @@ def analyze(exp, runs=1):
 
 if __name__ == "__main__":
   exp, runs = 'RPG', 30
-  unfinished_index(exp, runs=runs)
-  memory_info(exp, runs=runs)
-  time_info(exp, runs=runs)
+  table = collect_status(exp, runs=runs)
+  unfinished_index(exp, runs=runs, table=table)
+  memory_info(exp, runs=runs, table=table)
+  time_info(exp, runs=runs, table=table)
   analyze(exp, runs=runs)
\ No newline at end of file
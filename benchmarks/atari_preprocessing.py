@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import tracemalloc
+import gym
+import numpy as np
+from gym.spaces.box import Box
+from gym.spaces.discrete import Discrete
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from envs.wrapper import *
+
+
+class FakeALE(object):
+  def __init__(self):
+    self.num_lives = 3
+
+  def lives(self):
+    return self.num_lives
+
+
+class RandomFrameEnv(gym.Env):
+  '''
+  An Atari-like environment emitting (210, 160, 3) RGB frames, so that only preprocessing is timed.
+  Frames are cycled from a pool and a life is lost every 100 frames.
+  '''
+  def __init__(self, num_frames=64, episode_frames=1000):
+    self.action_space = Discrete(6)
+    self.observation_space = Box(low=0, high=255, shape=(210, 160, 3), dtype=np.uint8)
+    self.np_random = np.random.RandomState(0)
+    self.pool = self.np_random.randint(0, 256, size=(num_frames, 210, 160, 3), dtype=np.uint8)
+    self.episode_frames = episode_frames
+    self.ale = FakeALE()
+    self.t = 0
+
+  def get_action_meanings(self):
+    return ['NOOP', 'FIRE', 'UP', 'RIGHT', 'LEFT', 'DOWN']
+
+  def reset(self):
+    self.t = 0
+    self.ale.num_lives = 3
+    return self.pool[0]
+
+  def step(self, action):
+    self.t += 1
+    if self.t % 100 == 0:
+      self.ale.num_lives = max(1, self.ale.num_lives - 1)
+    done = self.t >= self.episode_frames
+    return self.pool[(self.t * 7 + action) % len(self.pool)], 1.0, done, {}
+
+
+def make_wrapper_chain(max_episode_steps=-1):
+  # The wrapper chain of make_env
+  env = make_atari(RandomFrameEnv(), max_episode_steps)
+  env = ReturnWrapper(env)
+  env = wrap_deepmind(env, episode_life=True, clip_rewards=False, frame_stack=False, scale=False)
+  env = TransposeImage(env)
+  env = FrameStack(env, 4)
+  return env
+
+def make_fused(max_episode_steps=-1):
+  # The wrapper chain of make_env with fused_preprocessing
+  env = make_atari(RandomFrameEnv(), max_episode_steps, inplace=True)
+  env = ReturnWrapper(env)
+  env = wrap_deepmind(env, episode_life=True, clip_rewards=False, frame_stack=False, scale=False, warp_frame=False)
+  env = WarpFrameStack(env, 4)
+  return env
+
+def run(env, actions, check=None):
+  '''
+  Step env with actions (resetting when done) and return per-step latency (us).
+  The observation is converted with np.asarray, as the agents do before using it.
+  '''
+  env.unwrapped.np_random = np.random.RandomState(0)
+  obs = np.asarray(env.reset())
+  obs_list = [obs.copy()] if check else None
+  start_time = time.perf_counter()
+  for action in actions:
+    obs, _, done, _ = env.step(action)
+    obs = np.asarray(obs)
+    if done:
+      obs = np.asarray(env.reset())
+    if check:
+      obs_list.append(obs.copy())
+  latency = (time.perf_counter() - start_time) / len(actions) * 1e6
+  return latency, obs_list
+
+
+if __name__ == "__main__":
+  import_cv2().setNumThreads(1)
+  actions = np.random.RandomState(0).randint(6, size=5000)
+  # Observations of both paths should be the same
+  _, obs_chain = run(make_wrapper_chain(), actions[:1000], check=True)
+  _, obs_fused = run(make_fused(), actions[:1000], check=True)
+  mismatch = sum([not np.array_equal(x, y) for x, y in zip(obs_chain, obs_fused)])
+  print(f'Mismatched observations: {mismatch}/{len(obs_chain)}')
+  base_env = RandomFrameEnv()
+  start_time = time.perf_counter()
+  for action in actions:
+    for _ in range(4):
+      _, _, done, _ = base_env.step(action)
+      if done:
+        base_env.reset()
+  base_latency = (time.perf_counter() - start_time) / len(actions) * 1e6
+  chain_latency, _ = run(make_wrapper_chain(), actions)
+  fused_latency, _ = run(make_fused(), actions)
+  print(f'Environment only: {base_latency:.1f} (us/step)')
+  print(f'    Wrapper chain: {chain_latency:.1f} (us/step), preprocessing={chain_latency-base_latency:.1f} (us/step)')
+  print(f'            Fused: {fused_latency:.1f} (us/step), preprocessing={fused_latency-base_latency:.1f} (us/step)')
+  print(f'Speedup of preprocessing: {(chain_latency-base_latency)/(fused_latency-base_latency):.2f}x')
+  # Peak of memory allocated by the wrappers, numpy reports its allocations to tracemalloc
+  for name, make in [('Wrapper chain', make_wrapper_chain), ('Fused', make_fused)]:
+    env = make()
+    run(env, actions[:100])
+    tracemalloc.start()
+    run(env, actions[:1000])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:>17}: peak allocated memory={peak/1024:.0f} (KB)')
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import subprocess
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import get_num_cores
+
+
+def make_config_file(config_file, env_names, train_steps):
+  '''
+  Write a copy of config_file with other environments (e.g. if MuJoCo is not installed) and fewer training steps
+  '''
+  with open(config_file, 'r') as f:
+    cfg = json.load(f)
+  cfg['env'][0]['name'] = env_names
+  cfg['train_steps'] = [train_steps]
+  bench_config_file = os.path.join(parentdir, 'configs', 'bench_batch.json')
+  with open(bench_config_file, 'w') as f:
+    json.dump(cfg, f, indent=2)
+  return bench_config_file
+
+def run_per_process(config_file, idx_list):
+  # run.sh with one job: a new Python process for every config index
+  for config_idx in idx_list:
+    subprocess.run([sys.executable, 'main.py', '--config_file', config_file, '--config_idx', str(config_idx)], cwd=parentdir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def run_batch(config_file, idx_list):
+  # main_batch.py with one warm worker process
+  subprocess.run([sys.executable, 'main_batch.py', '--config_file', config_file, '--config_idxs', f'{idx_list[0]}-{idx_list[-1]}', '--num_workers', '1'], cwd=parentdir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Wall time of a sweep: one process per run (run.sh) vs. warm workers (main_batch.py)")
+  parser.add_argument('--config_file', type=str, default=os.path.join(parentdir, 'configs', 'RPG.json'))
+  parser.add_argument('--env_names', type=str, nargs='+', default=['Pendulum-v1', 'MountainCarContinuous-v0'])
+  parser.add_argument('--train_steps', type=int, default=2048)
+  parser.add_argument('--num_runs', type=int, default=12)
+  parser.add_argument('--sweep_runs', type=int, default=360)
+  parser.add_argument('--num_jobs', type=int, default=120, help='Number of concurrent jobs in run.sh')
+  args = parser.parse_args()
+  config_file = make_config_file(args.config_file, args.env_names, args.train_steps)
+  idx_list = list(range(1, args.num_runs+1))
+  try:
+    times = {}
+    for name, run in [('per-process', run_per_process), ('batch', run_batch)]:
+      start_time = time.perf_counter()
+      run(config_file, idx_list)
+      times[name] = (time.perf_counter() - start_time) / args.num_runs
+    startup_time = times['per-process'] - times['batch']
+    print(f'{args.num_runs} runs of {args.train_steps} steps ({", ".join(args.env_names)}): per run: per-process={times["per-process"]:.2f} (s), batch={times["batch"]:.2f} (s), saved startup={startup_time:.2f} (s), speedup={times["per-process"]/times["batch"]:.2f}x')
+    # A sweep of sweep_runs runs with num_jobs concurrent jobs (or workers) on num_jobs cores takes ceil(sweep_runs/num_jobs) rounds
+    rounds = math.ceil(args.sweep_runs / args.num_jobs)
+    print(f'Estimated {args.sweep_runs}-run sweep with {args.num_jobs} jobs: run.sh={rounds*times["per-process"]/60:.2f} (minutes), main_batch.py={rounds*times["batch"]/60:.2f} (minutes) (cores here: {get_num_cores()})')
+  finally:
+    os.remove(config_file)
+    shutil.rmtree(os.path.join(parentdir, 'logs', 'bench_batch'), ignore_errors=True)
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from envs.env import make_vec_env
+from envs.batched_minatar import make_batched_minatar
+
+
+env_names = ['Breakout-MinAtar-v0', 'Asterix-MinAtar-v0', 'SpaceInvaders-MinAtar-v0', 'Seaquest-MinAtar-v0']
+
+def check_equivalence(env_name, num_envs=4, steps=10000, seed=0, max_episode_steps=-1):
+  '''
+  Step the batched game and a SyncVectorEnv of gym_minatar environments (as made by make_env)
+  with the same seed and random actions; return the number of steps with different observations,
+  rewards, terminals or terminal observations.
+  '''
+  batched = make_batched_minatar(env_name, num_envs, max_episode_steps)
+  reference = make_vec_env(env_name, max_episode_steps, num_envs, 'sync')
+  batched.seed(seed)
+  reference.seed(seed)
+  mismatch = int(not np.array_equal(batched.reset(), reference.reset()))
+  action_random = np.random.RandomState(seed)
+  for _ in range(steps):
+    actions = action_random.randint(6, size=num_envs)
+    obs, reward, done, info = batched.step(actions)
+    ref_obs, ref_reward, ref_done, ref_info = reference.step(actions)
+    same = np.array_equal(obs, ref_obs) and np.array_equal(reward, ref_reward) and np.array_equal(done, ref_done)
+    for i in np.nonzero(ref_done)[0]:
+      same = same and np.array_equal(info[i]['terminal_observation'], ref_info[i]['terminal_observation'])
+    mismatch += int(not same)
+  return mismatch
+
+def benchmark(env, num_envs, steps=2000):
+  env.seed(0)
+  env.reset()
+  action_random = np.random.RandomState(0)
+  start_time = time.perf_counter()
+  for _ in range(steps):
+    env.step(action_random.randint(6, size=num_envs))
+  return steps * num_envs / (time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+  for env_name in env_names:
+    mismatch = check_equivalence(env_name) + check_equivalence(env_name, num_envs=2, seed=1, max_episode_steps=100)
+    print(f'{env_name:>25}: {mismatch} mismatched steps')
+  for env_name in env_names:
+    for num_envs in [1, 8, 64, 256]:
+      ref_speed = benchmark(make_vec_env(env_name, -1, num_envs, 'sync'), num_envs)
+      batched_speed = benchmark(make_batched_minatar(env_name, num_envs), num_envs)
+      print(f'{env_name:>25} num_envs={num_envs:<4}: sync={ref_speed:.0f} (steps/s), batched={batched_speed:.0f} (steps/s), speedup={batched_speed/ref_speed:.1f}x')
@@ -0,0 +1,116 @@
+import os
+import sys
+import copy
+import time
+import torch
+import torch.nn as nn
+from collections import Counter
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from components.network import *
+
+
+class LoopHeads(nn.Module):
+  '''
+  The heads of BootstrappedDQNNet before MultiHeadMLPCritic: a list of k MLPCritics, evaluated one by one.
+  Weights are copied from a MultiHeadMLPCritic.
+  '''
+  def __init__(self, fused_heads, layer_dims):
+    super().__init__()
+    self.k = fused_heads.k
+    self.heads = nn.ModuleList([MLPCritic(layer_dims=layer_dims, last_w_scale=1.0) for _ in range(fused_heads.k)])
+    with torch.no_grad():
+      for i, head in enumerate(self.heads):
+        for j, (weight, bias) in enumerate(zip(fused_heads.weights, fused_heads.biases)):
+          head.value_net.mlp[2*j].weight.copy_(weight[i])
+          head.value_net.mlp[2*j].bias.copy_(bias[i])
+
+  def forward(self, phi, head_idx='all'):
+    return [head(phi) for head in self.heads]
+
+
+def loop_learn_step(net, target_net, optimizer, batch, discount=0.99):
+  # BootstrappedDQN.learn before MultiHeadMLPCritic
+  k = net.k
+  action = batch['action'].unsqueeze(1)
+  q_outputs = net(batch['state'])
+  qs = [q_outputs[i].gather(1, action).squeeze() for i in range(k)]
+  with torch.no_grad():
+    q_nexts = target_net(batch['next_state'])
+    q_targets = [batch['reward'] + discount * q_nexts[i].max(1)[0] * batch['mask'] for i in range(k)]
+  loss = 0
+  for i in range(k):
+    loss += nn.SmoothL1Loss()(qs[i], q_targets[i])
+  loss /= k
+  optimizer.zero_grad()
+  loss.backward()
+  optimizer.step()
+  return loss
+
+def fused_learn_step(net, target_net, optimizer, batch, discount=0.99):
+  # BootstrappedDQN.learn with MultiHeadMLPCritic
+  action = batch['action'].view(1, -1, 1).expand(net.k, -1, 1)
+  q = net(batch['state']).gather(2, action).squeeze(-1)
+  with torch.no_grad():
+    q_target = batch['reward'] + discount * target_net(batch['next_state']).max(2)[0] * batch['mask']
+  loss = nn.SmoothL1Loss()(q, q_target)
+  optimizer.zero_grad()
+  loss.backward()
+  optimizer.step()
+  return loss
+
+def make_nets(k, state_shape, layer_dims):
+  if len(state_shape) == 3:
+    feature_net = Conv2d_MinAtar(in_channels=state_shape[0], feature_dim=layer_dims[0])
+  else:
+    feature_net = nn.Identity()
+  fused_net = BootstrappedDQNNet(feature_net, MultiHeadMLPCritic(k, layer_dims=layer_dims, last_w_scale=1.0))
+  loop_net = BootstrappedDQNNet(copy.deepcopy(feature_net), LoopHeads(fused_net.heads_net, layer_dims))
+  return fused_net, loop_net
+
+def benchmark(learn_step, net, batch, num_runs=200, num_trials=5):
+  target_net = copy.deepcopy(net)
+  optimizer = torch.optim.RMSprop(net.parameters(), lr=1e-4)
+  best_time = float('inf')
+  for _ in range(num_trials):
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+      learn_step(net, target_net, optimizer, batch)
+    best_time = min(best_time, (time.perf_counter() - start_time) / num_runs * 1e6)
+  return best_time
+
+def majority_vote(actions, action_size):
+  # The vote in BootstrappedDQN.get_action
+  counts = torch.bincount(actions, minlength=action_size)[actions]
+  return actions[torch.argmax((counts == counts.max()).int())].item()
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  torch.manual_seed(0)
+  k, batch_size, action_size = 10, 32, 6
+  # MinAtar (pixel) and feature-based states with hidden layers in the heads
+  for state_shape, layer_dims in [((4, 10, 10), [128, action_size]), ((8,), [8, 64, 64, action_size])]:
+    fused_net, loop_net = make_nets(k, state_shape, layer_dims)
+    batch = {
+      'state': torch.rand((batch_size,) + state_shape),
+      'action': torch.randint(action_size, (batch_size,)),
+      'next_state': torch.rand((batch_size,) + state_shape),
+      'reward': torch.rand(batch_size),
+      'mask': torch.ones(batch_size)
+    }
+    target_fused, target_loop = copy.deepcopy(fused_net), copy.deepcopy(loop_net)
+    loss_fused = fused_learn_step(fused_net, target_fused, torch.optim.SGD(fused_net.parameters(), lr=0), batch)
+    loss_loop = loop_learn_step(loop_net, target_loop, torch.optim.SGD(loop_net.parameters(), lr=0), batch)
+    loop_time = benchmark(loop_learn_step, loop_net, batch)
+    fused_time = benchmark(fused_learn_step, fused_net, batch)
+    print(f'state={str(state_shape):<12} k={k}: loss difference={abs(loss_fused.item()-loss_loop.item()):.1e}, learn step: loop={loop_time:.0f} (us), fused={fused_time:.0f} (us), speedup={loop_time/fused_time:.1f}x')
+  # Majority vote should match Counter.most_common, including ties
+  mismatch = 0
+  for _ in range(10000):
+    actions = torch.randint(action_size, (k,))
+    action, _ = Counter(actions.tolist()).most_common()[0]
+    mismatch += int(action != majority_vote(actions, action_size))
+  print(f'Majority vote mismatches with Counter: {mismatch}/10000')
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import torch
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import atomic_save, load_checkpoint
+from components.replay import *
+
+
+keys = ['state', 'action', 'next_state', 'reward', 'mask']
+
+def make_replays(memory_size, list_memory_size, frame_memory_size):
+  '''
+  Full replay buffers as made by VanillaDQN and SAC (memory_type) with random experiences:
+  {name: (replay, a function that makes an empty replay of the same type, number of experiences per add_batch)}
+  '''
+  replays = {}
+  # Feature states (e.g. LunarLander: 8 floats), one tensor per experience
+  make = lambda: FiniteReplay(list_memory_size, keys=keys)
+  replays['FiniteReplay (8 floats)'] = (make, lambda: {'state': torch.rand(8), 'action': torch.tensor(1.0), 'next_state': torch.rand(8), 'reward': torch.rand(()), 'mask': torch.tensor(1.0)}, 1)
+  # Feature states in preallocated tensors
+  for name, replay_type in [('FiniteArrayReplay', FiniteArrayReplay), ('PrioritizedReplay', PrioritizedReplay)]:
+    make = lambda replay_type=replay_type: replay_type(memory_size, keys=keys)
+    replays[f'{name} (8 floats)'] = (make, lambda: {'state': torch.rand(1000, 8), 'action': torch.randint(4, (1000,)).float(), 'next_state': torch.rand(1000, 8), 'reward': torch.rand(1000), 'mask': torch.ones(1000)}, 1000)
+  # MinAtar Breakout states (10x10x4 bits)
+  make = lambda: BitPackedReplay(memory_size, keys=keys)
+  replays['BitPackedReplay (MinAtar)'] = (make, lambda: {'state': np.random.rand(1000, 4, 10, 10) < 0.1, 'action': torch.randint(6, (1000,)).float(), 'next_state': np.random.rand(1000, 4, 10, 10) < 0.1, 'reward': torch.rand(1000), 'mask': torch.ones(1000)}, 1000)
+  # Atari frames (84x84 uint8, 4 stacked)
+  make = lambda: FrameStackReplay(frame_memory_size, keys=keys)
+  replays['FrameStackReplay (Atari)'] = (make, None, 1)
+  return replays
+
+def fill(replay, make_data, batch_size):
+  if isinstance(replay, FrameStackReplay):
+    # Episodes of 1000 steps of consecutive frames
+    frames = np.random.randint(0, 256, (replay.memory_size+4, 1, 84, 84), dtype=np.uint8)
+    for i in range(replay.memory_size):
+      state, next_state = frames[i:i+4].reshape(4, 84, 84), frames[i+1:i+5].reshape(4, 84, 84)
+      replay.add({'state': state, 'action': torch.tensor(1.0), 'next_state': next_state, 'reward': torch.tensor(0.0), 'mask': torch.tensor(0.0 if i % 1000 == 999 else 1.0)})
+    return
+  for _ in range(replay.memory_size // batch_size):
+    if batch_size == 1:
+      replay.add(make_data())
+    else:
+      replay.add_batch(make_data())
+
+def same_samples(replay, new_replay):
+  # Sample the same indexes from both buffers
+  np.random.seed(0)
+  batch = replay.sample(keys, 256)
+  np.random.seed(0)
+  new_batch = new_replay.sample(keys, 256)
+  return all(torch.equal(torch.as_tensor(x), torch.as_tensor(y)) for x, y in zip(batch, new_batch))
+
+def benchmark(name, make, make_data, batch_size, checkpoint_dir):
+  replay = make()
+  fill(replay, make_data, batch_size)
+  path = os.path.join(checkpoint_dir, 'checkpoint.pt')
+  # Checkpoint: state_dict and atomic_save (with fsync)
+  start_time = time.perf_counter()
+  atomic_save({'replay': replay.state_dict()}, path)
+  save_time = time.perf_counter() - start_time
+  size = os.path.getsize(path)
+  # Resume: load_checkpoint and load_state_dict into a new buffer
+  start_time = time.perf_counter()
+  new_replay = make()
+  new_replay.load_state_dict(load_checkpoint(path)['replay'])
+  load_time = time.perf_counter() - start_time
+  assert same_samples(replay, new_replay), name
+  del new_replay
+  # Without state_dict: pickle the buffer object
+  start_time = time.perf_counter()
+  with open(path, 'wb') as f:
+    pickle.dump(replay, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.flush()
+    os.fsync(f.fileno())
+  pickle_time = time.perf_counter() - start_time
+  pickle_size = os.path.getsize(path)
+  os.remove(path)
+  print(f'{name:>28} ({replay.memory_size:.0e} experiences): checkpoint={save_time:.2f} (s), {size/2**20:.0f} MB, {size/2**20/save_time:.0f} MB/s; resume={load_time:.2f} (s); pickle of the buffer={pickle_time:.2f} (s), {pickle_size/2**20:.0f} MB')
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Checkpoint write time of full replay buffers")
+  parser.add_argument('--memory_size', type=int, default=int(1e6))
+  parser.add_argument('--list_memory_size', type=int, default=int(2e5), help='Size of FiniteReplay (1e6 experiences take 2.8 GB as separate tensors)')
+  parser.add_argument('--frame_memory_size', type=int, default=int(1e5), help='Size of the Atari buffer (1e6 frames take 6.6 GB)')
+  parser.add_argument('--checkpoint_dir', type=str, default=tempfile.gettempdir())
+  args = parser.parse_args()
+  for name, (make, make_data, batch_size) in make_replays(args.memory_size, args.list_memory_size, args.frame_memory_size).items():
+    benchmark(name, make, make_data, batch_size, args.checkpoint_dir)
+    sys.stdout.flush()
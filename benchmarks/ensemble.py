@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import torch
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from components.network import *
+
+
+def make_nets(k, in_channels, action_size=6, feature_dim=128):
+  # k DQNNets for MinAtar, the same as VanillaDQN.createNN with hidden_layers=[]
+  nets = []
+  for _ in range(k):
+    feature_net = Conv2d_MinAtar(in_channels=in_channels, feature_dim=feature_dim)
+    value_net = MLPCritic(layer_dims=[feature_dim, action_size], last_w_scale=1.0)
+    nets.append(DQNNet(feature_net, value_net))
+  return nets
+
+def q_min_loop(nets, x):
+  # The loop in MaxminDQN.compute_q_target before EnsembleDQNNet
+  q_min = nets[0](x).clone()
+  for i in range(1, len(nets)):
+    q_min = torch.min(q_min, nets[i](x))
+  return q_min
+
+def benchmark(f, num_runs=200, num_trials=5):
+  # The best average time (us) over num_trials trials
+  best_time = float('inf')
+  with torch.no_grad():
+    for _ in range(num_trials):
+      for _ in range(5):
+        f()
+      start_time = time.perf_counter()
+      for _ in range(num_runs):
+        f()
+      best_time = min(best_time, (time.perf_counter() - start_time) / num_runs * 1e6)
+  return best_time
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  torch.manual_seed(0)
+  # MinAtar Breakout (4 channels) and Seaquest (10 channels)
+  for in_channels in [4, 10]:
+    for k in [2, 4, 8]:
+      nets = make_nets(k, in_channels)
+      ensemble = EnsembleDQNNet()
+      x = torch.rand(32, in_channels, 10, 10)
+      with torch.no_grad():
+        error = (ensemble(x, nets).min(0)[0] - q_min_loop(nets, x)).abs().max().item()
+      # Target computation (batch 32) with fixed target networks
+      loop_time = benchmark(lambda: q_min_loop(nets, x))
+      ensemble_time = benchmark(lambda: ensemble(x, nets).min(0)[0])
+      print(f'channels={in_channels:<2} k={k}: max error={error:.1e}, target (batch 32): loop={loop_time:.0f} (us), ensemble={ensemble_time:.0f} (us), speedup={loop_time/ensemble_time:.1f}x')
+      # Action selection (batch 1)
+      x = torch.rand(1, in_channels, 10, 10)
+      loop_time = benchmark(lambda: q_min_loop(nets, x))
+      ensemble_time = benchmark(lambda: ensemble(x, nets).min(0)[0])
+      # Restacking one member after it is updated, as in MaxminDQN after each learn step
+      def restack_one():
+        nets[0].feature_net.conv1.weight.add_(0)
+        ensemble.restack(nets)
+      restack_time = benchmark(restack_one)
+      print(f'channels={in_channels:<2} k={k}: action selection (batch 1): loop={loop_time:.0f} (us), ensemble={ensemble_time:.0f} (us), speedup={loop_time/ensemble_time:.1f}x; restacking one member={restack_time:.0f} (us)')
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import subprocess
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+
+# One environment of each family
+env_names = {
+  'classic_control': 'CartPole-v1',
+  'box2d': 'LunarLander-v2',
+  'gym_minatar': 'Breakout-MinAtar-v0',
+  'gym_pygame': 'Catcher-PLE-v0',
+  'atari': 'BreakoutNoFrameskip-v4',
+  'mujoco': 'HalfCheetah-v2',
+  'pybullet': 'AntBulletEnv-v0'
+}
+# Packages in the breakdown
+packages = ['torch', 'gym', 'cv2', 'pygame', 'gym_pygame', 'gym_minatar', 'gym_exploration', 'pybullet', 'mujoco_py']
+# envs.env imported these packages before the environment registry
+eager_imports = 'import importlib\nfor name in ["gym_pygame", "gym_minatar", "gym_exploration"]:\n  try: importlib.import_module(name)\n  except ImportError: pass\n'
+
+def make_env_code(env_name, eager):
+  # Startup of a run: import the agents (and envs.env), then make the environment
+  return (eager_imports if eager else '') + f'import agents\nfrom envs.env import make_env\nmake_env("{env_name}", -1)\n'
+
+def import_times(code):
+  '''
+  Run code in a new process with -X importtime and return the wall time (s) and the cumulative import time (s) of each package
+  '''
+  start_time = time.perf_counter()
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-W', 'ignore', '-c', code], cwd=parentdir, capture_output=True, text=True)
+  wall_time = time.perf_counter() - start_time
+  if result.returncode != 0:
+    return None, None
+  times = {}
+  for line in result.stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    name = name.strip()
+    if name in packages and name not in times:
+      times[name] = int(cumulative) / 1e6
+  return wall_time, times
+
+def benchmark(code, num_trials=5):
+  # The median wall time and import times over num_trials processes
+  results = [import_times(code) for _ in range(num_trials)]
+  if results[0][0] is None:
+    return None, None
+  wall_time = np.median([wall_time for wall_time, _ in results])
+  times = {name: np.median([times.get(name, 0) for _, times in results]) for name in packages}
+  return wall_time, times
+
+
+if __name__ == "__main__":
+  for family, env_name in env_names.items():
+    eager_time, eager_times = benchmark(make_env_code(env_name, eager=True))
+    lazy_time, lazy_times = benchmark(make_env_code(env_name, eager=False))
+    if eager_time is None or lazy_time is None:
+      print(f'{family:>15} ({env_name}): not installed')
+      continue
+    breakdown = ', '.join(f'{name}={eager_times[name]:.2f}->{lazy_times[name]:.2f}' for name in packages if max(eager_times[name], lazy_times[name]) > 0)
+    print(f'{family:>15} ({env_name}): startup: eager={eager_time:.2f} (s), lazy={lazy_time:.2f} (s), saved={eager_time-lazy_time:.2f} (s); imports (s): {breakdown}')
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import torch
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import *
+from components.network import *
+from components.inference import *
+
+
+def make_dqn_nets(action_size=6):
+  # Q networks as made by createNN of VanillaDQN, BootstrappedDQN and NoisyNetDQN
+  return {
+    'DQN (MinAtar)': (DQNNet(Conv2d_MinAtar(in_channels=4), MLPCritic(layer_dims=[128, action_size], last_w_scale=1.0)), (4, 10, 10)),
+    'DQN (feature)': (DQNNet(nn.Identity(), MLPCritic(layer_dims=[8, 64, 64, action_size], last_w_scale=1.0)), (8,)),
+    'BootstrappedDQN (MinAtar)': (BootstrappedDQNNet(Conv2d_MinAtar(in_channels=4), MultiHeadMLPCritic(10, layer_dims=[128, action_size], last_w_scale=1.0)), (4, 10, 10)),
+    'NoisyNetDQN (MinAtar)': (DQNNet(Conv2d_MinAtar(in_channels=4), NoisyMLPCritic(layer_dims=[128, action_size])), (4, 10, 10))
+  }
+
+def make_policy_nets(state_size=8, action_size=2, hidden_layers=[64, 64], action_lim=1.0, last_w_scale=1e-3):
+  '''
+  Networks as made by createNN of REINFORCE, ActorCritic/PPO, SAC and DDPG/TD3 for feature inputs.
+  The default last_w_scale keeps actor outputs near 0 as at initialization, a larger one gives outputs at the scale of trained actors.
+  '''
+  layer_dims = [state_size] + hidden_layers
+  return {
+    'REINFORCE (discrete)': REINFORCENet(nn.Identity(), MLPCategoricalActor(layer_dims=layer_dims+[4], last_w_scale=last_w_scale)),
+    'PPO (continuous)': ActorVCriticNet(nn.Identity(), MLPGaussianActor(action_lim=action_lim, layer_dims=layer_dims+[action_size], last_w_scale=last_w_scale), MLPCritic(layer_dims=layer_dims+[1])),
+    'SAC': ActorDoubleQCriticNet(nn.Identity(), MLPSquashedGaussianActor(action_lim=action_lim, layer_dims=layer_dims+[2*action_size], last_w_scale=last_w_scale, rsample=True), MLPDoubleQCritic(layer_dims=[state_size+action_size]+hidden_layers+[1])),
+    'DDPG/TD3': ActorQCriticNet(nn.Identity(), MLPDeterministicActor(action_lim=action_lim, layer_dims=layer_dims+[action_size], last_w_scale=last_w_scale), MLPQCritic(layer_dims=[state_size+action_size]+hidden_layers+[1]))
+  }
+
+def torch_q_values(net, state, head_idx=None):
+  # VanillaDQN.get_action_selection_q_values before NumPy mirrors
+  state = to_tensor(state, device='cpu').unsqueeze(0)
+  q_values = net(state) if head_idx is None else net(state, head_idx)
+  return to_numpy(q_values).flatten()
+
+def torch_action(net, state):
+  # REINFORCE.get_action before NumPy mirrors, followed by to_numpy as in run_episode
+  prediction = net(to_tensor(state, 'cpu'))
+  return to_numpy(prediction['action'])
+
+def policy_error(net, numpy_net, num_states=1000):
+  '''
+  The max difference between net and numpy_net over random states:
+    - The log_pi (and v) of the sampled action should match torch's for the same action.
+      With squashed actions, torch recovers the action before squashing with atanh clamped at 0.999,
+      so saturated actions are skipped.
+    - Deterministic actions (and their log_pi) should be the same.
+  '''
+  error = 0
+  for _ in range(num_states):
+    state = np.random.randn(8)
+    prediction = numpy_net(state)
+    action = prediction['action']
+    saturated = isinstance(net.actor_net, MLPSquashedGaussianActor) and (action.abs() / net.actor_net.action_lim >= 0.999).any()
+    if 'log_pi' in prediction and not saturated:
+      with torch.no_grad():
+        log_pi = net.get_log_pi(to_tensor(state, 'cpu'), action) if isinstance(net, ActorVCriticNet) else net(to_tensor(state, 'cpu'), action=action)['log_pi']
+      error = max(error, abs(log_pi.item() - prediction['log_pi'].item()))
+    if 'v' in prediction:
+      with torch.no_grad():
+        error = max(error, abs(net.get_state_value(to_tensor(state, 'cpu')).item() - prediction['v'].item()))
+    if not isinstance(net.actor_net, MLPCategoricalActor):
+      with torch.no_grad():
+        torch_prediction = net(to_tensor(state, 'cpu'), deterministic=True)
+      numpy_prediction = numpy_net(state, deterministic=True)
+      error = max(error, (torch_prediction['action'] - numpy_prediction['action']).abs().max().item())
+      if 'log_pi' in numpy_prediction:
+        error = max(error, abs(torch_prediction['log_pi'].item() - numpy_prediction['log_pi'].item()))
+  return error
+
+def benchmark(f, num_runs=2000, num_trials=5):
+  # The best average latency (us) over num_trials trials
+  best_time = float('inf')
+  for _ in range(num_trials):
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+      f()
+    best_time = min(best_time, (time.perf_counter() - start_time) / num_runs * 1e6)
+  return best_time
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  torch.manual_seed(0)
+  np.random.seed(0)
+  for name, (net, state_shape) in make_dqn_nets().items():
+    numpy_net = make_numpy_net(net)
+    head_idx = 3 if isinstance(net, BootstrappedDQNNet) else None
+    # Compare action values on random states, with new noise each time for NoisyNet
+    error, same_action = 0, 0
+    for _ in range(1000):
+      if isinstance(net.feature_net, Conv2d_MinAtar):
+        state = (np.random.rand(*state_shape) < 0.1).astype(np.float32)
+      else:
+        state = np.random.randn(*state_shape)
+      if isinstance(getattr(net, 'value_net', None), NoisyMLPCritic):
+        net.value_net.reset_noise()
+      q_torch = torch_q_values(net, state, head_idx)
+      q_numpy = numpy_net(np.expand_dims(state, 0), head_idx).flatten()
+      error = max(error, np.abs(q_torch - q_numpy).max())
+      same_action += int(np.argmax(q_torch) == np.argmax(q_numpy))
+    torch_time = benchmark(lambda: np.argmax(torch_q_values(net, state, head_idx)))
+    numpy_time = benchmark(lambda: np.argmax(numpy_net(np.expand_dims(state, 0), head_idx).flatten()))
+    print(f'{name:>26}: max error={error:.1e}, same greedy action={same_action/10:.1f}%, latency per action: torch={torch_time:.1f} (us), numpy={numpy_time:.1f} (us), speedup={torch_time/numpy_time:.1f}x')
+  # Actors with outputs at the scale of trained actors, where a wrong output activation shows
+  scaled_nets = make_policy_nets(action_lim=2.0, last_w_scale=1.0)
+  for name, net in make_policy_nets().items():
+    numpy_net = make_numpy_net(net)
+    error = policy_error(net, numpy_net)
+    scaled_error = policy_error(scaled_nets[name], make_numpy_net(scaled_nets[name]))
+    state = np.random.randn(8)
+    torch_time = benchmark(lambda: torch_action(net, state))
+    numpy_time = benchmark(lambda: to_numpy(numpy_net(state)['action']))
+    print(f'{name:>26}: max error={error:.1e}, max error (trained scale)={scaled_error:.1e}, latency per action: torch={torch_time:.1f} (us), numpy={numpy_time:.1f} (us), speedup={torch_time/numpy_time:.1f}x')
@@ -0,0 +1,131 @@
+import os
+import sys
+import copy
+import time
+import torch
+import numpy as np
+import torch.nn as nn
+import torch.nn.functional as F
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import *
+from components.network import *
+from components.inference import *
+
+
+class DenseNoisyLinear(NoisyLinear):
+  '''
+  NoisyLinear before factorised noise: keeps the out x in weight_epsilon and builds the noisy weight in every training forward pass
+  '''
+  def __init__(self, layer):
+    nn.Module.__init__(self)
+    self.weight_mu, self.weight_sigma = layer.weight_mu, layer.weight_sigma
+    self.bias_mu, self.bias_sigma = layer.bias_mu, layer.bias_sigma
+    self.in_features, self.out_features = layer.in_features, layer.out_features
+    self.register_buffer('weight_epsilon', layer.weight_epsilon.clone())
+    self.register_buffer('bias_epsilon', layer.bias_epsilon.clone())
+
+  def _scale_noise(self, size):
+    x = torch.randn(size)
+    return x.sign().mul_(x.abs().sqrt_())
+
+  def reset_noise(self):
+    epsilon_in = self._scale_noise(self.in_features)
+    epsilon_out = self._scale_noise(self.out_features)
+    self.weight_epsilon.copy_(epsilon_out.outer(epsilon_in))
+    self.bias_epsilon.copy_(epsilon_out)
+
+  def forward(self, input):
+    if self.training:
+      return F.linear(input, self.weight_mu + self.weight_sigma * self.weight_epsilon, self.bias_mu + self.bias_sigma * self.bias_epsilon)
+    else:
+      return F.linear(input, self.weight_mu, self.bias_mu)
+
+  _load_from_state_dict = nn.Module._load_from_state_dict
+
+def make_net(hidden_layers, state_size=8, action_size=4):
+  # The same as NoisyNetDQN.createNN for feature inputs
+  return DQNNet(nn.Identity(), NoisyMLPCritic(layer_dims=[state_size]+hidden_layers+[action_size]))
+
+def to_dense(net):
+  # A copy of net with DenseNoisyLinear layers (sharing nothing with net)
+  net = copy.deepcopy(net)
+  mlp = net.value_net.value_net.mlp
+  for i, layer in enumerate(mlp):
+    if isinstance(layer, NoisyLinear):
+      mlp[i] = DenseNoisyLinear(layer)
+  return net
+
+def dense_numpy_net(net):
+  # NumPy mirror of a network with DenseNoisyLinear layers, the same as NumpyDQNNet before factorised noise
+  layers = []
+  for layer in net.value_net.value_net.mlp:
+    if isinstance(layer, DenseNoisyLinear):
+      arrays = [to_array(t) for t in [layer.weight_mu, layer.weight_sigma, layer.weight_epsilon, layer.bias_mu, layer.bias_sigma, layer.bias_epsilon]]
+      layers.append(lambda x, w_mu=arrays[0], w_sigma=arrays[1], w_eps=arrays[2], b_mu=arrays[3], b_sigma=arrays[4], b_eps=arrays[5]: x @ (w_mu + w_sigma * w_eps).T + (b_mu + b_sigma * b_eps))
+    else:
+      layers.append(numpy_activation(layer))
+  def forward(x):
+    for layer in layers:
+      x = layer(x)
+    return x
+  return forward
+
+def act(net, numpy_net, state):
+  # NoisyNetDQN.get_action in Train mode: reset noise and act with the NumPy mirror
+  net.value_net.reset_noise()
+  return np.argmax(numpy_net(state))
+
+def learn(net, target_net, optimizer, batch):
+  # NoisyNetDQN.learn: reset noise of both networks before computing q and q_target
+  net.value_net.reset_noise()
+  q = net(batch['state']).gather(1, batch['action'].unsqueeze(1)).squeeze(1)
+  target_net.value_net.reset_noise()
+  with torch.no_grad():
+    q_target = batch['reward'] + 0.99 * target_net(batch['next_state']).max(1)[0]
+  loss = nn.SmoothL1Loss()(q, q_target)
+  optimizer.zero_grad()
+  loss.backward()
+  optimizer.step()
+
+def benchmark(f, num_runs=100, num_trials=5):
+  # The best average time (us) per call over num_trials trials
+  best_time = float('inf')
+  for _ in range(num_trials):
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+      f()
+    best_time = min(best_time, (time.perf_counter() - start_time) / num_runs * 1e6)
+  return best_time
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  torch.manual_seed(0)
+  batch_size = 32
+  state = torch.randn(1, 8)
+  batch = {'state': torch.randn(batch_size, 8), 'action': torch.randint(4, (batch_size,)), 'reward': torch.randn(batch_size), 'next_state': torch.randn(batch_size, 8)}
+  for hidden_layers in [[64, 64], [512, 512], [1024, 1024]]:
+    net = make_net(hidden_layers)
+    dense_net = to_dense(net)
+    # The same noise gives the same action values and gradients, for acting and for learning
+    error, grad_error = 0, 0
+    for x in [state, batch['state']]:
+      q, dense_q = net(x), dense_net(x)
+      q.sum().backward()
+      dense_q.sum().backward()
+      error = max(error, (q - dense_q).abs().max().item())
+      grad_error = max(grad_error, max((p.grad - dense_p.grad).abs().max().item() for p, dense_p in zip(net.parameters(), dense_net.parameters())))
+      net.zero_grad()
+      dense_net.zero_grad()
+    # One agent step: act, then learn (with learn_freq=1)
+    times = {}
+    for name, x_net, numpy_net in [('dense', dense_net, dense_numpy_net(dense_net)), ('factorised', net, make_numpy_net(net))]:
+      target_net, optimizer = copy.deepcopy(x_net), torch.optim.Adam(x_net.parameters(), lr=1e-5)
+      times[name] = (benchmark(lambda: act(x_net, numpy_net, state.numpy()), num_runs=1000), benchmark(lambda: learn(x_net, target_net, optimizer, batch)))
+    (dense_act, dense_learn), (fac_act, fac_learn) = times['dense'], times['factorised']
+    print(f'hidden_layers={str(hidden_layers):<12}: max error={error:.1e}, max grad error={grad_error:.1e}')
+    print(f'  act: dense={dense_act:.0f} (us), factorised={fac_act:.0f} (us), speedup={dense_act/fac_act:.2f}x; learn: dense={dense_learn:.0f} (us), factorised={fac_learn:.0f} (us), speedup={dense_learn/fac_learn:.2f}x')
+    print(f'  steps/s: dense={1e6/(dense_act+dense_learn):.0f}, factorised={1e6/(fac_act+fac_learn):.0f}, speedup={(dense_act+dense_learn)/(fac_act+fac_learn):.2f}x')
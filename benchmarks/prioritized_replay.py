@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+import torch
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from components.replay import FiniteArrayReplay, PrioritizedReplay
+
+
+def benchmark_sampling(replay_class, memory_size, state_shape=(8,), batch_size=32, num_samples=1000):
+  '''
+  Return sample throughput (batches/s), including priority updates for PrioritizedReplay
+  '''
+  keys = ['state', 'action', 'next_state', 'reward', 'mask']
+  replay = replay_class(memory_size, keys=keys)
+  transition = {
+    'state': torch.rand(state_shape),
+    'action': torch.tensor(1.0),
+    'next_state': torch.rand(state_shape),
+    'reward': torch.tensor(1.0),
+    'mask': torch.tensor(1.0)
+  }
+  for _ in range(memory_size):
+    replay.add(transition)
+  start_time = time.perf_counter()
+  for _ in range(num_samples):
+    batch = replay.sample(keys, batch_size)
+    if replay.prioritized:
+      replay.update_priority(batch.idx, torch.randn(batch_size))
+  return num_samples / (time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  np.random.seed(0)
+  for memory_size in [int(1e4), int(1e5), int(1e6)]:
+    for replay_class in [FiniteArrayReplay, PrioritizedReplay]:
+      speed = benchmark_sampling(replay_class, memory_size)
+      print(f'{replay_class.__name__:>18} memory_size={memory_size:<7}: sample={speed:.0f} (batches/s)')
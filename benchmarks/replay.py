@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import torch
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from components.replay import FiniteReplay, FiniteArrayReplay, BitPackedReplay
+
+
+def make_transition(state_shape):
+  return {
+    'state': torch.rand(state_shape),
+    'action': torch.tensor(1.0),
+    'next_state': torch.rand(state_shape),
+    'reward': torch.tensor(1.0),
+    'mask': torch.tensor(1.0)
+  }
+
+def make_binary_transition(state_shape):
+  # Raw MinAtar observations are binary grids
+  return {
+    'state': np.random.rand(*state_shape) < 0.1,
+    'action': torch.tensor(1.0),
+    'next_state': np.random.rand(*state_shape) < 0.1,
+    'reward': torch.tensor(1.0),
+    'mask': torch.tensor(1.0)
+  }
+
+def bytes_per_transition(replay_class, state_shape):
+  keys = ['state', 'action', 'next_state', 'reward', 'mask']
+  replay = replay_class(100, keys=keys)
+  if replay.raw_state:
+    transition = make_binary_transition(state_shape)
+  else:
+    transition = make_transition(state_shape)
+  replay.add(transition)
+  if isinstance(replay, FiniteArrayReplay):
+    return replay.bytes_per_transition()
+  else:
+    return sum([v.element_size() * v.numel() for v in transition.values()])
+
+def benchmark_replay(replay_class, memory_size, state_shape, batch_size=32, num_samples=1000):
+  '''
+  Return add throughput (transitions/s) and sample throughput (batches/s)
+  '''
+  keys = ['state', 'action', 'next_state', 'reward', 'mask']
+  replay = replay_class(memory_size, keys=keys)
+  if replay.raw_state:
+    transition = make_binary_transition(state_shape)
+  else:
+    transition = make_transition(state_shape)
+  start_time = time.perf_counter()
+  for _ in range(memory_size):
+    replay.add(transition)
+  add_speed = memory_size / (time.perf_counter() - start_time)
+  start_time = time.perf_counter()
+  for _ in range(num_samples):
+    replay.sample(keys, batch_size)
+  sample_speed = num_samples / (time.perf_counter() - start_time)
+  return add_speed, sample_speed
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  np.random.seed(0)
+  # MinAtar (C, 10, 10) and feature-based states
+  for state_shape in [(4, 10, 10), (8,)]:
+    for memory_size in [int(1e4), int(1e5)]:
+      replay_classes = [FiniteReplay, FiniteArrayReplay, BitPackedReplay] if len(state_shape) == 3 else [FiniteReplay, FiniteArrayReplay]
+      for replay_class in replay_classes:
+        add_speed, sample_speed = benchmark_replay(replay_class, memory_size, state_shape)
+        print(f'{replay_class.__name__:>18} state={str(state_shape):<12} memory_size={memory_size:<7}: add={add_speed:.0f} (transitions/s), sample={sample_speed:.0f} (batches/s)')
+  # Memory usage of MinAtar transitions, e.g. Breakout (4 channels) and Seaquest (10 channels)
+  for state_shape in [(4, 10, 10), (10, 10, 10)]:
+    base = bytes_per_transition(FiniteReplay, state_shape)
+    for replay_class in [FiniteReplay, FiniteArrayReplay, BitPackedReplay]:
+      num_bytes = bytes_per_transition(replay_class, state_shape)
+      print(f'{replay_class.__name__:>18} state={str(state_shape):<12}: {num_bytes} (bytes/transition), reduction={base/num_bytes:.1f}x')
@@ -0,0 +1,119 @@
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import tempfile
+import torch
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import compute_returns, compute_gae, set_random_seed
+
+
+def loop_return_and_advantage(reward, mask, v, discount, gae):
+  # The per-step loop previously used in ActorCritic/PPO/RPG
+  steps = len(reward)
+  ret_list, adv_list = [None] * steps, [None] * steps
+  adv = torch.tensor(0.0)
+  ret = v[-1]
+  for i in reversed(range(steps)):
+    ret = reward[i] + discount * mask[i] * ret
+    td_error = reward[i] + discount * mask[i] * v[i+1] - v[i]
+    adv = discount * gae * mask[i] * adv + td_error
+    adv_list[i] = adv
+    ret_list[i] = ret
+  return torch.stack(ret_list), torch.stack(adv_list)
+
+def scan_return_and_advantage(reward, mask, v, discount, gae):
+  ret = compute_returns(torch.stack(reward), torch.stack(mask), v[-1], discount)
+  adv = compute_gae(torch.stack(reward), torch.stack(mask), torch.stack(v), discount, gae)
+  return ret, adv
+
+def benchmark(fn, steps, discount=0.99, gae=0.95, repeats=10):
+  # Per-step scalar tensors, the same as they are stored in the replay buffer
+  reward = list(torch.randn(steps))
+  mask = list((torch.rand(steps) > 0.01).float())
+  v = list(torch.randn(steps+1))
+  start_time = time.perf_counter()
+  for _ in range(repeats):
+    ret, adv = fn(reward, mask, v, discount, gae)
+  return (time.perf_counter() - start_time) / repeats * 1000, ret, adv
+
+def loop_compute_return_and_advantage(agent):
+  # ActorCritic.compute_return_and_advantage with the per-step loop
+  steps = agent.cfg['steps_per_epoch']
+  entries = agent.replay.get(['reward', 'mask'], steps)
+  v = agent.replay.get(['v'], steps+1, detach=True).v
+  ret, adv = loop_return_and_advantage(list(entries.reward), list(entries.mask), list(v), agent.discount, agent.cfg['gae'])
+  return ret.detach(), adv.detach()
+
+def benchmark_learn(agent_name, steps, num_epochs=3):
+  '''
+  Time the full learn() update of one epoch (returns, advantages and optimize_epochs passes of minibatch updates),
+  with the loop and with the scan, from the same rollout and the same network and optimizer states
+  '''
+  import agents
+  from main import make_config
+  from utils.sweeper import Sweeper
+  cfg = {
+    'env': [{'name': ['Pendulum-v1'], 'max_episode_steps': [-1], 'input_type': ['feature']}],
+    'agent': [{'name': [agent_name]}],
+    'train_steps': [steps * num_epochs], 'steps_per_epoch': [steps], 'test_per_epochs': [-1],
+    'optimizer': [{'name': ['Adam'], 'actor_kwargs': [{'lr': [3e-4]}], 'critic_kwargs': [{'lr': [1e-3]}]}],
+    'batch_size': [64], 'clip_ratio': [0.2], 'target_kl': [0.01], 'optimize_epochs': [10], 'gradient_clip': [2],
+    'hidden_layers': [[64, 64]], 'hidden_act': ['Tanh'], 'display_interval': [1000], 'rolling_score_window': [{'Train': [20], 'Test': [5]}],
+    'discount': [0.99], 'gae': [0.95], 'seed': [1], 'device': ['cpu'], 'show_tb': [False], 'generate_random_seed': [False]
+  }
+  cwd = os.getcwd()
+  work_dir = tempfile.mkdtemp()
+  os.chdir(work_dir)
+  try:
+    config_file = os.path.join(work_dir, 'bench_returns.json')
+    with open(config_file, 'w') as f:
+      json.dump(cfg, f)
+    cfg = make_config(Sweeper(config_file), config_file, 1)
+    set_random_seed(cfg['seed'])
+    agent = getattr(agents, agent_name)(cfg)
+    agent.env['Train'].seed(cfg['seed'])
+    times = {'loop': [], 'scan': []}
+    def timed_learn():
+      # Run learn with both versions from the same state, and keep the training state of the scan
+      modules = [agent.network] + list(agent.optimizer.values())
+      state_dicts = [copy.deepcopy(m.state_dict()) for m in modules]
+      normalizer_state = agent.state_normalizer.state_dict()
+      for name, compute in [('loop', loop_compute_return_and_advantage), ('scan', type(agent).compute_return_and_advantage)]:
+        for m, state_dict in zip(modules, state_dicts):
+          m.load_state_dict(state_dict)
+        agent.state_normalizer.load_state_dict(normalizer_state)
+        agent.compute_return_and_advantage = lambda compute=compute: compute(agent)
+        torch.manual_seed(0)
+        np.random.seed(0)
+        start_time = time.perf_counter()
+        type(agent).learn(agent)
+        times[name].append(time.perf_counter() - start_time)
+    agent.learn = timed_learn
+    agent.run_steps()
+    return np.mean(times['loop']) * 1000, np.mean(times['scan']) * 1000
+  finally:
+    os.chdir(cwd)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  for steps in [2048, 16384]:
+    torch.manual_seed(0)
+    loop_time, loop_ret, loop_adv = benchmark(loop_return_and_advantage, steps)
+    torch.manual_seed(0)
+    scan_time, scan_ret, scan_adv = benchmark(scan_return_and_advantage, steps)
+    error = max((loop_ret-scan_ret).abs().max().item(), (loop_adv-scan_adv).abs().max().item())
+    print(f'steps_per_epoch={steps:<6}: loop={loop_time:.2f} (ms), scan={scan_time:.2f} (ms), max abs error={error:.2e}')
+  # The full epoch update: the returns and advantages are a part of learn()
+  for agent_name in ['ActorCritic', 'PPO']:
+    for steps in [2048]:
+      loop_time, scan_time = benchmark_learn(agent_name, steps)
+      print(f'{agent_name:>11} learn() with steps_per_epoch={steps:<6}: loop={loop_time:.2f} (ms), scan={scan_time:.2f} (ms), speedup={loop_time/scan_time:.2f}x')
@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.scheduler import Scheduler, LocalBackend
+
+
+exp = 'bench_scheduler'
+
+def make_command(run_times, fail_once):
+  # A fake run: sleep for its run time; runs in fail_once fail on the first attempt (a marker file remembers the attempt)
+  def command(config_idx):
+    code = f'import time, sys, os; time.sleep({run_times[config_idx]})\n'
+    if config_idx in fail_once:
+      code += f'if not os.path.exists("failed_{config_idx}"):\n  open("failed_{config_idx}", "w").close(); sys.exit(1)\n'
+    return [sys.executable, '-c', code]
+  return command
+
+def write_logs(run_times):
+  # Logs of an earlier sweep, as written by Experiment.run, for the priorities
+  for config_idx, run_time in run_times.items():
+    os.makedirs(f'./logs/{exp}/{config_idx}/', exist_ok=True)
+    with open(f'./logs/{exp}/{config_idx}/log.txt', 'w') as f:
+      f.write(f'2022-01-01 00:00:00,000 - INFO: Time elapsed: {run_time/60:.6f} minutes\n')
+
+
+class TimedLocalBackend(LocalBackend):
+  '''
+  LocalBackend that records when each run finishes
+  '''
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.start_time = time.perf_counter()
+    self.finish_times = {}
+
+  def get_events(self):
+    events = super().get_events()
+    for config_idx, returncode, _ in events:
+      if returncode == 0:
+        self.finish_times[config_idx] = time.perf_counter() - self.start_time
+    return events
+
+
+def run_polling(job_list, command, num_workers, check_time_interval):
+  '''
+  The job loop of the old Submitter on this machine: every check_time_interval, count the running jobs and
+  fill the free capacity with the next jobs in the list; failed jobs are not retried
+  '''
+  start_time = time.perf_counter()
+  job_list, processes, finish_times = list(job_list), {}, {}
+  while len(job_list) > 0 or len(processes) > 0:
+    for config_idx, p in list(processes.items()):
+      if p.poll() is not None:
+        if p.returncode == 0:
+          finish_times[config_idx] = time.perf_counter() - start_time
+        del processes[config_idx]
+    num_jobs = min(num_workers - len(processes), len(job_list))
+    for config_idx in job_list[:num_jobs]:
+      processes[config_idx] = subprocess.Popen(command(config_idx))
+    job_list = job_list[num_jobs:]
+    time.sleep(check_time_interval)
+  return finish_times
+
+def run_scheduler(job_list, command, num_workers, priority):
+  backend = TimedLocalBackend(exp, num_workers, command=command)
+  scheduler = Scheduler(exp, {'job-list': job_list, 'priority': priority, 'max-retries': 1}, backend)
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    scheduler.run()
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+  return backend.finish_times
+
+def summary(name, finish_times, num_jobs):
+  if len(finish_times) == 0:
+    return f'{name:>28}: no runs finished'
+  times = list(finish_times.values())
+  return f'{name:>28}: finished runs={len(times)}/{num_jobs}, sweep time={max(times):.2f} (s), mean time until a run finishes={np.mean(times):.2f} (s)'
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Sweep time with the local backend: squeue-style polling vs. the event-driven scheduler")
+  parser.add_argument('--num_jobs', type=int, default=32)
+  parser.add_argument('--num_workers', type=int, default=4)
+  parser.add_argument('--mean_run_time', type=float, default=1.0, help='Mean run time of a fake run (s)')
+  parser.add_argument('--check_time_interval', type=float, default=0.25, help='Check time interval of polling (s)')
+  parser.add_argument('--num_failures', type=int, default=2, help='Number of runs that fail on the first attempt')
+  args = parser.parse_args()
+  # Long-tailed run times (with mean mean_run_time), as in sweeps over environments and hyper-parameters
+  rng = np.random.RandomState(0)
+  job_list = list(range(1, args.num_jobs+1))
+  run_times = {config_idx: t for config_idx, t in zip(job_list, args.mean_run_time * rng.lognormal(-0.5, 1.0, args.num_jobs))}
+  fail_once = set(rng.choice(job_list, args.num_failures, replace=False).tolist())
+  print(f'{args.num_jobs} fake runs on {args.num_workers} workers: run time min={min(run_times.values()):.2f}, mean={np.mean(list(run_times.values())):.2f}, max={max(run_times.values()):.2f} (s); runs failing once: {sorted(fail_once)}')
+  print(f'Lower bound of the sweep time: {max(sum(run_times.values())/args.num_workers, max(run_times.values())):.2f} (s)')
+  cwd = os.getcwd()
+  work_dir = tempfile.mkdtemp()
+  os.chdir(work_dir)
+  try:
+    write_logs(run_times)
+    runs = [(f'polling ({args.check_time_interval} s)', lambda command: run_polling(job_list, command, args.num_workers, args.check_time_interval))]
+    for priority in ['fifo', 'shortest-first', 'longest-first']:
+      runs.append((f'scheduler ({priority})', lambda command, priority=priority: run_scheduler(job_list, command, args.num_workers, priority)))
+    for name, run in runs:
+      for config_idx in fail_once:
+        if os.path.exists(f'failed_{config_idx}'):
+          os.remove(f'failed_{config_idx}')
+      finish_times = run(make_command(run_times, fail_once))
+      print(summary(name, finish_times, args.num_jobs))
+  finally:
+    os.chdir(cwd)
+    shutil.rmtree(work_dir, ignore_errors=True)
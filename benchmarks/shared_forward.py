@@ -0,0 +1,120 @@
+import os
+import sys
+import copy
+import time
+import torch
+import torch.nn as nn
+from collections import namedtuple
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import *
+from components.network import *
+
+
+Batch = namedtuple('Batch', ['state', 'action', 'reward', 'next_state', 'mask'])
+discount = 0.99
+
+def make_net(in_channels=4, action_size=6, feature_dim=128):
+  # The same as VanillaDQN.createNN for MinAtar with hidden_layers=[]
+  feature_net = Conv2d_MinAtar(in_channels=in_channels, feature_dim=feature_dim)
+  value_net = MLPCritic(layer_dims=[feature_dim, action_size], last_w_scale=1.0)
+  return DQNNet(feature_net, value_net)
+
+def step(net, optimizer, loss):
+  optimizer.zero_grad()
+  loss.backward()
+  optimizer.step()
+  return loss.item()
+
+# Learn steps before shared forward passes: one forward pass per input
+def vanilla_separate(net, target_net, optimizer, batch, sample_states):
+  q = net(batch.state).gather(1, batch.action.unsqueeze(1)).squeeze()
+  with torch.no_grad():
+    q_target = batch.reward + discount * net(batch.next_state).max(1)[0] * batch.mask
+  return [step(net, optimizer, nn.SmoothL1Loss()(q, q_target))]
+
+def ddqn_separate(net, target_net, optimizer, batch, sample_states):
+  q = net(batch.state).gather(1, batch.action.unsqueeze(1)).squeeze()
+  with torch.no_grad():
+    best_actions = net(batch.next_state).argmax(1).unsqueeze(1)
+    q_next = target_net(batch.next_state).gather(1, best_actions).squeeze()
+    q_target = batch.reward + discount * q_next * batch.mask
+  return [step(net, optimizer, nn.SmoothL1Loss()(q, q_target))]
+
+def medqn_separate(net, target_net, optimizer, batch, sample_states, lamda=1.0):
+  with torch.no_grad():
+    q_target = batch.reward + discount * target_net(batch.next_state).max(1)[0] * batch.mask
+  losses = []
+  for sample_state in sample_states:
+    q = net(batch.state).gather(1, batch.action.unsqueeze(1)).squeeze()
+    loss = nn.SmoothL1Loss()(q, q_target)
+    loss += lamda * nn.MSELoss()(net(sample_state).squeeze(), target_net(sample_state).squeeze().detach())
+    losses.append(step(net, optimizer, loss))
+  return losses
+
+# Learn steps with shared forward passes, as in VanillaDQN, DDQN and MeDQN_Real
+def vanilla_shared(net, target_net, optimizer, batch, sample_states):
+  q_all, q_next_all = shared_forward(net, [batch.state, batch.next_state])
+  q = q_all.gather(1, batch.action.unsqueeze(1)).squeeze()
+  with torch.no_grad():
+    q_target = batch.reward + discount * q_next_all.detach().max(1)[0] * batch.mask
+  return [step(net, optimizer, nn.SmoothL1Loss()(q, q_target))]
+
+def ddqn_shared(net, target_net, optimizer, batch, sample_states):
+  q_all, q_next_all = shared_forward(net, [batch.state, batch.next_state])
+  q = q_all.gather(1, batch.action.unsqueeze(1)).squeeze()
+  with torch.no_grad():
+    best_actions = q_next_all.argmax(1).unsqueeze(1)
+    q_next = target_net(batch.next_state).gather(1, best_actions).squeeze()
+    q_target = batch.reward + discount * q_next * batch.mask
+  return [step(net, optimizer, nn.SmoothL1Loss()(q, q_target))]
+
+def medqn_shared(net, target_net, optimizer, batch, sample_states, lamda=1.0):
+  with torch.no_grad():
+    q_next_all, *q_sample_targets = shared_forward(target_net, [batch.next_state] + sample_states)
+    q_target = batch.reward + discount * q_next_all.max(1)[0] * batch.mask
+  losses = []
+  for sample_state, q_sample_target in zip(sample_states, q_sample_targets):
+    q_all, q_sample = shared_forward(net, [batch.state, sample_state])
+    q = q_all.gather(1, batch.action.unsqueeze(1)).squeeze()
+    loss = nn.SmoothL1Loss()(q, q_target)
+    loss += lamda * nn.MSELoss()(q_sample.squeeze(), q_sample_target.squeeze())
+    losses.append(step(net, optimizer, loss))
+  return losses
+
+def benchmark(learn_step, net, target_net, batch, sample_states, num_runs=100, num_trials=5):
+  optimizer = torch.optim.RMSprop(net.parameters(), lr=1e-5)
+  best_time = float('inf')
+  for _ in range(num_trials):
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+      learn_step(net, target_net, optimizer, batch, sample_states)
+    best_time = min(best_time, (time.perf_counter() - start_time) / num_runs * 1e6)
+  return best_time
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  torch.manual_seed(0)
+  batch_size, consod_epoch = 32, 4
+  for in_channels in [4, 10]:
+    net, target_net = make_net(in_channels), make_net(in_channels)
+    batch = Batch(
+      state=torch.rand(batch_size, in_channels, 10, 10),
+      action=torch.randint(6, (batch_size,)),
+      reward=torch.rand(batch_size),
+      next_state=torch.rand(batch_size, in_channels, 10, 10),
+      mask=torch.ones(batch_size)
+    )
+    sample_states = [torch.rand(batch_size, in_channels, 10, 10) for _ in range(consod_epoch)]
+    for name, separate, shared in [('VanillaDQN', vanilla_separate, vanilla_shared), ('DDQN', ddqn_separate, ddqn_shared), (f'MeDQN (epoch={consod_epoch})', medqn_separate, medqn_shared)]:
+      # Losses of the same updates from the same weights should match
+      net_1, net_2 = copy.deepcopy(net), copy.deepcopy(net)
+      losses_1 = separate(net_1, target_net, torch.optim.SGD(net_1.parameters(), lr=1e-3), batch, sample_states)
+      losses_2 = shared(net_2, target_net, torch.optim.SGD(net_2.parameters(), lr=1e-3), batch, sample_states)
+      error = max([abs(x-y) for x, y in zip(losses_1, losses_2)])
+      separate_time = benchmark(separate, copy.deepcopy(net), target_net, batch, sample_states)
+      shared_time = benchmark(shared, copy.deepcopy(net), target_net, batch, sample_states)
+      print(f'channels={in_channels:<2} {name:>18}: max loss difference={error:.1e}, learn step: separate={separate_time:.0f} (us), shared={shared_time:.0f} (us), speedup={separate_time/shared_time:.2f}x')
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.status import collect_status, write_json
+
+
+exp = 'bench_status'
+
+def write_runs(num_runs, log_lines, finished_ratio):
+  '''
+  Fake logs of an experiment with num_runs config indexes (and a config file with num_runs combinations):
+  log files with log_lines lines, ending with the memory and time info for finished runs, and status files
+  '''
+  os.makedirs('./configs', exist_ok=True)
+  with open(f'./configs/{exp}.json', 'w') as f:
+    json.dump({'env': [{'name': ['Env']}], 'seed': list(range(num_runs))}, f)
+  line = '2022-01-01 00:00:00,000 - INFO: <1> [Train] Episode 100, Step 10000: Average Return(100)=1.00, Return=1.00, Speed=100.00 (steps/s), ETA=10.00 (mins)\n'
+  rng = np.random.RandomState(0)
+  for config_idx in range(1, num_runs+1):
+    run_dir = f'./logs/{exp}/{config_idx}/'
+    os.makedirs(run_dir, exist_ok=True)
+    finished = rng.rand() < finished_ratio
+    memory, run_time = rng.uniform(500, 1000), rng.uniform(10, 100)
+    with open(run_dir + 'log.txt', 'w') as f:
+      f.write(line * log_lines)
+      if finished:
+        f.write(f'2022-01-01 00:00:00,000 - INFO: Memory usage: {memory:.2f} MB\n')
+        f.write(f'2022-01-01 00:00:00,000 - INFO: Time elapsed: {run_time:.2f} minutes\n')
+    status = {'config_idx': config_idx, 'state': 'done' if finished else 'running', 'step': 10000, 'train_steps': 10000, 'steps_per_sec': 100.0, 'memory': memory, 'peak_memory': memory, 'time': run_time, 'exit_reason': 'finished' if finished else None, 'host': 'node', 'updated': time.time()}
+    write_json(status, run_dir + 'status.json')
+
+def read_last_lines(log_file, max_line_length=10000):
+  # The last lines of a log file, read as unfinished_index, time_info and memory_info did before status files
+  with open(log_file, 'r') as f:
+    try:
+      f.seek(-max_line_length, os.SEEK_END)
+    except IOError:
+      f.seek(0)
+    return f.readlines()
+
+def tail_parse(num_runs):
+  '''
+  unfinished_index, time_info and memory_info before status files: three passes over the log files
+  '''
+  unfinished, time_list, mem_list = [], [], []
+  for i in range(num_runs):
+    try:
+      float(read_last_lines(f'./logs/{exp}/{i+1}/log.txt')[-1].split(' ')[-2])
+    except Exception:
+      unfinished.append(i+1)
+  for i in range(num_runs):
+    try:
+      time_list.append(float(read_last_lines(f'./logs/{exp}/{i+1}/log.txt')[-1].split(' ')[-2]))
+    except Exception:
+      continue
+  for i in range(num_runs):
+    try:
+      mem_list.append(float(read_last_lines(f'./logs/{exp}/{i+1}/log.txt')[-2].split(' ')[-2]))
+    except Exception:
+      continue
+  return unfinished, time_list, mem_list
+
+def from_status_table(num_runs):
+  # The same results from the status table, built in one pass
+  table = collect_status(exp, save=False)
+  done = table['state'] == 'done'
+  return list(table.index[~done]), list(table['time'][done]), list(table['peak_memory'][done])
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Reading the status of all runs of an experiment: tail-parsing log files vs. status files")
+  parser.add_argument('--num_runs', type=int, default=20000)
+  parser.add_argument('--log_lines', type=int, default=1000, help='Number of lines in a log file')
+  parser.add_argument('--finished_ratio', type=float, default=0.9)
+  args = parser.parse_args()
+  cwd = os.getcwd()
+  work_dir = tempfile.mkdtemp()
+  os.chdir(work_dir)
+  try:
+    write_runs(args.num_runs, args.log_lines, args.finished_ratio)
+    for name, read in [('tail-parse log files (3 passes)', tail_parse), ('status table (1 pass)', from_status_table)]:
+      start_time = time.perf_counter()
+      unfinished, time_list, mem_list = read(args.num_runs)
+      duration = time.perf_counter() - start_time
+      print(f'{name:>32} ({args.num_runs} runs): {duration:.2f} (s), {len(unfinished)} unfinished, mean time={np.mean(time_list):.2f} (min), mean memory={np.mean(mem_list):.2f} (MB)')
+  finally:
+    os.chdir(cwd)
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.sweeper import Sweeper, isin
+
+
+class WalkSweeper(Sweeper):
+  '''
+  Sweeper before the combination index: walks the config dict and recounts the combinations of every list
+  '''
+  def generate_config_for_idx(self, idx):
+    cfg = self.get_dict_value(self.config_dicts, (idx-1) % self.config_dicts['num_combinations'])
+    cfg['config_idx'] = idx
+    cfg['num_combinations'] = self.config_dicts['num_combinations']
+    return cfg
+
+  def get_list_value(self, config_list, idx):
+    for value in config_list:
+      if type(value) == dict:
+        if idx + 1 - value['num_combinations'] <= 0:
+          return self.get_dict_value(value, idx)
+        else:
+          idx -= value['num_combinations']
+      else:
+        if idx == 0:
+          return value
+        else:
+          idx -= 1
+
+  def get_dict_value(self, config_dict, idx):
+    cfg = dict()
+    for key, values in config_dict.items():
+      if key == 'num_combinations':
+        continue
+      num_combinations_of_list = self.get_num_combinations_of_list(values)
+      value = self.get_list_value(values, idx % num_combinations_of_list)
+      cfg[key] = value
+      idx = idx // num_combinations_of_list
+    return cfg
+
+def find_by_brute_force(sweeper, predicate):
+  # find_config.py before where: decode every index and test the config
+  return [i for i in range(1, 1+sweeper.config_dicts['num_combinations']) if predicate(sweeper.generate_config_for_idx(i))]
+
+
+def compare(config_name, config_file):
+  sweeper, walk_sweeper = Sweeper(config_file), WalkSweeper(config_file)
+  n = sweeper.config_dicts['num_combinations']
+  # Decode all indexes (and a few beyond, as for multiple runs)
+  start_time = time.perf_counter()
+  walk_cfgs = [walk_sweeper.generate_config_for_idx(i) for i in range(1, n+3)]
+  walk_time = time.perf_counter() - start_time
+  start_time = time.perf_counter()
+  cfgs = [sweeper.generate_config_for_idx(i) for i in range(1, n+3)]
+  index_time = time.perf_counter() - start_time
+  assert cfgs == walk_cfgs, config_name
+  # Query: configs of the first environment with the first agent
+  env_name, agent_name = cfgs[0]['env']['name'], cfgs[0]['agent']['name']
+  start_time = time.perf_counter()
+  brute_force = find_by_brute_force(walk_sweeper, lambda cfg: cfg['env']['name'] == env_name and cfg['agent']['name'] == agent_name)
+  brute_force_time = time.perf_counter() - start_time
+  start_time = time.perf_counter()
+  query_sweeper = Sweeper(config_file)
+  found = query_sweeper.where(lambda c: c['env.name'] == env_name, lambda c: isin(c['agent.name'], [agent_name]))
+  where_time = time.perf_counter() - start_time
+  assert list(found) == brute_force, config_name
+  print(f'{config_name:>28} ({n:>5} combinations): decode all: walk={walk_time*1e3:.1f} (ms), indexed={index_time*1e3:.1f} (ms), speedup={walk_time/index_time:.1f}x; query: brute force={brute_force_time*1e3:.1f} (ms), where (with a new Sweeper)={where_time*1e3:.1f} (ms), speedup={brute_force_time/where_time:.1f}x')
+
+
+if __name__ == "__main__":
+  config_dir = os.path.join(parentdir, 'configs')
+  for config_name in sorted(os.listdir(config_dir)):
+    if config_name.endswith('.json'):
+      compare(config_name, os.path.join(config_dir, config_name))
+  # A sweep of about 14k combinations: MERL_mc_medqn.json with 6 seeds
+  with open(os.path.join(config_dir, 'MERL_mc_medqn.json'), 'r') as f:
+    cfg = json.load(f)
+  cfg['seed'] = list(range(1, 7))
+  with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+    json.dump(cfg, f)
+    f.flush()
+    compare('MERL_mc_medqn.json x6 seeds', f.name)
@@ -0,0 +1,65 @@
+import os
+import sys
+import copy
+import time
+import torch
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from components.network import *
+
+
+def make_nets(state_size=8, action_size=2, hidden_layers=[256, 256]):
+  # Networks with target networks: DQN family (MinAtar and feature inputs) and SAC/DDPG/TD3
+  layer_dims = [state_size] + hidden_layers
+  return {
+    'DQN (MinAtar)': lambda: DQNNet(Conv2d_MinAtar(in_channels=4), MLPCritic(layer_dims=[128, 6], last_w_scale=1.0)),
+    'DQN (feature)': lambda: DQNNet(nn.Identity(), MLPCritic(layer_dims=[8, 64, 64, 6], last_w_scale=1.0)),
+    'SAC': lambda: ActorDoubleQCriticNet(nn.Identity(), MLPSquashedGaussianActor(action_lim=1.0, layer_dims=layer_dims+[2*action_size], rsample=True), MLPDoubleQCritic(layer_dims=[state_size+action_size]+hidden_layers+[1])),
+    'DDPG/TD3': lambda: ActorQCriticNet(nn.Identity(), MLPDeterministicActor(action_lim=1.0, layer_dims=layer_dims+[action_size]), MLPQCritic(layer_dims=[state_size+action_size]+hidden_layers+[1]))
+  }
+
+def loop_soft_update(network, network_target, polyak):
+  # SAC.soft_update before flat parameters
+  with torch.no_grad():
+    for p, p_target in zip(network.parameters(), network_target.parameters()):
+      p_target.data.mul_(polyak)
+      p_target.data.add_((1-polyak)*p.data)
+
+def benchmark(f, num_runs=2000, num_trials=5):
+  # The best average time (us) per call over num_trials trials
+  best_time = float('inf')
+  for _ in range(num_trials):
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+      f()
+    best_time = min(best_time, (time.perf_counter() - start_time) / num_runs * 1e6)
+  return best_time
+
+
+if __name__ == "__main__":
+  torch.set_num_threads(1)
+  torch.manual_seed(0)
+  polyak = 0.995
+  for name, make_net in make_nets().items():
+    net, target_net = make_net(), make_net()
+    flat_net, flat_target_net = flatten_parameters(copy.deepcopy(net)), flatten_parameters(copy.deepcopy(target_net))
+    # Both updates should give the same target networks as before
+    target_net.load_state_dict(net.state_dict())
+    hard_update(flat_target_net, flat_net)
+    hard_error = max((p - q).abs().max().item() for p, q in zip(target_net.parameters(), flat_target_net.parameters()))
+    for p, q in zip(net.parameters(), flat_net.parameters()):
+      p.data.add_(torch.randn_like(p))
+      q.data.copy_(p.data)
+    for _ in range(100):
+      loop_soft_update(net, target_net, polyak)
+      soft_update(flat_target_net, flat_net, polyak)
+    soft_error = max((p - q).abs().max().item() for p, q in zip(target_net.parameters(), flat_target_net.parameters()))
+    load_time = benchmark(lambda: target_net.load_state_dict(net.state_dict()))
+    copy_time = benchmark(lambda: hard_update(flat_target_net, flat_net))
+    loop_time = benchmark(lambda: loop_soft_update(net, target_net, polyak))
+    lerp_time = benchmark(lambda: soft_update(flat_target_net, flat_net, polyak))
+    num_params = flat_net.flat_params.numel()
+    print(f'{name:>14} ({num_params} params): hard sync: load_state_dict={load_time:.1f} (us), flat copy_={copy_time:.1f} (us), speedup={load_time/copy_time:.1f}x, max error={hard_error:.1e}')
+    print(f'{"":>14} {"":>{len(str(num_params))+9}}  polyak: loop={loop_time:.1f} (us), flat lerp_={lerp_time:.1f} (us), speedup={loop_time/lerp_time:.1f}x, max error after 100 updates={soft_error:.1e}')
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import torch
+import torch.nn as nn
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.sys.path.insert(0, parentdir)
+
+from utils.helper import *
+from components.network import *
+
+
+def make_nets(action_size=6):
+  # Q networks as made by VanillaDQN.createNN for Atari and for feature inputs
+  return {
+    'Conv2d_Atari': (lambda: DQNNet(Conv2d_Atari(in_channels=4, feature_dim=512), MLPCritic(layer_dims=[512, action_size], last_w_scale=1.0)), (4, 84, 84)),
+    'MLP [64, 64]': (lambda: DQNNet(nn.Identity(), MLPCritic(layer_dims=[8, 64, 64, action_size], last_w_scale=1.0)), (8,)),
+    'MLP [512, 512]': (lambda: DQNNet(nn.Identity(), MLPCritic(layer_dims=[8, 512, 512, action_size], last_w_scale=1.0)), (8,))
+  }
+
+def agent_step(net, target_net, optimizer, state, batch):
+  # One DQN step: act on one state, then learn on a mini-batch
+  with torch.no_grad():
+    action = net(state).argmax(1)
+  q = net(batch['state']).gather(1, batch['action'].unsqueeze(1)).squeeze(1)
+  with torch.no_grad():
+    q_target = batch['reward'] + 0.99 * target_net(batch['next_state']).max(1)[0]
+  loss = nn.SmoothL1Loss()(q, q_target)
+  optimizer.zero_grad()
+  loss.backward()
+  optimizer.step()
+  return action
+
+def benchmark(f, num_runs=20, num_trials=3):
+  # The best number of calls per second over num_trials trials
+  best_time = float('inf')
+  for _ in range(num_trials):
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+      f()
+    best_time = min(best_time, (time.perf_counter() - start_time) / num_runs)
+  return 1 / best_time
+
+
+if __name__ == "__main__":
+  torch.manual_seed(0)
+  num_cores = get_num_cores()
+  thread_counts = [n for n in [1, 2, 4, 8, 16, 32, 64] if n <= max(num_cores, 2)]
+  batch_size = 32
+  print(f'Cores: {num_cores}; thread budget of one job: {get_thread_budget(1)}, of each of 4 concurrent jobs: {get_thread_budget(4)}')
+  print(f'{"steps/s":>16}' + ''.join(f'{f"threads={n}":>12}' for n in thread_counts))
+  for name, (make_net, state_shape) in make_nets().items():
+    net, target_net = make_net(), make_net()
+    optimizer = torch.optim.Adam(net.parameters(), lr=1e-4)
+    state = torch.rand(1, *state_shape)
+    batch = {'state': torch.rand(batch_size, *state_shape), 'action': torch.randint(6, (batch_size,)), 'reward': torch.rand(batch_size), 'next_state': torch.rand(batch_size, *state_shape)}
+    speeds = []
+    for num_threads in thread_counts:
+      set_num_threads(num_threads)
+      speeds.append(benchmark(lambda: agent_step(net, target_net, optimizer, state, batch), num_runs=5 if 'Conv' in name else 50))
+    print(f'{name:>16}' + ''.join(f'{speed:>12.1f}' for speed in speeds))
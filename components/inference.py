@@ -0,0 +1,244 @@
+'''
+NumPy mirrors of small networks (MLPs and Conv2d_MinAtar) for acting.
+Selecting an action for one state is dominated by the overhead of torch (tensor conversion, module calls
+and autograd bookkeeping); a mirror computes the same forward pass with NumPy instead.
+The arrays of a mirror are views of the CPU parameters, so they follow optimizer steps and load_state_dict
+without copying. A mirror becomes stale when parameters are replaced (e.g. moved to another device), see is_current.
+'''
+
+import math
+import torch
+import numpy as np
+import torch.nn as nn
+from numpy.lib.stride_tricks import sliding_window_view
+
+from components.network import *
+
+
+def to_array(t):
+  # A NumPy view of a CPU float32 tensor
+  if t.device.type != 'cpu' or t.dtype != torch.float32:
+    raise NotImplementedError(f'Only CPU float32 tensors are supported, got {t.dtype} on {t.device}.')
+  return t.detach().numpy()
+
+def squeeze(x):
+  # The same as torch's squeeze(-1), which keeps the last axis if its size is not 1
+  return x[..., 0] if x.shape[-1] == 1 else x
+
+def softplus(x):
+  return np.logaddexp(0, x)
+
+def numpy_activation(act):
+  # NumPy version of an activation in components.network.activations
+  if isinstance(act, nn.Identity):
+    return lambda x: x
+  elif isinstance(act, nn.ReLU):
+    return lambda x: np.maximum(x, 0)
+  elif isinstance(act, nn.Tanh):
+    return np.tanh
+  elif isinstance(act, nn.Sigmoid):
+    return lambda x: 0.5 * (1 + np.tanh(0.5 * x))
+  elif isinstance(act, nn.Hardsigmoid):
+    return lambda x: np.clip(x / 6 + 0.5, 0, 1)
+  elif isinstance(act, nn.ELU):
+    return lambda x: np.where(x > 0, x, act.alpha * np.expm1(np.minimum(x, 0)))
+  elif isinstance(act, nn.LeakyReLU):
+    return lambda x: np.where(x > 0, x, act.negative_slope * x)
+  elif isinstance(act, nn.Softplus):
+    return lambda x: softplus(act.beta * x) / act.beta
+  elif isinstance(act, nn.Softmax):
+    def softmax(x):
+      y = np.exp(x - x.max(axis=act.dim, keepdims=True))
+      return y / y.sum(axis=act.dim, keepdims=True)
+    return softmax
+  raise NotImplementedError(f'{type(act).__name__} is not supported.')
+
+def numpy_linear(layer):
+  weight_t, bias = to_array(layer.weight).T, to_array(layer.bias)
+  return lambda x: x @ weight_t + bias
+
+def numpy_noisy_linear(layer):
+  weight_mu_t, weight_sigma_t, epsilon_in = to_array(layer.weight_mu).T, to_array(layer.weight_sigma).T, to_array(layer.epsilon_in)
+  bias_mu, bias_sigma, bias_epsilon = to_array(layer.bias_mu), to_array(layer.bias_sigma), to_array(layer.bias_epsilon)
+  def forward(x):
+    # The same as NoisyLinear.forward: factorised noise in training mode
+    if layer.training:
+      return x @ weight_mu_t + ((x * epsilon_in) @ weight_sigma_t) * bias_epsilon + (bias_mu + bias_sigma * bias_epsilon)
+    else:
+      return x @ weight_mu_t + bias_mu
+  return forward
+
+def numpy_conv2d(conv):
+  if conv.stride != (1, 1) or conv.padding != (0, 0) or conv.dilation != (1, 1) or conv.groups != 1:
+    raise NotImplementedError('Only Conv2d with stride 1, no padding and no dilation is supported.')
+  weight_t, bias = to_array(conv.weight).reshape(conv.out_channels, -1).T, to_array(conv.bias)
+  kernel_size = conv.kernel_size
+  def forward(x):
+    # (B, C, H, W) -> (B, H', W', C, kh, kw) windows -> (B, H'*W', out) -> (B, out, H', W')
+    windows = sliding_window_view(x, kernel_size, axis=(2, 3)).transpose(0, 2, 3, 1, 4, 5)
+    B, H, W = windows.shape[:3]
+    y = windows.reshape(B, H * W, -1) @ weight_t + bias
+    return y.transpose(0, 2, 1).reshape(B, -1, H, W)
+  return forward
+
+def numpy_module(module):
+  '''
+  Return a NumPy function with the same forward pass as module, or raise NotImplementedError
+  '''
+  if isinstance(module, nn.Sequential):
+    layers = [numpy_module(layer) for layer in module]
+    def forward(x):
+      for layer in layers:
+        x = layer(x)
+      return x
+    return forward
+  elif isinstance(module, nn.Linear):
+    return numpy_linear(module)
+  elif isinstance(module, NoisyLinear):
+    return numpy_noisy_linear(module)
+  elif isinstance(module, (MLP, NoisyMLP)):
+    return numpy_module(module.mlp)
+  elif isinstance(module, (MLPCritic, NoisyMLPCritic)):
+    value_net = numpy_module(module.value_net)
+    return lambda phi: squeeze(value_net(phi))
+  elif isinstance(module, Conv2d_MinAtar):
+    conv1, fc2 = numpy_conv2d(module.conv1), numpy_linear(module.fc2)
+    def forward(x):
+      if x.ndim == 3:
+        x = x[None]
+      y = np.maximum(conv1(x), 0).reshape(len(x), -1)
+      return np.maximum(fc2(y), 0)
+    return forward
+  elif isinstance(module, nn.Identity):
+    return lambda x: x
+  return numpy_activation(module)
+
+def numpy_heads(heads_net, head_idx):
+  # NumPy function of one head of a MultiHeadMLPCritic
+  layers = []
+  for weight, bias, act in zip(heads_net.weights, heads_net.biases, heads_net.acts):
+    layers.append((to_array(weight)[head_idx].T, to_array(bias)[head_idx], numpy_activation(act)))
+  def forward(phi):
+    for weight_t, bias, act in layers:
+      phi = act(phi @ weight_t + bias)
+    return squeeze(phi)
+  return forward
+
+def normal_log_prob(x, mean, std):
+  # The same as Normal(mean, std).log_prob(x)
+  return -((x - mean) ** 2) / (2 * std ** 2) - np.log(std) - 0.5 * math.log(2 * math.pi)
+
+
+class NumpyNet(object):
+  '''
+  Base class of NumPy mirrors: keeps the tensors of the network to check that the mirror is current
+  '''
+  def __init__(self, net):
+    self.tensors = [(t, t.data_ptr()) for t in list(net.parameters()) + list(net.buffers())]
+
+  def is_current(self):
+    # The mirror is stale if a tensor of the network got new storage (e.g. moved with .to or share_memory_)
+    return all(t.data_ptr() == ptr for t, ptr in self.tensors)
+
+
+class NumpyDQNNet(NumpyNet):
+  '''
+  NumPy mirror of DQNNet or BootstrappedDQNNet: returns the action values of a batch of states
+  '''
+  def __init__(self, net):
+    super().__init__(net)
+    self.feature_net = numpy_module(net.feature_net)
+    if isinstance(net, BootstrappedDQNNet):
+      self.heads = [numpy_heads(net.heads_net, i) for i in range(net.k)]
+    elif isinstance(net, DQNNet):
+      self.value_net = numpy_module(net.value_net)
+    else:
+      raise NotImplementedError(f'{type(net).__name__} is not supported.')
+
+  def __call__(self, obs, head_idx=None):
+    phi = self.feature_net(np.asarray(obs, dtype=np.float32))
+    if head_idx is None:
+      return self.value_net(phi)
+    else:
+      return self.heads[head_idx](phi)
+
+
+class NumpyPolicyNet(NumpyNet):
+  '''
+  NumPy mirror of REINFORCENet and actor-critic networks for acting, with the same prediction dict (as tensors):
+    - Actions are sampled with NumPy's random generator instead of torch's.
+    - Only the action (and log_pi) is predicted with Q critics (DDPG, TD3, SAC) since they are not needed to act.
+  '''
+  def __init__(self, net):
+    super().__init__(net)
+    actor_net = net.actor_net
+    self.feature_net = numpy_module(net.feature_net)
+    self.actor_type = type(actor_net)
+    if self.actor_type == MLPCategoricalActor:
+      self.actor_net = numpy_module(actor_net.logits_net)
+    elif self.actor_type in [MLPGaussianActor, MLPSquashedGaussianActor, MLPDeterministicActor]:
+      self.actor_net = numpy_module(actor_net.actor_net)
+      self.action_lim = actor_net.action_lim
+      if self.actor_type == MLPGaussianActor:
+        self.action_std = to_array(actor_net.action_std)
+    else:
+      raise NotImplementedError(f'{self.actor_type.__name__} is not supported.')
+    if isinstance(net, ActorQCriticNet):
+      self.critic_net = None
+    elif isinstance(net, ActorVCriticNet):
+      self.critic_net = numpy_module(net.critic_net)
+    elif isinstance(net, REINFORCENet):
+      self.critic_net = None
+    else:
+      raise NotImplementedError(f'{type(net).__name__} is not supported.')
+
+  def __call__(self, obs, deterministic=False):
+    phi = self.feature_net(np.asarray(obs, dtype=np.float32))
+    action, log_pi = self.sample_action(self.actor_net(phi), deterministic)
+    prediction = {'action': torch.from_numpy(np.asarray(action))}
+    if log_pi is not None:
+      prediction['log_pi'] = torch.from_numpy(np.asarray(log_pi, dtype=np.float32))
+    if self.critic_net is not None:
+      prediction['v'] = torch.from_numpy(np.asarray(self.critic_net(phi)))
+    return prediction
+
+  def sample_action(self, y, deterministic):
+    # The same as the forward pass of the actor, given the output y of its MLP
+    if self.actor_type == MLPCategoricalActor:
+      # Actions are always sampled, the same as MLPCategoricalActor
+      y = y - y.max(axis=-1, keepdims=True)
+      log_probs = y - np.log(np.exp(y).sum(axis=-1, keepdims=True))
+      u = np.random.rand(*y.shape[:-1], 1)
+      action = np.minimum((np.exp(log_probs).cumsum(axis=-1) < u).sum(axis=-1), y.shape[-1]-1)
+      log_pi = np.take_along_axis(log_probs, np.expand_dims(action, -1), axis=-1)[..., 0]
+      return action, log_pi
+    elif self.actor_type == MLPDeterministicActor:
+      # The MLP of the actor already ends with Tanh
+      return self.action_lim * y, None
+    elif self.actor_type == MLPGaussianActor:
+      action_mean = self.action_lim * y
+      action_std = np.clip(softplus(self.action_std), 1e-6, 10)
+      action = action_mean if deterministic else action_mean + action_std * np.random.randn(*action_mean.shape).astype(np.float32)
+      log_pi = np.clip(normal_log_prob(action, action_mean, action_std).sum(axis=-1), -20, 20)
+      return action, log_pi
+    else: # MLPSquashedGaussianActor
+      action_mean, action_std = np.split(y, 2, axis=-1)
+      action_std = np.clip(softplus(action_std), 1e-6, 10)
+      u = action_mean if deterministic else action_mean + action_std * np.random.randn(*action_mean.shape).astype(np.float32)
+      log_pi = normal_log_prob(u, action_mean, action_std).sum(axis=-1)
+      log_pi -= (2*(math.log(2) - u - softplus(-2*u))).sum(axis=-1)
+      return self.action_lim * np.tanh(u), np.clip(log_pi, -20, 20)
+
+
+def make_numpy_net(net):
+  '''
+  Return a NumPy mirror of net, or None if net (or one of its layers) is not supported
+  '''
+  try:
+    if isinstance(net, (DQNNet, BootstrappedDQNNet)):
+      return NumpyDQNNet(net)
+    elif isinstance(net, (REINFORCENet, ActorVCriticNet)):
+      return NumpyPolicyNet(net)
+  except NotImplementedError:
+    pass
+  return None
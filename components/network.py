@@ -40,10 +40,59 @@ def layer_init(layer, init_type='default', nonlinearity='relu', w_scale=1.0):
   return layer
 
 
+def flatten_parameters(net):
+  '''
+  Move the parameters of net into one contiguous flat tensor (net.flat_params) and make each parameter a view of it,
+  so that copying or averaging whole networks takes a single op (see hard_update and soft_update).
+  Call it after moving net to its device: moving parameters later gives them new storage.
+  '''
+  params = list(net.parameters())
+  with torch.no_grad():
+    flat = torch.cat([p.reshape(-1) for p in params])
+  offset = 0
+  for p in params:
+    p.data = flat[offset:offset+p.numel()].view_as(p)
+    offset += p.numel()
+  net.flat_params = flat
+  return net
+
+def flat_parameters(net):
+  # The flat parameter tensor of net, or None if net is not flattened or its parameters got new storage
+  flat = getattr(net, 'flat_params', None)
+  if flat is None or next(net.parameters()).data_ptr() != flat.data_ptr():
+    return None
+  return flat
+
+def hard_update(target_net, net):
+  # Copy the parameters and buffers of net into target_net, with one copy_ for flattened networks
+  flat, target_flat = flat_parameters(net), flat_parameters(target_net)
+  if flat is None or target_flat is None or flat.shape != target_flat.shape:
+    target_net.load_state_dict(net.state_dict())
+    return
+  with torch.no_grad():
+    target_flat.copy_(flat)
+    for buffer, target_buffer in zip(net.buffers(), target_net.buffers()):
+      target_buffer.copy_(buffer)
+
+def soft_update(target_net, net, polyak):
+  # Polyak averaging: target = polyak * target + (1-polyak) * net, with one lerp_ for flattened networks
+  flat, target_flat = flat_parameters(net), flat_parameters(target_net)
+  with torch.no_grad():
+    if flat is None or target_flat is None or flat.shape != target_flat.shape:
+      for p, target_p in zip(net.parameters(), target_net.parameters()):
+        target_p.lerp_(p, 1-polyak)
+    else:
+      target_flat.lerp_(flat, 1-polyak)
+
+
 # Adapted from https://github.com/Kaixhin/Rainbow/blob/master/model.py
 class NoisyLinear(nn.Module):
   '''
   Noisy linear layer with Factorised Gaussian noise
+  The noisy weight is weight_mu + weight_sigma * outer(epsilon_out, epsilon_in), and only the two noise vectors are kept.
+  For a few input rows (e.g. acting), the noise is applied to the input and output instead of building the noisy weight:
+    y = x @ weight_mu.T + ((x * epsilon_in) @ weight_sigma.T) * epsilon_out + bias_mu + bias_sigma * epsilon_out
+  which costs two matmuls but no out x in temporaries. For larger batches, building the noisy weight once is cheaper.
   '''
   def __init__(self, in_features, out_features, std_init=0.4):
     super().__init__()
@@ -54,8 +103,8 @@ class NoisyLinear(nn.Module):
     self.weight_sigma = nn.Parameter(torch.Tensor(out_features, in_features))
     self.bias_mu = nn.Parameter(torch.Tensor(out_features))
     self.bias_sigma = nn.Parameter(torch.Tensor(out_features))
-    self.register_buffer('weight_epsilon', torch.Tensor(out_features, in_features))
-    self.register_buffer('bias_epsilon', torch.Tensor(out_features))
+    self.register_buffer('epsilon_in', torch.Tensor(in_features))
+    self.register_buffer('bias_epsilon', torch.Tensor(out_features)) # epsilon_out
     self.reset_parameters()
     self.reset_noise()
 
@@ -66,21 +115,36 @@ class NoisyLinear(nn.Module):
     self.bias_mu.data.uniform_(-mu_range, mu_range)
     self.bias_sigma.data.fill_(self.std_init / math.sqrt(self.out_features))
 
-  def _scale_noise(self, size):
-    x = torch.randn(size)
-    return x.sign().mul_(x.abs().sqrt_())
+  def _scale_noise(self, x):
+    # Sample f(x) = sign(x) * sqrt(|x|) with x ~ N(0, 1) in place
+    x.normal_()
+    return x.copy_(x.abs().sqrt_().copysign_(x))
 
   def reset_noise(self):
-    epsilon_in = self._scale_noise(self.in_features)
-    epsilon_out = self._scale_noise(self.out_features)
-    self.weight_epsilon.copy_(epsilon_out.outer(epsilon_in))
-    self.bias_epsilon.copy_(epsilon_out)
+    with torch.no_grad():
+      self._scale_noise(self.epsilon_in)
+      self._scale_noise(self.bias_epsilon)
+
+  @property
+  def weight_epsilon(self):
+    return self.bias_epsilon.outer(self.epsilon_in)
 
   def forward(self, input):
-    if self.training:
-      return F.linear(input, self.weight_mu + self.weight_sigma * self.weight_epsilon, self.bias_mu + self.bias_sigma * self.bias_epsilon)
-    else:
+    if not self.training:
       return F.linear(input, self.weight_mu, self.bias_mu)
+    bias = self.bias_mu + self.bias_sigma * self.bias_epsilon
+    if input.numel() // self.in_features * 32 < self.in_features * self.out_features // (self.in_features + self.out_features):
+      return torch.addcmul(F.linear(input, self.weight_mu, bias), F.linear(input * self.epsilon_in, self.weight_sigma), self.bias_epsilon)
+    else:
+      return F.linear(input, torch.addcmul(self.weight_mu, self.weight_sigma, self.weight_epsilon), bias)
+
+  def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+    # Models saved with the full weight_epsilon = outer(epsilon_out, epsilon_in): recover epsilon_in from its largest row
+    weight_epsilon = state_dict.pop(prefix + 'weight_epsilon', None)
+    if weight_epsilon is not None and prefix + 'epsilon_in' not in state_dict:
+      i = state_dict[prefix + 'bias_epsilon'].abs().argmax()
+      state_dict[prefix + 'epsilon_in'] = weight_epsilon[i] / state_dict[prefix + 'bias_epsilon'][i]
+    super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
 
 class MLP(nn.Module):
@@ -258,24 +322,101 @@ class DQNNet(nn.Module):
     return q
 
 
+def dqn_layers(net):
+  # Layers of a DQNNet in the order of the forward pass, as (layer, activation) pairs
+  if isinstance(net.feature_net, (Conv2d_MinAtar, Conv2d_Atari)):
+    layers = [(layer, F.relu) for layer in net.feature_net.children()]
+  elif isinstance(net.feature_net, nn.Identity):
+    layers = []
+  else:
+    raise ValueError(f'{type(net.feature_net).__name__} is not supported by EnsembleDQNNet.')
+  if not isinstance(net.value_net, MLPCritic):
+    raise ValueError(f'{type(net.value_net).__name__} is not supported by EnsembleDQNNet.')
+  mlp = net.value_net.value_net.mlp
+  layers += [(mlp[i], mlp[i+1]) for i in range(0, len(mlp), 2)]
+  return layers
+
+
+class EnsembleDQNNet(nn.Module):
+  '''
+  Evaluate k DQNNets with the same architecture in one batched pass and return (k, B, A) action values:
+    - Weights of the k members are stacked; convolutions run as one (grouped) convolution and
+      linear layers as one batched matmul.
+    - The members keep their own parameters and optimizers. Before each pass, only the members
+      whose parameters changed (e.g. by an optimizer step or load_state_dict) are restacked.
+      Changes are found with tensor version counters (of parameters and flat parameter tensors),
+      so changes made through .data are not tracked.
+    - The stacked weights are detached, so use it for targets and action selection only.
+  '''
+  def __init__(self):
+    super().__init__()
+    self.net_ids = []
+    self.layers = []
+
+  def restack(self, nets):
+    if [id(net) for net in nets] != self.net_ids:
+      # New members: cache their layers and parameters, and stack all of them
+      self.net_ids = [id(net) for net in nets]
+      self.members = [dqn_layers(net) for net in nets]
+      # Updates of a flat parameter tensor (see flatten_parameters) do not change the versions of its views
+      self.params = [list(net.parameters()) + ([net.flat_params] if hasattr(net, 'flat_params') else []) for net in nets]
+      self.versions = None
+    versions = [[p._version for p in params] for params in self.params]
+    with torch.no_grad():
+      if self.versions is None or self.layers[0]['weight'].device != self.params[0][0].device:
+        self.layers = []
+        for j, (layer, act) in enumerate(self.members[0]):
+          self.layers.append({
+            'conv': isinstance(layer, nn.Conv2d),
+            'weight': torch.stack([member[j][0].weight for member in self.members]),
+            'bias': torch.stack([member[j][0].bias for member in self.members]),
+            'act': act,
+            'stride': layer.stride if isinstance(layer, nn.Conv2d) else None
+          })
+      else:
+        for i in range(len(nets)):
+          if versions[i] != self.versions[i]:
+            for layer, (member_layer, _) in zip(self.layers, self.members[i]):
+              layer['weight'][i].copy_(member_layer.weight)
+              layer['bias'][i].copy_(member_layer.bias)
+    self.versions = versions
+
+  def forward(self, obs, nets):
+    self.restack(nets)
+    k = len(nets)
+    y = obs
+    for layer in self.layers:
+      weight, bias = layer['weight'], layer['bias']
+      if layer['conv']:
+        # Members share the input of the first convolution, then each member convolves its own channels
+        groups = 1 if y is obs else k
+        y = F.conv2d(y, weight.flatten(0, 1), bias.flatten(), stride=layer['stride'], groups=groups)
+      else:
+        if y.dim() == 4:
+          # (B, k*C, H, W) -> (k, B, C*H*W), the same flattening as each member
+          y = y.view(y.size(0), k, -1).transpose(0, 1)
+        if y is obs:
+          y = torch.matmul(y, weight.transpose(1, 2)) + bias.unsqueeze(1)
+        else:
+          y = torch.baddbmm(bias.unsqueeze(1), y, weight.transpose(1, 2))
+      y = layer['act'](y)
+    # The same as MLPCritic
+    return y.squeeze(-1)
+
 class BootstrappedDQNNet(nn.Module):
   def __init__(self, feature_net, heads_net):
     super().__init__()
     self.feature_net = feature_net
     self.heads_net = heads_net
-    self.k = len(heads_net)
+    self.k = heads_net.k
 
   def forward(self, obs, head_idx='all'):
     # Generate the latent feature
     phi = self.feature_net(obs)
-    # Compute action values for all actions
-    if head_idx == 'all':
-      all_q = [head(phi) for head in self.heads_net]
-      return all_q
-    else:
+    # Compute action values for all actions: (k, B, A) for all heads, or (B, A) for one head
+    if head_idx != 'all':
       assert head_idx >= 0 and head_idx < self.k, 'Wrong head index!'
-      q = self.heads_net[head_idx](phi)
-      return q
+    return self.heads_net(phi, head_idx)
 
 
 class MLPCritic(nn.Module):
@@ -287,6 +428,38 @@ class MLPCritic(nn.Module):
     return self.value_net(phi).squeeze(-1)
 
 
+class MultiHeadMLPCritic(nn.Module):
+  '''
+  k MLPCritic heads on a shared input, with the weights of each layer stacked in a (k, out, in) parameter.
+  All heads are evaluated with one batched matmul per layer.
+  '''
+  def __init__(self, k, layer_dims, hidden_act='ReLU', output_act='Linear', last_w_scale=1e-3):
+    super().__init__()
+    self.k = k
+    # Initialize k heads the same way as MLPCritic, then stack their weights
+    heads = [MLP(layer_dims=layer_dims, hidden_act=hidden_act, output_act=output_act, last_w_scale=last_w_scale) for _ in range(k)]
+    self.weights = nn.ParameterList()
+    self.biases = nn.ParameterList()
+    self.acts = []
+    for i in range(len(layer_dims)-1):
+      self.weights.append(nn.Parameter(torch.stack([head.mlp[2*i].weight.data for head in heads])))
+      self.biases.append(nn.Parameter(torch.stack([head.mlp[2*i].bias.data for head in heads])))
+      self.acts.append(heads[0].mlp[2*i+1])
+
+  def forward(self, phi, head_idx='all'):
+    y = phi
+    for weight, bias, act in zip(self.weights, self.biases, self.acts):
+      if head_idx != 'all':
+        y = F.linear(y, weight[head_idx], bias[head_idx])
+      elif y is phi:
+        # (B, in) x (k, in, out) -> (k, B, out)
+        y = torch.matmul(y, weight.transpose(1, 2)) + bias.unsqueeze(1)
+      else:
+        y = torch.baddbmm(bias.unsqueeze(1), y, weight.transpose(1, 2))
+      y = act(y)
+    return y.squeeze(-1)
+
+
 class NoisyMLPCritic(nn.Module):
   def __init__(self, layer_dims, hidden_act='ReLU', output_act='Linear'):
     super().__init__()
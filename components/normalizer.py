@@ -74,11 +74,18 @@ class MeanStdNormalizer(BaseNormalizer):
     return np.clip((x - self.rms.mean) / np.sqrt(self.rms.var + self.epsilon), -self.clip, self.clip)
 
   def state_dict(self):
-    return {'mean': self.rms.mean, 'var': self.rms.var}
+    if self.rms is None:
+      return None
+    return {'mean': self.rms.mean, 'var': self.rms.var, 'count': self.rms.count}
 
   def load_state_dict(self, saved):
+    if saved is None:
+      return
+    if self.rms is None:
+      self.rms = RunningMeanStd(shape=saved['mean'].shape)
     self.rms.mean = saved['mean']
     self.rms.var = saved['var']
+    self.rms.count = saved['count']
 
 
 class RunningMeanStd(object):
@@ -128,10 +135,17 @@ class MeanNormalizer(BaseNormalizer):
     return x - self.rms.mean
 
   def state_dict(self):
-    return {'mean': self.rms.mean}
+    if self.rms is None:
+      return None
+    return {'mean': self.rms.mean, 'count': self.rms.count}
 
   def load_state_dict(self, saved):
+    if saved is None:
+      return
+    if self.rms is None:
+      self.rms = RunningMean(shape=saved['mean'].shape)
     self.rms.mean = saved['mean']
+    self.rms.count = saved['count']
 
 
 class RunningMean(object):
@@ -1,7 +1,18 @@
+import os
 import torch
 import numpy as np
 from collections import namedtuple
-from utils.helper import to_tensor
+from utils.helper import to_tensor, to_numpy
+
+
+def filled(x, size):
+  '''
+  Return the first size entries of a storage (a tensor or numpy array) as a tensor for checkpoints.
+  torch.save writes the whole storage of a view, so partly filled storages are copied.
+  '''
+  if isinstance(x, np.ndarray):
+    x = torch.from_numpy(x)
+  return x if size == len(x) else x[:size].clone()
 
 
 class InfiniteReplay(object):
@@ -36,11 +47,23 @@ class InfiniteReplay(object):
     Entry = namedtuple('Entry', keys)
     return Entry(*list(data))
 
+  def state_dict(self):
+    return {k: getattr(self, k) for k in self.keys}
+
+  def load_state_dict(self, state_dict):
+    for k in self.keys:
+      setattr(self, k, list(state_dict[k]))
+
 
 class FiniteReplay(object):
   '''
   Finite replay buffer to store experiences: FIFO (first in, firt out)
   '''
+  # Whether states are expected as raw observations instead of normalized ones
+  raw_state = False
+  # Whether sampled entries come with idx and weight for prioritized replay
+  prioritized = False
+
   def __init__(self, memory_size, keys=None):
     if keys is None:
       keys = ['action', 'reward', 'mask']
@@ -63,6 +86,12 @@ class FiniteReplay(object):
     if self.pos == 0:
       self.full = True
 
+  def add_batch(self, data):
+    # Add a batch of experiences (e.g. from vectorized environments), the first dimension is the batch
+    batch_size = len(next(iter(data.values())))
+    for i in range(batch_size):
+      self.add({k: v[i] for k, v in data.items()})
+
   def get(self, keys, data_size, detach=False):
     # Get first several samples (without replacement)
     data_size = min(self.size(), data_size) 
@@ -98,6 +127,654 @@ class FiniteReplay(object):
     else:
       return self.pos
 
+  def state_dict(self):
+    '''
+    Return the experiences for a checkpoint, with one stacked tensor per key instead of one tensor per experience
+    '''
+    size = self.size()
+    state_dict = {'pos': self.pos, 'full': self.full}
+    for k in self.keys:
+      values = getattr(self, k)[:size]
+      state_dict[k] = torch.stack(values) if size > 0 and values[0] is not None else None
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    self.clear()
+    for k in self.keys:
+      if state_dict[k] is not None:
+        getattr(self, k)[:len(state_dict[k])] = list(state_dict[k])
+    self.pos, self.full = state_dict['pos'], state_dict['full']
+
+
+class FiniteArrayReplay(FiniteReplay):
+  '''
+  Finite replay buffer to store experiences: FIFO (first in, firt out)
+  Each key is stored in one preallocated tensor of shape (memory_size, *data_shape),
+  where data_shape, dtype, and device are inferred from the first added value.
+  Sampling is a single index gather instead of a per-index list comprehension.
+  '''
+  def __init__(self, memory_size, keys=None):
+    super().__init__(memory_size, keys)
+    # Storages are allocated on the first add (see allocate)
+    for key in self.keys:
+      setattr(self, key, None)
+
+  def clear(self):
+    # Keep the allocated storages: old experiences are overwritten before they are sampled again
+    self.pos = 0
+    self.full = False
+
+  def allocate(self, key, value):
+    value = torch.as_tensor(value)
+    storage = torch.zeros((self.memory_size,)+tuple(value.shape), dtype=value.dtype, device=value.device)
+    setattr(self, key, storage)
+    return storage
+
+  def storage_device(self):
+    # Return the device of allocated tensor storages
+    for k in self.keys:
+      if isinstance(getattr(self, k), torch.Tensor):
+        return getattr(self, k).device
+    return 'cpu'
+
+  def bytes_per_transition(self):
+    num_bytes = 0
+    for k in self.keys:
+      if isinstance(getattr(self, k), torch.Tensor):
+        num_bytes += getattr(self, k).element_size() * getattr(self, k)[0].numel()
+    return num_bytes
+
+  def add(self, data):
+    for k, v in data.items():
+      if k not in self.keys:
+        raise RuntimeError('Undefined key')
+      storage = getattr(self, k)
+      if storage is None:
+        storage = self.allocate(k, v)
+      storage[self.pos] = v
+    self.pos = (self.pos + 1) % self.memory_size
+    if self.pos == 0:
+      self.full = True
+
+  def add_batch(self, data):
+    # Write a batch of experiences into consecutive slots with one indexed copy per key
+    batch_size = len(next(iter(data.values())))
+    slots = (self.pos + np.arange(batch_size)) % self.memory_size
+    for k, v in data.items():
+      if k not in self.keys:
+        raise RuntimeError('Undefined key')
+      storage = getattr(self, k)
+      if storage is None:
+        storage = self.allocate(k, v[0])
+      storage[torch.as_tensor(slots, device=storage.device)] = torch.as_tensor(v, device=storage.device, dtype=storage.dtype)
+    if self.pos + batch_size >= self.memory_size:
+      self.full = True
+    self.pos = (self.pos + batch_size) % self.memory_size
+
+  def get(self, keys, data_size, detach=False):
+    # Get first several samples (without replacement)
+    data_size = min(self.size(), data_size)
+    data = [getattr(self, k)[:data_size] for k in keys]
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    Entry = namedtuple('Entry', keys)
+    return Entry(*list(data))
+
+  def sample(self, keys, batch_size, detach=False):
+    # Sampling with replacement
+    idxs = np.random.randint(0, self.size(), size=batch_size)
+    data = []
+    for k in keys:
+      storage = getattr(self, k)
+      data.append(storage[torch.as_tensor(idxs, device=storage.device)])
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    Entry = namedtuple('Entry', keys)
+    return Entry(*list(data))
+
+  def state_dict(self):
+    # Only the filled slots of each storage
+    state_dict = {'pos': self.pos, 'full': self.full}
+    for k in self.keys:
+      storage = getattr(self, k)
+      state_dict[k] = None if storage is None else filled(storage, self.size())
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    self.clear()
+    for k in self.keys:
+      value = state_dict[k]
+      if value is None or len(value) == 0:
+        continue
+      storage = getattr(self, k)
+      if storage is None:
+        storage = self.allocate(k, value[0])
+      storage[:len(value)] = value.to(storage.device)
+    self.pos, self.full = state_dict['pos'], state_dict['full']
+
+
+class RolloutStorage(FiniteArrayReplay):
+  '''
+  Rollout storage for on-policy agents:
+    - Tensors are allocated once (shapes inferred from the first add) and clear() only resets the position.
+    - Values are stored detached, so no autograd graph is kept across steps or epochs.
+    - get() returns views and minibatches() yields views of one shuffled copy per call.
+  '''
+  def __init__(self, memory_size, keys=None):
+    super().__init__(memory_size, keys)
+
+  def add(self, data):
+    data = {k: v.detach() if isinstance(v, torch.Tensor) else v for k, v in data.items()}
+    super().add(data)
+
+  def add_batch(self, data):
+    data = {k: v.detach() if isinstance(v, torch.Tensor) else v for k, v in data.items()}
+    super().add_batch(data)
+
+  def minibatches(self, data, batch_size):
+    '''
+    Shuffle data (a dict of tensors with the same length) and yield minibatches of batch_size;
+    the last incomplete minibatch is dropped, the same as generate_batch_idxs.
+    '''
+    keys = list(data.keys())
+    data_size = len(data[keys[0]])
+    idxs = torch.as_tensor(np.random.permutation(data_size), device=data[keys[0]].device)
+    shuffled = [data[k][idxs] for k in keys]
+    Entry = namedtuple('Entry', keys)
+    for i in range(0, data_size // batch_size * batch_size, batch_size):
+      yield Entry(*[x[i:i+batch_size] for x in shuffled])
+
+
+class FrameStackReplay(FiniteArrayReplay):
+  '''
+  Finite replay buffer for frame-stacked pixel observations (e.g. Atari with FrameStack).
+  Only the newest frame of each state is stored (as uint8), and the stacks of
+  state/next_state are rebuilt from consecutive slots at sample time:
+    - Frames before an episode start are filled with the first frame of the episode,
+      the same as FrameStack.reset does.
+    - The next frame of a transition is the frame of the following slot, except for
+      the last transition of an episode and the newest transition, whose next frames
+      are kept separately.
+  States are added as raw observations and returned as float32 tensors multiplied by scale.
+  Transitions must come in order from a single environment, so agents reject it with num_envs > 1 or actor processes.
+  '''
+  raw_state = True
+
+  def __init__(self, memory_size, keys=None, history_length=4, scale=1.0/255):
+    self.history_length = history_length
+    self.scale = scale
+    self.frame = None
+    super().__init__(memory_size, keys)
+
+  def clear(self):
+    super().clear()
+    if self.frame is not None:
+      self.episode_start[:] = False
+    # Next frames which can not be recovered from the following slot: {slot: frame}
+    self.next_frame = dict()
+    self.last_idx = None
+    self.last_terminal = False
+
+  def allocate_frame(self, frame):
+    self.frame = np.zeros((self.memory_size,)+frame.shape, dtype=np.uint8)
+    self.episode_start = np.zeros(self.memory_size, dtype=bool)
+
+  def add(self, data):
+    for k in data.keys():
+      if k not in self.keys:
+        raise RuntimeError('Undefined key')
+    if 'state' in data:
+      state = np.asarray(data['state'], dtype=np.uint8)
+      next_state = np.asarray(data['next_state'], dtype=np.uint8)
+      c = state.shape[0] // self.history_length
+      if self.frame is None:
+        self.allocate_frame(state[-c:])
+      # A new episode starts after a terminal transition or if the state does not follow the last next_state
+      new_episode = (self.last_idx is None) or self.last_terminal or (not np.array_equal(state[-c:], self.next_frame[self.last_idx]))
+      if self.last_idx is not None and not new_episode:
+        # The next frame of the last transition is recovered from this slot
+        del self.next_frame[self.last_idx]
+      # Overwrite the oldest slot
+      self.next_frame.pop(self.pos, None)
+      self.frame[self.pos] = state[-c:]
+      self.episode_start[self.pos] = new_episode
+      self.next_frame[self.pos] = next_state[-c:]
+      self.last_idx = self.pos
+      self.last_terminal = ('mask' in data) and (float(data['mask']) == 0)
+      data = {k: v for k, v in data.items() if k not in ['state', 'next_state']}
+    super().add(data)
+
+  def stack_idxs(self, idxs):
+    # Slots of the frames in the state stacks: (batch_size, history_length), oldest first
+    offsets = np.arange(self.history_length-1, -1, -1)
+    slots = (idxs[:, None] - offsets[None, :]) % self.memory_size
+    # Frames before the most recent episode start are replaced by the first frame
+    starts = self.episode_start[slots][:, ::-1]
+    first = np.where(starts.any(axis=1), self.history_length-1-starts.argmax(axis=1), 0)
+    positions = np.maximum(np.arange(self.history_length)[None, :], first[:, None])
+    return np.take_along_axis(slots, positions, axis=1)
+
+  def get_states(self, idxs):
+    slots = self.stack_idxs(idxs)
+    frames = self.frame[slots] # (batch_size, history_length, c, H, W)
+    next_frames = self.frame[(idxs+1) % self.memory_size]
+    for i, idx in enumerate(idxs):
+      if idx in self.next_frame:
+        next_frames[i] = self.next_frame[idx]
+    next_frames = np.concatenate([frames[:, 1:], next_frames[:, None]], axis=1)
+    batch_size = len(idxs)
+    state = frames.reshape((batch_size, -1)+frames.shape[3:])
+    next_state = next_frames.reshape((batch_size, -1)+next_frames.shape[3:])
+    return state, next_state
+
+  def to_states(self, keys, idxs, data):
+    if 'state' not in keys and 'next_state' not in keys:
+      return data
+    state, next_state = self.get_states(idxs)
+    device = self.storage_device()
+    for k, v in [('state', state), ('next_state', next_state)]:
+      if k in keys:
+        data[keys.index(k)] = torch.from_numpy(v).to(device).float().mul_(self.scale)
+    return data
+
+  def get(self, keys, data_size, detach=False):
+    # Get first several samples (without replacement)
+    data_size = min(self.size(), data_size)
+    idxs = np.arange(data_size)
+    data = [None if k in ['state', 'next_state'] else getattr(self, k)[:data_size] for k in keys]
+    data = self.to_states(keys, idxs, data)
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    Entry = namedtuple('Entry', keys)
+    return Entry(*list(data))
+
+  def sample(self, keys, batch_size, detach=False):
+    # Sampling with replacement
+    if self.full:
+      # The oldest slots have lost the earlier frames of their stacks
+      idxs = (self.pos + self.history_length - 1 + np.random.randint(0, self.memory_size-self.history_length+1, size=batch_size)) % self.memory_size
+    else:
+      idxs = np.random.randint(0, self.size(), size=batch_size)
+    data = []
+    for k in keys:
+      if k in ['state', 'next_state']:
+        data.append(None)
+      else:
+        storage = getattr(self, k)
+        data.append(storage[torch.as_tensor(idxs, device=storage.device)])
+    data = self.to_states(keys, idxs, data)
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    Entry = namedtuple('Entry', keys)
+    return Entry(*list(data))
+
+  def bytes_per_transition(self):
+    num_bytes = super().bytes_per_transition()
+    if self.frame is not None:
+      num_bytes += self.frame[0].nbytes
+    return num_bytes
+
+  def state_dict(self):
+    state_dict = super().state_dict()
+    if self.frame is not None:
+      state_dict['frame'] = filled(self.frame, self.size())
+      state_dict['episode_start'] = filled(self.episode_start, self.size())
+      state_dict['next_frame'] = self.next_frame
+      state_dict['last_idx'] = self.last_idx
+      state_dict['last_terminal'] = self.last_terminal
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    super().load_state_dict(state_dict)
+    if 'frame' in state_dict:
+      frame = state_dict['frame'].cpu().numpy()
+      if self.frame is None:
+        self.allocate_frame(frame[0])
+      self.frame[:len(frame)] = frame
+      self.episode_start[:len(frame)] = state_dict['episode_start'].cpu().numpy()
+      self.next_frame = dict(state_dict['next_frame'])
+      self.last_idx = state_dict['last_idx']
+      self.last_terminal = state_dict['last_terminal']
+
+
+class BitPackedReplay(FiniteArrayReplay):
+  '''
+  Finite replay buffer for binary observations (e.g. MinAtar).
+  States are bit-packed with np.packbits (1 bit per value instead of 32 bits)
+  and unpacked to float32 tensors only for the sampled batch.
+  '''
+  raw_state = True
+
+  def __init__(self, memory_size, keys=None, state_keys=None):
+    self.state_keys = ['state', 'next_state'] if state_keys is None else state_keys
+    self.packed = dict()
+    super().__init__(memory_size, keys)
+
+  def clear(self):
+    super().clear()
+    for k in self.packed.keys():
+      self.packed[k][:] = 0
+
+  def add(self, data):
+    for k in data.keys():
+      if k not in self.keys:
+        raise RuntimeError('Undefined key')
+    for k in self.state_keys:
+      if k not in data:
+        continue
+      x = np.asarray(data[k], dtype=bool)
+      if k not in self.packed:
+        self.state_shape = x.shape
+        self.packed[k] = np.zeros((self.memory_size, (x.size+7)//8), dtype=np.uint8)
+      self.packed[k][self.pos] = np.packbits(x.reshape(-1))
+    super().add({k: v for k, v in data.items() if k not in self.state_keys})
+
+  add_batch = FiniteReplay.add_batch
+
+  def unpack(self, key, idxs):
+    bits = np.unpackbits(self.packed[key][idxs], axis=1, count=int(np.prod(self.state_shape)))
+    bits = bits.reshape((len(idxs),)+self.state_shape)
+    return torch.from_numpy(bits).to(self.storage_device()).float()
+
+  def get(self, keys, data_size, detach=False):
+    # Get first several samples (without replacement)
+    data_size = min(self.size(), data_size)
+    idxs = np.arange(data_size)
+    data = [self.unpack(k, idxs) if k in self.state_keys else getattr(self, k)[:data_size] for k in keys]
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    Entry = namedtuple('Entry', keys)
+    return Entry(*list(data))
+
+  def sample(self, keys, batch_size, detach=False):
+    # Sampling with replacement
+    idxs = np.random.randint(0, self.size(), size=batch_size)
+    data = []
+    for k in keys:
+      if k in self.state_keys:
+        data.append(self.unpack(k, idxs))
+      else:
+        storage = getattr(self, k)
+        data.append(storage[torch.as_tensor(idxs, device=storage.device)])
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    Entry = namedtuple('Entry', keys)
+    return Entry(*list(data))
+
+  def bytes_per_transition(self):
+    num_bytes = super().bytes_per_transition()
+    for k in self.packed.keys():
+      num_bytes += self.packed[k][0].nbytes
+    return num_bytes
+
+  def state_dict(self):
+    state_dict = super().state_dict()
+    if len(self.packed) > 0:
+      state_dict['state_shape'] = self.state_shape
+      state_dict['packed'] = {k: filled(v, self.size()) for k, v in self.packed.items()}
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    super().load_state_dict(state_dict)
+    if 'packed' in state_dict:
+      self.state_shape = state_dict['state_shape']
+      for k, v in state_dict['packed'].items():
+        v = v.cpu().numpy()
+        if k not in self.packed:
+          self.packed[k] = np.zeros((self.memory_size,)+v.shape[1:], dtype=np.uint8)
+        self.packed[k][:len(v)] = v
+
+
+class SumTree(object):
+  '''
+  Array-based sum tree: each node is the sum of its two children and the leaves are priorities.
+  Updates and sampling are batched, each taking O(log n) vectorized steps.
+  '''
+  def __init__(self, capacity):
+    # Round up the number of leaves to a power of 2 so that all leaves have the same depth
+    self.depth = int(np.ceil(np.log2(max(capacity, 2))))
+    self.num_leaves = 2 ** self.depth
+    self.tree = np.zeros(2*self.num_leaves-1, dtype=np.float64)
+
+  def total(self):
+    return self.tree[0]
+
+  def get(self, idxs):
+    return self.tree[idxs + self.num_leaves - 1]
+
+  def update(self, idxs, priorities):
+    # Set leaves, then recompute their ancestors level by level
+    nodes = np.asarray(idxs) + self.num_leaves - 1
+    self.tree[nodes] = priorities
+    if nodes.size == 1:
+      # Avoid array operations for a single leaf
+      node = int(nodes[0])
+      for _ in range(self.depth):
+        node = (node - 1) // 2
+        self.tree[node] = self.tree[2*node+1] + self.tree[2*node+2]
+      return
+    for _ in range(self.depth):
+      nodes = np.unique((nodes - 1) // 2)
+      self.tree[nodes] = self.tree[2*nodes+1] + self.tree[2*nodes+2]
+
+  def find(self, values):
+    # Find the leaves whose prefix sum intervals contain the values
+    nodes = np.zeros(len(values), dtype=np.int64)
+    values = np.array(values, dtype=np.float64)
+    for _ in range(self.depth):
+      left = 2 * nodes + 1
+      go_right = values > self.tree[left]
+      values = np.where(go_right, values - self.tree[left], values)
+      nodes = np.where(go_right, left + 1, left)
+    return nodes - (self.num_leaves - 1)
+
+
+class PrioritizedReplay(FiniteArrayReplay):
+  '''
+  Finite replay buffer with proportional prioritized experience replay:
+    P(i) = p_i^alpha / sum_k p_k^alpha, p_i = |td_error_i| + epsilon
+  Importance sampling weights (N * P(i))^(-beta) are normalized by their maximum in the batch;
+  beta is linearly annealed from beta_start to beta_end in beta_steps additions (constant if beta_steps <= 0).
+  Sampled entries have two extra fields: idx (for update_priority) and weight.
+  '''
+  prioritized = True
+
+  def __init__(self, memory_size, keys=None, alpha=0.6, beta_start=0.4, beta_end=1.0, beta_steps=-1, epsilon=1e-6):
+    self.alpha = alpha
+    self.beta_start = beta_start
+    self.beta_end = beta_end
+    self.beta_steps = float(beta_steps)
+    self.epsilon = epsilon
+    super().__init__(memory_size, keys)
+
+  def clear(self):
+    super().clear()
+    self.sum_tree = SumTree(self.memory_size)
+    self.max_priority = 1.0
+    self.num_added = 0
+
+  def add(self, data):
+    # New experiences get the maximum priority so that they are sampled at least once
+    self.sum_tree.update(np.array([self.pos]), self.max_priority ** self.alpha)
+    self.num_added += 1
+    super().add(data)
+
+  def add_batch(self, data):
+    batch_size = len(next(iter(data.values())))
+    slots = (self.pos + np.arange(batch_size)) % self.memory_size
+    self.sum_tree.update(slots, self.max_priority ** self.alpha)
+    self.num_added += batch_size
+    super().add_batch(data)
+
+  def get_beta(self):
+    if self.beta_steps <= 0:
+      return self.beta_start
+    return min(self.beta_start + (self.beta_end - self.beta_start) * self.num_added / self.beta_steps, self.beta_end)
+
+  def sample(self, keys, batch_size, detach=False):
+    # Stratified sampling: one sample from each of batch_size equal segments of the total priority
+    segment = self.sum_tree.total() / batch_size
+    values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+    idxs = np.minimum(self.sum_tree.find(values), self.size()-1)
+    # Compute importance sampling weights
+    probs = self.sum_tree.get(idxs) / self.sum_tree.total()
+    weights = np.power(self.size() * probs, -self.get_beta())
+    weights = weights / weights.max()
+    data = []
+    for k in keys:
+      storage = getattr(self, k)
+      data.append(storage[torch.as_tensor(idxs, device=storage.device)])
+    if detach:
+      data = map(lambda x: x.detach(), data)
+    data = list(data) + [idxs, torch.as_tensor(weights, device=self.storage_device(), dtype=torch.float32)]
+    Entry = namedtuple('Entry', keys+['idx', 'weight'])
+    return Entry(*data)
+
+  def update_priority(self, idxs, td_error):
+    priorities = np.abs(to_numpy(td_error).reshape(-1)) + self.epsilon
+    self.max_priority = max(self.max_priority, priorities.max())
+    self.sum_tree.update(idxs, priorities ** self.alpha)
+
+  def state_dict(self):
+    state_dict = super().state_dict()
+    state_dict['sum_tree'] = torch.from_numpy(self.sum_tree.tree)
+    state_dict['max_priority'] = self.max_priority
+    state_dict['num_added'] = self.num_added
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    super().load_state_dict(state_dict)
+    self.sum_tree.tree[:] = state_dict['sum_tree'].cpu().numpy()
+    self.max_priority = state_dict['max_priority']
+    self.num_added = state_dict['num_added']
+
+
+class MemmapReplay(FiniteReplay):
+  '''
+  Finite replay buffer stored on disk in numpy memmap files, one file per key.
+  The newest experiences are kept in an in-RAM hot window of hot_size slots,
+  which is written to disk in one contiguous chunk when it is full.
+  Sampling reads cold slots with one sorted fancy-indexing read per key.
+  States are added as raw observations and stored in their own dtype (e.g. uint8 Atari frames, bool MinAtar grids;
+  float64 is stored as float32), and returned as float32 tensors multiplied by scale.
+  '''
+  raw_state = True
+
+  def __init__(self, memory_size, keys=None, memory_dir='./replay/', hot_size=1000, state_keys=None, scale=1.0):
+    self.memory_dir = memory_dir
+    self.hot_size = int(hot_size)
+    self.state_keys = ['state', 'next_state'] if state_keys is None else state_keys
+    self.scale = scale
+    self.memmap = dict()
+    self.hot = dict()
+    self.device = 'cpu'
+    super().__init__(memory_size, keys)
+
+  def clear(self):
+    self.pos = 0
+    self.full = False
+    # The hot window covers slots [hot_start, hot_start+hot_count)
+    self.hot_start = 0
+    self.hot_count = 0
+
+  def allocate(self, key, value):
+    if not os.path.exists(self.memory_dir):
+      os.makedirs(self.memory_dir, exist_ok=True)
+    dtype = np.float32 if value.dtype == np.float64 else value.dtype
+    self.memmap[key] = np.lib.format.open_memmap(os.path.join(self.memory_dir, f'{key}.npy'), mode='w+', dtype=dtype, shape=(self.memory_size,)+value.shape)
+    self.hot[key] = np.zeros((self.hot_size,)+value.shape, dtype=dtype)
+
+  def add(self, data):
+    for k, v in data.items():
+      if k not in self.keys:
+        raise RuntimeError('Undefined key')
+      if isinstance(v, torch.Tensor):
+        self.device = v.device
+        v = to_numpy(v)
+      else:
+        v = np.asarray(v)
+      if k not in self.memmap:
+        self.allocate(k, v)
+      self.hot[k][self.hot_count] = v
+    self.hot_count += 1
+    self.pos = (self.pos + 1) % self.memory_size
+    if self.pos == 0:
+      self.full = True
+    # Flush the hot window when it is full or reaches the end of the buffer
+    if self.hot_count == self.hot_size or self.pos == 0:
+      self.flush()
+
+  def bytes_per_transition(self):
+    # Bytes on disk per transition (the hot window has the same dtypes and shapes, and is kept after close)
+    return sum(h.dtype.itemsize * int(np.prod(h.shape[1:])) for h in self.hot.values())
+
+  def flush(self):
+    for k in self.memmap.keys():
+      self.memmap[k][self.hot_start:self.hot_start+self.hot_count] = self.hot[k][:self.hot_count]
+    self.hot_start = self.pos
+    self.hot_count = 0
+
+  def gather(self, key, idxs):
+    out = np.empty((len(idxs),)+self.hot[key].shape[1:], dtype=self.hot[key].dtype)
+    in_hot = (idxs >= self.hot_start) & (idxs < self.hot_start + self.hot_count)
+    out[in_hot] = self.hot[key][idxs[in_hot] - self.hot_start]
+    # Read cold slots in increasing order to make disk reads sequential
+    cold = np.nonzero(~in_hot)[0]
+    order = cold[np.argsort(idxs[cold])]
+    out[order] = self.memmap[key][idxs[order]]
+    out = torch.from_numpy(out).to(self.device)
+    if key in self.state_keys:
+      out = out.float() * self.scale if self.scale != 1.0 else out.float()
+    return out
+
+  def get(self, keys, data_size, detach=False):
+    # Get first several samples (without replacement)
+    data_size = min(self.size(), data_size)
+    idxs = np.arange(data_size)
+    data = [self.gather(k, idxs) for k in keys]
+    if detach:
+      data = [x.detach() for x in data]
+    Entry = namedtuple('Entry', keys)
+    return Entry(*data)
+
+  def sample(self, keys, batch_size, detach=False):
+    # Sampling with replacement
+    idxs = np.random.randint(0, self.size(), size=batch_size)
+    data = [self.gather(k, idxs) for k in keys]
+    if detach:
+      data = [x.detach() for x in data]
+    Entry = namedtuple('Entry', keys)
+    return Entry(*data)
+
+  def state_dict(self):
+    # Write the hot window to disk first, so that all experiences are in the memmap files
+    self.flush()
+    state_dict = {'pos': self.pos, 'full': self.full, 'device': str(self.device)}
+    for k in self.memmap.keys():
+      state_dict[k] = filled(self.memmap[k], self.size())
+    return state_dict
+
+  def load_state_dict(self, state_dict):
+    self.clear()
+    self.device = state_dict['device']
+    for k in self.keys:
+      if k not in state_dict or len(state_dict[k]) == 0:
+        continue
+      value = state_dict[k].cpu().numpy()
+      if k not in self.memmap:
+        self.allocate(k, value[0])
+      self.memmap[k][:len(value)] = value
+    self.pos, self.full = state_dict['pos'], state_dict['full']
+    # New experiences start a new hot window
+    self.hot_start = self.pos
+
+  def close(self):
+    # Remove memmap files
+    for k in list(self.memmap.keys()):
+      file_path = self.memmap[k].filename
+      del self.memmap[k]
+      os.remove(file_path)
+
 
 class ContinousUniformSampler(object):
   '''
@@ -117,6 +794,12 @@ class ContinousUniformSampler(object):
     self.low = np.minimum(self.low, data)
     self.high = np.maximum(self.high, data)
 
+  def state_dict(self):
+    return {'low': self.low, 'high': self.high}
+
+  def load_state_dict(self, state_dict):
+    self.low, self.high = state_dict['low'], state_dict['high']
+
   def sample(self, batch_size):
     data = np.random.uniform(low=self.low, high=self.high, size=tuple([batch_size]+list(self.shape)))
     data = to_tensor(self.normalizer(data), self.device)
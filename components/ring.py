@@ -0,0 +1,48 @@
+import time
+import torch
+import numpy as np
+
+
+class SharedRing(object):
+  '''
+  A single-producer single-consumer ring buffer in shared memory, used to pass transitions
+  from an actor process to the learner process without pickling.
+  Storage is allocated before the processes are started:
+    - specs: a dict of {key: (shape, numpy dtype)} for one transition.
+    - head is only written by the producer and tail is only written by the consumer.
+  '''
+  def __init__(self, capacity, specs, ctx):
+    self.capacity = capacity
+    self.keys = list(specs.keys())
+    self.storage = {}
+    for k, (shape, dtype) in specs.items():
+      dtype = torch.from_numpy(np.zeros(0, dtype=dtype)).dtype
+      self.storage[k] = torch.zeros((capacity,) + tuple(shape), dtype=dtype).share_memory_()
+    self.head = ctx.Value('q', 0, lock=False)
+    self.tail = ctx.Value('q', 0, lock=False)
+
+  def size(self):
+    return self.head.value - self.tail.value
+
+  def put(self, data, stop_event=None):
+    # Wait while the ring is full; give up if stop_event is set
+    while self.size() >= self.capacity:
+      if stop_event is not None and stop_event.is_set():
+        return False
+      time.sleep(1e-4)
+    slot = self.head.value % self.capacity
+    for k in self.keys:
+      self.storage[k][slot] = torch.as_tensor(np.asarray(data[k]))
+    # Publish the slot only after it is written
+    self.head.value += 1
+    return True
+
+  def get_all(self):
+    # Copy out all available transitions in one gather, then release their slots
+    head, tail = self.head.value, self.tail.value
+    if head == tail:
+      return None
+    idxs = torch.arange(tail, head) % self.capacity
+    data = {k: v[idxs] for k, v in self.storage.items()}
+    self.tail.value = head
+    return data
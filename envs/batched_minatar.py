@@ -0,0 +1,760 @@
+import numpy as np
+from gym.spaces.box import Box
+from gym.spaces.discrete import Discrete
+
+
+def make_batched_minatar(env_name, num_envs, max_episode_steps=-1):
+  '''
+  Make a batched MinAtar game from a gym_minatar environment name, e.g. Breakout-MinAtar-v0
+  '''
+  game = env_name.split('-')[0].lower().replace('_', '')
+  batched_games = {
+    'asterix': BatchedAsterix,
+    'breakout': BatchedBreakout,
+    'seaquest': BatchedSeaquest,
+    'spaceinvaders': BatchedSpaceInvaders
+  }
+  if game not in batched_games:
+    raise ValueError(f'{env_name} is not supported by batched MinAtar.')
+  return batched_games[game](num_envs, max_episode_steps=max_episode_steps)
+
+
+class BatchedMinAtar(object):
+  '''
+  Step num_envs MinAtar games at once with array operations.
+  It can be used in place of SyncVectorEnv over gym_minatar environments:
+    - Observations are bool grids stacked in (num_envs, C, 10, 10), the layout of TransposeImage.
+    - Game dynamics, sticky actions and difficulty ramping follow MinAtar. Each game has its own
+      random state, so seed(seed) gives the same games as gym_minatar environments seeded with seed+i.
+      Random draws follow the MinAtar versions supported by gym_minatar (up to 1.0.12),
+      e.g. random.choice([True, False]) is drawn as random.randint(2) == 0.
+    - Finished games are reset automatically, the last observation is in info['terminal_observation'].
+  Subclasses keep the game state in arrays with the first dimension for games and implement
+  allocate, reset_games, act and state.
+  '''
+  channels = []
+
+  def __init__(self, num_envs, sticky_action_prob=0.1, ramping=True, max_episode_steps=-1):
+    self.num_envs = num_envs
+    self.sticky_action_prob = sticky_action_prob
+    self.ramping = ramping
+    self.max_episode_steps = max_episode_steps
+    self.action_space = Discrete(6)
+    # Observations are bool grids, as returned by gym_minatar
+    self.observation_space = Box(low=0, high=1, shape=(len(self.channels), 10, 10), dtype=bool)
+    self.envs = np.arange(num_envs)
+    self.random = [np.random.RandomState() for _ in range(num_envs)]
+    self.last_action = np.zeros(num_envs, dtype=int)
+    self.elapsed_steps = np.zeros(num_envs, dtype=int)
+    self.allocate()
+    self.reset_games(self.envs)
+
+  def seed(self, seed):
+    # Same as gym_minatar, seeding re-creates the games
+    self.random = [np.random.RandomState(seed+i) for i in range(self.num_envs)]
+    self.last_action[:] = 0
+    self.reset_games(self.envs)
+
+  def reset(self):
+    self.reset_games(self.envs)
+    self.elapsed_steps[:] = 0
+    return self.state()
+
+  def step(self, actions):
+    # Sticky actions: repeat the last action with probability sticky_action_prob
+    sticky = np.array([random.rand() < self.sticky_action_prob for random in self.random])
+    actions = np.where(sticky, self.last_action, np.asarray(actions))
+    self.last_action = actions
+    reward, done = self.act(actions)
+    infos = [{} for _ in range(self.num_envs)]
+    # Time limit, the same as TimeLimit in make_minatar
+    self.elapsed_steps += 1
+    if self.max_episode_steps > 0:
+      truncated = ~done & (self.elapsed_steps >= self.max_episode_steps)
+      for i in np.nonzero(truncated)[0]:
+        infos[i]['TimeLimit.truncated'] = True
+      done = done | truncated
+    obs = self.state()
+    done_idxs = np.nonzero(done)[0]
+    if len(done_idxs) > 0:
+      for i in done_idxs:
+        infos[i]['terminal_observation'] = obs[i]
+      self.reset_games(done_idxs)
+      self.elapsed_steps[done_idxs] = 0
+      obs = self.state()
+    return obs, reward, done, infos
+
+  def close(self):
+    pass
+
+  @property
+  def game(self):
+    # Agents read the number of channels from env.game.state_shape() as in gym_minatar
+    return self
+
+  def state_shape(self):
+    return [10, 10, len(self.channels)]
+
+  def allocate(self):
+    raise NotImplementedError
+
+  def reset_games(self, idxs):
+    raise NotImplementedError
+
+  def act(self, a):
+    # Update all games with actions a, return rewards and terminals
+    raise NotImplementedError
+
+  def state(self):
+    raise NotImplementedError
+
+
+class BatchedBreakout(BatchedMinAtar):
+  '''
+  Batched MinAtar Breakout
+  '''
+  channels = ['paddle', 'ball', 'trail', 'brick']
+  # Ball moves of ball_dir and the new ball_dir after bounces
+  dx = np.array([-1, 1, 1, -1])
+  dy = np.array([-1, -1, 1, 1])
+  side_bounce = np.array([1, 0, 3, 2])
+  vertical_bounce = np.array([3, 2, 1, 0])
+  paddle_side_bounce = np.array([2, 3, 0, 1])
+
+  def allocate(self):
+    n = self.num_envs
+    for key in ['ball_x', 'ball_y', 'ball_dir', 'pos', 'last_x', 'last_y']:
+      setattr(self, key, np.zeros(n, dtype=int))
+    self.brick_map = np.zeros((n, 10, 10), dtype=bool)
+    self.strike = np.zeros(n, dtype=bool)
+
+  def reset_games(self, idxs):
+    ball_start = np.array([self.random[i].randint(2) for i in idxs], dtype=int)
+    self.ball_y[idxs] = 3
+    self.ball_x[idxs] = np.where(ball_start == 0, 0, 9)
+    self.ball_dir[idxs] = np.where(ball_start == 0, 2, 3)
+    self.pos[idxs] = 4
+    self.brick_map[idxs] = False
+    self.brick_map[idxs, 1:4, :] = True
+    self.strike[idxs] = False
+    self.last_x[idxs] = self.ball_x[idxs]
+    self.last_y[idxs] = self.ball_y[idxs]
+
+  def act(self, a):
+    r = np.zeros(self.num_envs)
+    # Resolve player action
+    self.pos = np.where(a == 1, np.maximum(0, self.pos-1), np.where(a == 3, np.minimum(9, self.pos+1), self.pos))
+    # Update ball position
+    self.last_x, self.last_y = self.ball_x, self.ball_y
+    new_x = self.ball_x + self.dx[self.ball_dir]
+    new_y = self.ball_y + self.dy[self.ball_dir]
+    side = (new_x < 0) | (new_x > 9)
+    new_x = np.clip(new_x, 0, 9)
+    ball_dir = np.where(side, self.side_bounce[self.ball_dir], self.ball_dir)
+    top = new_y < 0
+    new_y = np.where(top, 0, new_y)
+    ball_dir = np.where(top, self.vertical_bounce[ball_dir], ball_dir)
+    # Hit a brick
+    strike_toggle = ~top & self.brick_map[self.envs, new_y, new_x]
+    hit = strike_toggle & ~self.strike
+    r[hit] += 1
+    self.strike = self.strike | hit
+    self.brick_map[self.envs[hit], new_y[hit], new_x[hit]] = False
+    new_y = np.where(hit, self.last_y, new_y)
+    ball_dir = np.where(hit, self.vertical_bounce[ball_dir], ball_dir)
+    # Reach the bottom
+    bottom = ~top & ~strike_toggle & (new_y == 9)
+    refill = bottom & ~self.brick_map.any(axis=(1, 2))
+    self.brick_map[refill, 1:4, :] = True
+    paddle_back = bottom & (self.ball_x == self.pos)
+    paddle_side = bottom & ~paddle_back & (new_x == self.pos)
+    ball_dir = np.where(paddle_back, self.vertical_bounce[ball_dir], ball_dir)
+    ball_dir = np.where(paddle_side, self.paddle_side_bounce[ball_dir], ball_dir)
+    new_y = np.where(paddle_back | paddle_side, self.last_y, new_y)
+    terminal = bottom & ~paddle_back & ~paddle_side
+    self.strike = self.strike & strike_toggle
+    self.ball_x, self.ball_y, self.ball_dir = new_x, new_y, ball_dir
+    return r, terminal
+
+  def state(self):
+    state = np.zeros((self.num_envs, len(self.channels), 10, 10), dtype=bool)
+    state[self.envs, 1, self.ball_y, self.ball_x] = True
+    state[self.envs, 0, 9, self.pos] = True
+    state[self.envs, 2, self.last_y, self.last_x] = True
+    state[:, 3] = self.brick_map
+    return state
+
+
+class BatchedAsterix(BatchedMinAtar):
+  '''
+  Batched MinAtar Asterix: entity i moves in row i+1
+  '''
+  channels = ['player', 'enemy', 'trail', 'gold']
+  ramp_interval = 100
+  init_spawn_speed = 10
+  init_move_interval = 5
+
+  def allocate(self):
+    n = self.num_envs
+    for key in ['player_x', 'player_y', 'spawn_speed', 'spawn_timer', 'move_speed', 'move_timer', 'ramp_timer', 'ramp_index']:
+      setattr(self, key, np.zeros(n, dtype=int))
+    self.entity_x = np.zeros((n, 8), dtype=int)
+    for key in ['entity_active', 'entity_lr', 'entity_gold']:
+      setattr(self, key, np.zeros((n, 8), dtype=bool))
+    self.entity_y = np.arange(1, 9)[None, :]
+
+  def reset_games(self, idxs):
+    self.player_x[idxs] = 5
+    self.player_y[idxs] = 5
+    self.entity_active[idxs] = False
+    self.spawn_speed[idxs] = self.init_spawn_speed
+    self.spawn_timer[idxs] = self.init_spawn_speed
+    self.move_speed[idxs] = self.init_move_interval
+    self.move_timer[idxs] = self.init_move_interval
+    self.ramp_timer[idxs] = self.ramp_interval
+    self.ramp_index[idxs] = 0
+
+  def spawn_entity(self, i):
+    # Spawn a new enemy or treasure in a random free row with a random direction
+    lr = self.random[i].randint(2) == 0
+    is_gold = self.random[i].rand() < 1/3
+    slot_options = np.nonzero(~self.entity_active[i])[0]
+    if len(slot_options) == 0:
+      return
+    slot = slot_options[self.random[i].randint(len(slot_options))]
+    self.entity_active[i, slot] = True
+    self.entity_x[i, slot] = 0 if lr else 9
+    self.entity_lr[i, slot] = lr
+    self.entity_gold[i, slot] = is_gold
+
+  def collide(self, entities, r, terminal):
+    # Pick up treasure or get caught by enemies at the player position
+    hit = entities & (self.entity_x == self.player_x[:, None]) & (self.entity_y == self.player_y[:, None])
+    r += (hit & self.entity_gold).sum(axis=1)
+    terminal |= (hit & ~self.entity_gold).any(axis=1)
+    self.entity_active &= ~(hit & self.entity_gold)
+
+  def act(self, a):
+    r = np.zeros(self.num_envs)
+    terminal = np.zeros(self.num_envs, dtype=bool)
+    # Spawn enemy if timer is up
+    spawn = self.spawn_timer == 0
+    for i in np.nonzero(spawn)[0]:
+      self.spawn_entity(i)
+    self.spawn_timer = np.where(spawn, self.spawn_speed, self.spawn_timer)
+    # Resolve player action
+    self.player_x = np.where(a == 1, np.maximum(0, self.player_x-1), np.where(a == 3, np.minimum(9, self.player_x+1), self.player_x))
+    self.player_y = np.where(a == 2, np.maximum(1, self.player_y-1), np.where(a == 4, np.minimum(8, self.player_y+1), self.player_y))
+    # Update entities
+    self.collide(self.entity_active, r, terminal)
+    move = self.move_timer == 0
+    self.move_timer = np.where(move, self.move_speed, self.move_timer)
+    moving = self.entity_active & move[:, None]
+    self.entity_x = np.where(moving, self.entity_x + np.where(self.entity_lr, 1, -1), self.entity_x)
+    self.entity_active &= ~(moving & ((self.entity_x < 0) | (self.entity_x > 9)))
+    self.collide(moving & self.entity_active, r, terminal)
+    # Update various timers
+    self.spawn_timer -= 1
+    self.move_timer -= 1
+    # Ramp difficulty if interval has elapsed
+    if self.ramping:
+      ramp = (self.spawn_speed > 1) | (self.move_speed > 1)
+      count_down = ramp & (self.ramp_timer >= 0)
+      level_up = ramp & ~count_down
+      self.ramp_timer -= count_down
+      self.move_speed -= level_up & (self.move_speed > 1) & (self.ramp_index % 2 == 1)
+      self.spawn_speed -= level_up & (self.spawn_speed > 1)
+      self.ramp_index += level_up
+      self.ramp_timer[level_up] = self.ramp_interval
+    return r, terminal
+
+  def state(self):
+    state = np.zeros((self.num_envs, len(self.channels), 10, 10), dtype=bool)
+    state[self.envs, 0, self.player_y, self.player_x] = True
+    envs, slots = np.nonzero(self.entity_active)
+    x, y, lr = self.entity_x[envs, slots], slots + 1, self.entity_lr[envs, slots]
+    state[envs, np.where(self.entity_gold[envs, slots], 3, 1), y, x] = True
+    back_x = np.where(lr, x-1, x+1)
+    inside = (back_x >= 0) & (back_x <= 9)
+    state[envs[inside], 2, y[inside], back_x[inside]] = True
+    return state
+
+
+class BatchedSpaceInvaders(BatchedMinAtar):
+  '''
+  Batched MinAtar SpaceInvaders
+  '''
+  channels = ['cannon', 'alien', 'alien_left', 'alien_right', 'friendly_bullet', 'enemy_bullet']
+  shot_cool_down = 5
+  enemy_move_interval = 12
+  enemy_shot_interval = 10
+
+  def allocate(self):
+    n = self.num_envs
+    for key in ['pos', 'alien_dir', 'move_interval', 'alien_move_timer', 'alien_shot_timer', 'ramp_index', 'shot_timer']:
+      setattr(self, key, np.zeros(n, dtype=int))
+    for key in ['f_bullet_map', 'e_bullet_map', 'alien_map']:
+      setattr(self, key, np.zeros((n, 10, 10), dtype=bool))
+
+  def reset_games(self, idxs):
+    self.pos[idxs] = 5
+    self.f_bullet_map[idxs] = False
+    self.e_bullet_map[idxs] = False
+    self.alien_map[idxs] = False
+    self.alien_map[idxs, 0:4, 2:8] = True
+    self.alien_dir[idxs] = -1
+    self.move_interval[idxs] = self.enemy_move_interval
+    self.alien_move_timer[idxs] = self.enemy_move_interval
+    self.alien_shot_timer[idxs] = self.enemy_shot_interval
+    self.ramp_index[idxs] = 0
+    self.shot_timer[idxs] = 0
+
+  def act(self, a):
+    terminal = np.zeros(self.num_envs, dtype=bool)
+    # Resolve player action
+    fire = (a == 5) & (self.shot_timer == 0)
+    self.f_bullet_map[self.envs[fire], 9, self.pos[fire]] = True
+    self.shot_timer[fire] = self.shot_cool_down
+    self.pos = np.where(a == 1, np.maximum(0, self.pos-1), np.where(a == 3, np.minimum(9, self.pos+1), self.pos))
+    # Update friendly bullets (up) and enemy bullets (down)
+    self.f_bullet_map[:, :9] = self.f_bullet_map[:, 1:].copy()
+    self.f_bullet_map[:, 9] = False
+    self.e_bullet_map[:, 1:] = self.e_bullet_map[:, :9].copy()
+    self.e_bullet_map[:, 0] = False
+    terminal |= self.e_bullet_map[self.envs, 9, self.pos]
+    # Update aliens
+    terminal |= self.alien_map[self.envs, 9, self.pos]
+    move = self.alien_move_timer == 0
+    if move.any():
+      num_aliens = self.alien_map.sum(axis=(1, 2))
+      self.alien_move_timer = np.where(move, np.minimum(num_aliens, self.move_interval), self.alien_move_timer)
+      turn = move & ((self.alien_map[:, :, 0].any(axis=1) & (self.alien_dir < 0)) | (self.alien_map[:, :, 9].any(axis=1) & (self.alien_dir > 0)))
+      self.alien_dir = np.where(turn, -self.alien_dir, self.alien_dir)
+      terminal |= turn & self.alien_map[:, 9, :].any(axis=1)
+      left = move & ~turn & (self.alien_dir < 0)
+      right = move & ~turn & (self.alien_dir > 0)
+      self.alien_map[turn] = np.roll(self.alien_map[turn], 1, axis=1)
+      self.alien_map[left] = np.roll(self.alien_map[left], -1, axis=2)
+      self.alien_map[right] = np.roll(self.alien_map[right], 1, axis=2)
+      terminal |= move & self.alien_map[self.envs, 9, self.pos]
+    shoot = np.nonzero(self.alien_shot_timer == 0)[0]
+    if len(shoot) > 0:
+      self.alien_shot_timer[shoot] = self.enemy_shot_interval
+      # The lowest alien in the nearest column to the player shoots; ties go to the left column
+      columns = np.arange(10)
+      alien_columns = self.alien_map[shoot].any(axis=1)
+      distance = np.abs(columns[None, :] - self.pos[shoot, None]) * 10 + columns[None, :]
+      column = np.argmin(np.where(alien_columns, distance, 1000), axis=1)
+      row = 9 - np.argmax(self.alien_map[shoot, ::-1, column], axis=1)
+      self.e_bullet_map[shoot, row, column] = True
+    kill_locations = self.alien_map & self.f_bullet_map
+    r = kill_locations.sum(axis=(1, 2)).astype(float)
+    self.alien_map &= ~kill_locations
+    self.f_bullet_map &= ~kill_locations
+    # Update various timers
+    self.shot_timer -= self.shot_timer > 0
+    self.alien_move_timer -= 1
+    self.alien_shot_timer -= 1
+    # Spawn a new wave of aliens
+    cleared = ~self.alien_map.any(axis=(1, 2))
+    if self.ramping:
+      ramp = cleared & (self.move_interval > 6)
+      self.move_interval -= ramp
+      self.ramp_index += ramp
+    self.alien_map[cleared, 0:4, 2:8] = True
+    return r, terminal
+
+  def state(self):
+    state = np.zeros((self.num_envs, len(self.channels), 10, 10), dtype=bool)
+    state[self.envs, 0, 9, self.pos] = True
+    state[:, 1] = self.alien_map
+    state[:, 2] = self.alien_map & (self.alien_dir < 0)[:, None, None]
+    state[:, 3] = self.alien_map & (self.alien_dir >= 0)[:, None, None]
+    state[:, 4] = self.f_bullet_map
+    state[:, 5] = self.e_bullet_map
+    return state
+
+
+class EntityList(object):
+  '''
+  One list of entities per game, stored in (num_envs, capacity) arrays and used by BatchedSeaquest.
+  Entities are appended with increasing order, which keeps the list order of MinAtar.
+  The capacity is doubled when a list is full.
+  '''
+  def __init__(self, num_envs, keys, capacity=8):
+    self.keys = keys
+    self.active = np.zeros((num_envs, capacity), dtype=bool)
+    self.order = np.zeros((num_envs, capacity), dtype=np.int64)
+    for key in keys:
+      setattr(self, key, np.zeros((num_envs, capacity), dtype=int))
+    self.next_order = 0
+
+  def clear(self, idxs):
+    self.active[idxs] = False
+
+  def grow(self):
+    for key in ['active', 'order'] + self.keys:
+      value = getattr(self, key)
+      setattr(self, key, np.concatenate([value, np.zeros_like(value)], axis=1))
+
+  def append(self, idxs, **values):
+    # Append entities to the lists of games idxs in the given order, a game can appear more than once
+    if len(idxs) == 0:
+      return
+    counts = np.bincount(idxs, minlength=len(self.active))
+    while (counts > (~self.active).sum(axis=1)).any():
+      self.grow()
+    if counts.max() == 1:
+      slots = np.argmax(~self.active[idxs], axis=1)
+    else:
+      # The k-th new entity of a game takes the k-th free slot of the game
+      sort = np.argsort(idxs, kind='stable')
+      group_start = np.searchsorted(idxs[sort], idxs[sort])
+      rank = np.empty(len(idxs), dtype=int)
+      rank[sort] = np.arange(len(idxs)) - group_start
+      slots = np.argsort(self.active[idxs], axis=1, kind='stable')[np.arange(len(idxs)), rank]
+    self.active[idxs, slots] = True
+    self.order[idxs, slots] = self.next_order + np.arange(len(idxs))
+    self.next_order += len(idxs)
+    for key, value in values.items():
+      getattr(self, key)[idxs, slots] = value
+
+  def reversed_slots(self, idxs):
+    # Slots of games idxs in reversed list order, and the number of entities of each game
+    slots = np.argsort(-np.where(self.active[idxs], self.order[idxs], -1), axis=1, kind='stable')
+    return slots, self.active[idxs].sum(axis=1)
+
+  def first_at(self, idxs, x, y):
+    # The slot of the first entity at (x, y) for each game in idxs, -1 if there is none
+    match = self.active[idxs] & (self.x[idxs] == x[:, None]) & (self.y[idxs] == y[:, None])
+    slots = np.argmin(np.where(match, self.order[idxs], np.iinfo(np.int64).max), axis=1)
+    return np.where(match.any(axis=1), slots, -1)
+
+  def first_cells(self):
+    '''
+    The slot of the first entity in each cell of each game, in a (num_envs * 100) array indexed by
+    game * 100 + y * 10 + x, -1 for empty cells
+    '''
+    envs, slots = np.nonzero(self.active)
+    cells = envs * 100 + self.y[envs, slots] * 10 + self.x[envs, slots]
+    sort = np.lexsort((self.order[envs, slots], cells))
+    cells, slots = cells[sort], slots[sort]
+    first = np.ones(len(cells), dtype=bool)
+    first[1:] = cells[1:] != cells[:-1]
+    first_slots = np.full(len(self.active) * 100, -1)
+    first_slots[cells[first]] = slots[first]
+    return first_slots
+
+  def first_match(self, mask, x, y):
+    '''
+    For every entity of another list in (num_envs, n) arrays (mask, x, y), the slot of the first
+    entity of this list at the same position, and whether there is one
+    '''
+    cells = np.where(mask, np.arange(len(mask))[:, None] * 100 + y * 10 + x, 0)
+    slots = self.first_cells()[cells]
+    return slots, mask & (slots >= 0)
+
+
+def same_cell(mask, x, y):
+  # Whether any two entities (in mask) of a game are in the same cell
+  cell = np.where(mask, y * 10 + x, -1 - np.arange(mask.shape[1]))
+  cell.sort(axis=1)
+  return ((cell[:, 1:] == cell[:, :-1]) & (cell[:, 1:] >= 0)).any(axis=1)
+
+
+class BatchedSeaquest(BatchedMinAtar):
+  '''
+  Batched MinAtar Seaquest.
+  The entities of each type are kept in EntityLists. MinAtar updates them one at a time in reversed list order,
+  so an update can remove an entity checked by a later update. All entities are updated at once in games
+  where the order does not matter (e.g. no two bullets in the same cell), and one at a time in the other games.
+  '''
+  channels = ['sub_front', 'sub_back', 'friendly_bullet', 'trail', 'enemy_bullet', 'enemy_fish', 'enemy_sub', 'oxygen_guage', 'diver_guage', 'diver']
+  max_oxygen = 200
+  init_spawn_speed = 20
+  diver_spawn_speed = 30
+  init_move_interval = 5
+  shot_cool_down = 5
+  enemy_shot_interval = 10
+  diver_move_interval = 5
+
+  def allocate(self):
+    n = self.num_envs
+    for key in ['oxygen', 'diver_count', 'sub_x', 'sub_y', 'e_spawn_speed', 'e_spawn_timer', 'd_spawn_timer', 'move_speed', 'ramp_index', 'shot_timer']:
+      setattr(self, key, np.zeros(n, dtype=int))
+    self.sub_or = np.zeros(n, dtype=bool)
+    self.surface = np.zeros(n, dtype=bool)
+    self.f_bullets = EntityList(n, ['x', 'y', 'lr'])
+    self.e_bullets = EntityList(n, ['x', 'y', 'lr'])
+    self.e_fish = EntityList(n, ['x', 'y', 'lr', 'timer'])
+    self.e_subs = EntityList(n, ['x', 'y', 'lr', 'timer', 'shot_timer'])
+    self.divers = EntityList(n, ['x', 'y', 'lr', 'timer'])
+
+  def reset_games(self, idxs):
+    self.oxygen[idxs] = self.max_oxygen
+    self.diver_count[idxs] = 0
+    self.sub_x[idxs] = 5
+    self.sub_y[idxs] = 0
+    self.sub_or[idxs] = False
+    for entities in [self.f_bullets, self.e_bullets, self.e_fish, self.e_subs, self.divers]:
+      entities.clear(idxs)
+    self.e_spawn_speed[idxs] = self.init_spawn_speed
+    self.e_spawn_timer[idxs] = self.init_spawn_speed
+    self.d_spawn_timer[idxs] = self.diver_spawn_speed
+    self.move_speed[idxs] = self.init_move_interval
+    self.ramp_index[idxs] = 0
+    self.shot_timer[idxs] = 0
+    self.surface[idxs] = True
+
+  def spawn(self, spawn_enemy, spawn_diver):
+    '''
+    Spawn an enemy fish or submarine in a random row with a random direction, unless an enemy in the same row
+    moves in the opposite direction. Spawn a diver in a random row with a random direction.
+    '''
+    # Random draws of each game, in the order of MinAtar
+    enemy_idxs, diver_idxs = np.nonzero(spawn_enemy)[0], np.nonzero(spawn_diver)[0]
+    enemy_draws, diver_draws = [], []
+    for i in np.nonzero(spawn_enemy | spawn_diver)[0]:
+      random = self.random[i]
+      if spawn_enemy[i]:
+        enemy_draws.append((random.randint(2) == 0, random.rand() < 1/3, random.randint(low=1, high=9)))
+      if spawn_diver[i]:
+        diver_draws.append((random.randint(2) == 0, random.randint(low=1, high=9)))
+    new = {}
+    if len(enemy_idxs) > 0:
+      lr, is_sub, y = [np.array(v) for v in zip(*enemy_draws)]
+      blocked = np.zeros(len(enemy_idxs), dtype=bool)
+      for enemies in [self.e_subs, self.e_fish]:
+        blocked |= (enemies.active[enemy_idxs] & (enemies.y[enemy_idxs] == y[:, None]) & (enemies.lr[enemy_idxs] != lr[:, None])).any(axis=1)
+      for key, new_idxs in [('sub', ~blocked & is_sub), ('fish', ~blocked & ~is_sub)]:
+        new[key] = (enemy_idxs[new_idxs], y[new_idxs], lr[new_idxs])
+    if len(diver_idxs) > 0:
+      lr, y = [np.array(v) for v in zip(*diver_draws)]
+      new['diver'] = (diver_idxs, y, lr)
+    for key, entities in [('sub', self.e_subs), ('fish', self.e_fish), ('diver', self.divers)]:
+      if key in new and len(new[key][0]) > 0:
+        idxs, y, lr = new[key]
+        timer = self.diver_move_interval if key == 'diver' else self.move_speed[idxs]
+        kwargs = {'shot_timer': self.enemy_shot_interval} if key == 'sub' else {}
+        entities.append(idxs, x=np.where(lr, 0, 9), y=y, lr=lr, timer=timer, **kwargs)
+
+  def at_sub(self, entities, idxs, slots):
+    return (entities.x[idxs, slots] == self.sub_x[idxs]) & (entities.y[idxs, slots] == self.sub_y[idxs])
+
+  def move(self, entities, idxs, slots):
+    # Move entities one cell in their directions, remove those leaving the screen and return them
+    entities.x[idxs, slots] += np.where(entities.lr[idxs, slots], 1, -1)
+    out = (entities.x[idxs, slots] < 0) | (entities.x[idxs, slots] > 9)
+    entities.active[idxs[out], slots[out]] = False
+    return out
+
+  def update_f_bullets(self, r):
+    # Friendly bullets move and hit the first fish, otherwise the first submarine, in their cells
+    bullets = self.f_bullets
+    x = np.where(bullets.active, bullets.x + np.where(bullets.lr, 1, -1), bullets.x)
+    out = bullets.active & ((x < 0) | (x > 9))
+    remaining = bullets.active & ~out
+    in_order = same_cell(remaining, x, bullets.y)
+    fast = ~in_order[:, None]
+    bullets.x = np.where(fast, x, bullets.x)
+    bullets.active &= ~(out & fast)
+    remaining &= fast
+    for enemies in [self.e_fish, self.e_subs]:
+      slots, hit = enemies.first_match(remaining, bullets.x, bullets.y)
+      envs, bullet_slots = np.nonzero(hit)
+      enemies.active[envs, slots[envs, bullet_slots]] = False
+      bullets.active[envs, bullet_slots] = False
+      r += hit.sum(axis=1)
+      remaining &= ~hit
+    # Games with bullets in the same cell
+    envs = np.nonzero(in_order)[0]
+    slots, counts = bullets.reversed_slots(envs)
+    for k in range(counts.max(initial=0)):
+      idxs, slot = envs[counts > k], slots[counts > k, k]
+      out = self.move(bullets, idxs, slot)
+      idxs, slot = idxs[~out], slot[~out]
+      for enemies in [self.e_fish, self.e_subs]:
+        hits = enemies.first_at(idxs, bullets.x[idxs, slot], bullets.y[idxs, slot])
+        hit = hits >= 0
+        enemies.active[idxs[hit], hits[hit]] = False
+        bullets.active[idxs[hit], slot[hit]] = False
+        r[idxs[hit]] += 1
+        idxs, slot = idxs[~hit], slot[~hit]
+
+  def update_divers(self):
+    # Divers are picked up at the submarine (at most 6 on board), otherwise they move
+    divers = self.divers
+    sub_x, sub_y = self.sub_x[:, None], self.sub_y[:, None]
+    active = divers.active
+    pick_up = active & (divers.x == sub_x) & (divers.y == sub_y)
+    move = active & ~pick_up & (divers.timer == 0)
+    x = np.where(move, divers.x + np.where(divers.lr, 1, -1), divers.x)
+    out = move & ((x < 0) | (x > 9))
+    move_pick_up = move & ~out & (x == sub_x) & (divers.y == sub_y)
+    num_pick_up = pick_up.sum(axis=1) + move_pick_up.sum(axis=1)
+    # The order matters only when the submarine gets full
+    in_order = (num_pick_up > 0) & (self.diver_count + num_pick_up > 6)
+    fast = ~in_order[:, None]
+    divers.timer = np.where(fast & active & ~pick_up, np.where(move, self.diver_move_interval, divers.timer - 1), divers.timer)
+    divers.x = np.where(fast, x, divers.x)
+    divers.active &= ~(fast & (pick_up | out | move_pick_up))
+    self.diver_count += np.where(in_order, 0, num_pick_up)
+    envs = np.nonzero(in_order)[0]
+    slots, counts = divers.reversed_slots(envs)
+    for k in range(counts.max(initial=0)):
+      idxs, slot = envs[counts > k], slots[counts > k, k]
+      pick_up = self.at_sub(divers, idxs, slot) & (self.diver_count[idxs] < 6)
+      divers.active[idxs[pick_up], slot[pick_up]] = False
+      self.diver_count[idxs[pick_up]] += 1
+      idxs, slot = idxs[~pick_up], slot[~pick_up]
+      move = divers.timer[idxs, slot] == 0
+      divers.timer[idxs[~move], slot[~move]] -= 1
+      idxs, slot = idxs[move], slot[move]
+      divers.timer[idxs, slot] = self.diver_move_interval
+      out = self.move(divers, idxs, slot)
+      idxs, slot = idxs[~out], slot[~out]
+      pick_up = self.at_sub(divers, idxs, slot) & (self.diver_count[idxs] < 6)
+      divers.active[idxs[pick_up], slot[pick_up]] = False
+      self.diver_count[idxs[pick_up]] += 1
+
+  def update_enemies(self, enemies, r, terminal):
+    '''
+    Enemies touching the submarine end the game. Moving enemies leave the screen, reach the submarine
+    or hit the first friendly bullet in their new cells. Submarines also shoot, including those just removed.
+    '''
+    bullets = self.f_bullets
+    is_sub = enemies is self.e_subs
+    sub_x, sub_y = self.sub_x[:, None], self.sub_y[:, None]
+    active = enemies.active.copy()
+    move = active & (enemies.timer == 0)
+    x = np.where(move, enemies.x + np.where(enemies.lr, 1, -1), enemies.x)
+    out = move & ((x < 0) | (x > 9))
+    move_at_sub = move & ~out & (x == sub_x) & (enemies.y == sub_y)
+    check = move & ~out & ~move_at_sub
+    bullet_slots, hit = bullets.first_match(check, x, enemies.y)
+    # The order matters only when enemies in the same cell hit a bullet
+    in_order = same_cell(hit, x, enemies.y)
+    fast = ~in_order[:, None]
+    terminal |= (fast & active & (enemies.x == sub_x) & (enemies.y == sub_y)).any(axis=1)
+    terminal |= (fast & move_at_sub).any(axis=1)
+    enemies.timer = np.where(fast & active, np.where(move, self.move_speed[:, None], enemies.timer - 1), enemies.timer)
+    enemies.x = np.where(fast, x, enemies.x)
+    hit &= fast
+    envs, slots = np.nonzero(hit)
+    bullets.active[envs, bullet_slots[envs, slots]] = False
+    enemies.active &= ~(fast & (out | hit))
+    r += hit.sum(axis=1)
+    if is_sub:
+      shoot = fast & active & (enemies.shot_timer == 0)
+      enemies.shot_timer = np.where(fast & active, np.where(shoot, self.enemy_shot_interval, enemies.shot_timer - 1), enemies.shot_timer)
+      envs, slots = np.nonzero(shoot)
+      # Submarines shoot in reversed list order
+      sort = np.argsort(-enemies.order[envs, slots], kind='stable')
+      envs, slots = envs[sort], slots[sort]
+      self.e_bullets.append(envs, x=enemies.x[envs, slots], y=enemies.y[envs, slots], lr=enemies.lr[envs, slots])
+    # Games with enemies in the same cell hitting bullets
+    envs = np.nonzero(in_order)[0]
+    slots, counts = enemies.reversed_slots(envs)
+    for k in range(counts.max(initial=0)):
+      idxs, slot = envs[counts > k], slots[counts > k, k]
+      terminal[idxs] |= self.at_sub(enemies, idxs, slot)
+      move = enemies.timer[idxs, slot] == 0
+      enemies.timer[idxs[~move], slot[~move]] -= 1
+      m_idxs, m_slot = idxs[move], slot[move]
+      enemies.timer[m_idxs, m_slot] = self.move_speed[m_idxs]
+      out = self.move(enemies, m_idxs, m_slot)
+      m_idxs, m_slot = m_idxs[~out], m_slot[~out]
+      at_sub = self.at_sub(enemies, m_idxs, m_slot)
+      terminal[m_idxs[at_sub]] = True
+      m_idxs, m_slot = m_idxs[~at_sub], m_slot[~at_sub]
+      hits = bullets.first_at(m_idxs, enemies.x[m_idxs, m_slot], enemies.y[m_idxs, m_slot])
+      hit = hits >= 0
+      enemies.active[m_idxs[hit], m_slot[hit]] = False
+      bullets.active[m_idxs[hit], hits[hit]] = False
+      r[m_idxs[hit]] += 1
+      if is_sub:
+        shoot = enemies.shot_timer[idxs, slot] == 0
+        enemies.shot_timer[idxs[~shoot], slot[~shoot]] -= 1
+        s_idxs, s_slot = idxs[shoot], slot[shoot]
+        enemies.shot_timer[s_idxs, s_slot] = self.enemy_shot_interval
+        self.e_bullets.append(s_idxs, x=enemies.x[s_idxs, s_slot], y=enemies.y[s_idxs, s_slot], lr=enemies.lr[s_idxs, s_slot])
+
+  def update_e_bullets(self, terminal):
+    # Enemy bullets touching the submarine before or after moving end the game
+    bullets = self.e_bullets
+    sub_x, sub_y = self.sub_x[:, None], self.sub_y[:, None]
+    terminal |= (bullets.active & (bullets.x == sub_x) & (bullets.y == sub_y)).any(axis=1)
+    bullets.x = np.where(bullets.active, bullets.x + np.where(bullets.lr, 1, -1), bullets.x)
+    bullets.active &= (bullets.x >= 0) & (bullets.x <= 9)
+    terminal |= (bullets.active & (bullets.x == sub_x) & (bullets.y == sub_y)).any(axis=1)
+
+  def act(self, a):
+    r = np.zeros(self.num_envs)
+    terminal = np.zeros(self.num_envs, dtype=bool)
+    # Spawn enemies and divers if timers are up
+    spawn_enemy = self.e_spawn_timer == 0
+    spawn_diver = self.d_spawn_timer == 0
+    if spawn_enemy.any() or spawn_diver.any():
+      self.spawn(spawn_enemy, spawn_diver)
+    self.e_spawn_timer = np.where(spawn_enemy, self.e_spawn_speed, self.e_spawn_timer)
+    self.d_spawn_timer = np.where(spawn_diver, self.diver_spawn_speed, self.d_spawn_timer)
+    # Resolve player action
+    fire = np.nonzero((a == 5) & (self.shot_timer == 0))[0]
+    self.f_bullets.append(fire, x=self.sub_x[fire], y=self.sub_y[fire], lr=self.sub_or[fire])
+    self.shot_timer[fire] = self.shot_cool_down
+    self.sub_or = np.where(a == 1, False, np.where(a == 3, True, self.sub_or))
+    self.sub_x = np.where(a == 1, np.maximum(0, self.sub_x-1), np.where(a == 3, np.minimum(9, self.sub_x+1), self.sub_x))
+    self.sub_y = np.where(a == 2, np.maximum(0, self.sub_y-1), np.where(a == 4, np.minimum(8, self.sub_y+1), self.sub_y))
+    # Update entities
+    self.update_f_bullets(r)
+    self.update_divers()
+    self.update_enemies(self.e_subs, r, terminal)
+    self.update_e_bullets(terminal)
+    self.update_enemies(self.e_fish, r, terminal)
+    # Update various timers
+    self.e_spawn_timer -= self.e_spawn_timer > 0
+    self.d_spawn_timer -= self.d_spawn_timer > 0
+    self.shot_timer -= self.shot_timer > 0
+    terminal |= self.oxygen <= 0
+    below = self.sub_y > 0
+    self.oxygen -= below
+    self.surface &= ~below
+    surfacing = ~below & ~self.surface
+    terminal |= surfacing & (self.diver_count == 0)
+    self.surface_sub(np.nonzero(surfacing & (self.diver_count != 0))[0], r)
+    return r, terminal
+
+  def surface_sub(self, idxs, r):
+    # Surface with rescued divers: get rewards for the remaining oxygen with 6 divers, refill oxygen and ramp difficulty
+    self.surface[idxs] = True
+    full = idxs[self.diver_count[idxs] == 6]
+    self.diver_count[full] = 0
+    r[full] += self.oxygen[full] * 10 // self.max_oxygen
+    self.oxygen[idxs] = self.max_oxygen
+    self.diver_count[idxs] -= 1
+    if self.ramping:
+      idxs = idxs[(self.e_spawn_speed[idxs] > 1) | (self.move_speed[idxs] > 2)]
+      self.move_speed[idxs] -= (self.move_speed[idxs] > 2) & (self.ramp_index[idxs] % 2 == 1)
+      self.e_spawn_speed[idxs] -= self.e_spawn_speed[idxs] > 1
+      self.ramp_index[idxs] += 1
+
+  def state(self):
+    state = np.zeros((self.num_envs, len(self.channels), 10, 10), dtype=bool)
+    state[self.envs, 0, self.sub_y, self.sub_x] = True
+    state[self.envs, 1, self.sub_y, np.where(self.sub_or, self.sub_x-1, self.sub_x+1)] = True
+    columns = np.arange(10)[None, :]
+    state[:, 7, 9] = columns < (np.maximum(0, self.oxygen) * 10 // self.max_oxygen)[:, None]
+    state[:, 8, 9] = (columns >= 9 - self.diver_count[:, None]) & (columns < 9)
+    # Set all entities and trails at once
+    cells = []
+    for entities, channel, trail in [(self.f_bullets, 2, False), (self.e_bullets, 4, False), (self.e_fish, 5, True), (self.e_subs, 6, True), (self.divers, 9, True)]:
+      envs, slots = np.nonzero(entities.active)
+      x, y = entities.x[envs, slots], entities.y[envs, slots]
+      cells.append((envs, np.full(len(envs), channel), y, x))
+      if trail:
+        back_x = np.where(entities.lr[envs, slots], x-1, x+1)
+        inside = (back_x >= 0) & (back_x <= 9)
+        cells.append((envs[inside], np.full(inside.sum(), 3), y[inside], back_x[inside]))
+    envs, channels, y, x = [np.concatenate(v) for v in zip(*cells)]
+    state[envs, channels, y, x] = True
+    return state
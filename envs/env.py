@@ -1,22 +1,65 @@
+import re
 import gym
-import gym_pygame
-import gym_minatar
-import gym_exploration
+import importlib
+from functools import partial
 from gym.wrappers.time_limit import TimeLimit
 
 from envs.wrapper import *
+from envs.vec_env import *
+from envs.batched_minatar import make_batched_minatar
 
 
-def make_env(env_name, max_episode_steps, episode_life=True):
+def import_modules(*module_names):
+  # A loader that imports modules which register environments with gym
+  return lambda: [importlib.import_module(name) for name in module_names]
+
+# Environment registry: env name patterns and the loaders of the packages that provide them.
+# Only the package an environment needs is imported, the first time it is made.
+env_loaders = [
+  (r'-MinAtar-', import_modules('gym_minatar')),            # e.g. Breakout-MinAtar-v0
+  (r'-PLE-', import_modules('gym_pygame')),                 # e.g. Catcher-PLE-v0
+  (r'BulletEnv', import_modules('pybullet', 'pybullet_envs')) # e.g. AntBulletEnv-v0
+]
+# Packages to try for environments that match no pattern and are not registered with gym
+fallback_modules = ['gym_exploration', 'gym_pygame', 'gym_minatar']
+
+def register_env_loader(pattern, loader):
+  '''
+  Register a loader (a function without arguments) for the environments whose names match the regular expression pattern
+  '''
+  env_loaders.append((pattern, loader))
+
+def load_env(env_name):
+  '''
+  Import the package that provides env_name (if any), before making it with gym
+  '''
+  for pattern, loader in env_loaders:
+    if re.search(pattern, env_name):
+      loader()
+      return
+  try:
+    gym.spec(env_name)
+  except gym.error.Error:
+    for module_name in fallback_modules:
+      try:
+        importlib.import_module(module_name)
+      except ImportError:
+        continue
+      try:
+        gym.spec(env_name)
+        return
+      except gym.error.Error:
+        pass
+
+
+def make_env(env_name, max_episode_steps, episode_life=True, fused_preprocessing=False):
   if 'DMC' in env_name:
     import dmc2gym
     domain, task, _ = env_name.split('-')  # reacher-hard-DMC
     env = dmc2gym.make(domain_name=domain, task_name=task)
     env_group_title = 'dmc'
   else:
-    if 'BulletEnv' in env_name:
-      import pybullet
-      import pybullet_envs
+    load_env(env_name)
     env = gym.make(env_name)
     env_group_title = get_env_group_title(env)
   
@@ -26,6 +69,18 @@ def make_env(env_name, max_episode_steps, episode_life=True):
       env = TransposeImage(env)
   elif env_group_title == 'atari' and '-ram' in env_name:
     make_atari_ram(env, max_episode_steps, scale=True)
+  elif env_group_title == 'atari' and fused_preprocessing:
+    # Max pooling, grayscale, resize and frame stacking write into preallocated buffers,
+    # observations are read-only views that are overwritten after a while (see WarpFrameStack)
+    env = make_atari(env, max_episode_steps, inplace=True)
+    env = ReturnWrapper(env)
+    env = wrap_deepmind(env,
+                        episode_life=episode_life,
+                        clip_rewards=False,
+                        frame_stack=False,
+                        scale=False,
+                        warp_frame=False)
+    env = WarpFrameStack(env, 4)
   elif env_group_title == 'atari':
     env = make_atari(env, max_episode_steps)
     env = ReturnWrapper(env)
@@ -43,6 +98,22 @@ def make_env(env_name, max_episode_steps, episode_life=True):
   return env
 
 
+def make_vec_env(env_name, max_episode_steps, num_envs, vec_env_type='sync', fused_preprocessing=False):
+  '''
+  Make num_envs copies of the environment, stepped sequentially (sync), in subprocesses (async)
+  or with array operations in a single batched game (batched, MinAtar only)
+  '''
+  if vec_env_type == 'batched':
+    return make_batched_minatar(env_name, num_envs, max_episode_steps)
+  env_fns = [partial(make_env, env_name, max_episode_steps, fused_preprocessing=fused_preprocessing) for _ in range(num_envs)]
+  if vec_env_type == 'sync':
+    return SyncVectorEnv(env_fns)
+  elif vec_env_type == 'async':
+    return AsyncVectorEnv(env_fns)
+  else:
+    raise ValueError(f'{vec_env_type} is not supported.')
+
+
 def get_env_group_title(env):
   '''
   Return the group name the environment belongs to.
@@ -0,0 +1,128 @@
+import numpy as np
+import multiprocessing as mp
+
+
+class SyncVectorEnv(object):
+  '''
+  Run multiple environments sequentially in the current process.
+  Finished environments are reset automatically: the returned observation is the first
+  observation of the new episode and the last one is in info['terminal_observation'].
+  '''
+  def __init__(self, env_fns):
+    self.envs = [env_fn() for env_fn in env_fns]
+    self.num_envs = len(self.envs)
+    self.action_space = self.envs[0].action_space
+    self.observation_space = self.envs[0].observation_space
+
+  def seed(self, seed):
+    for i, env in enumerate(self.envs):
+      env.seed(seed+i)
+
+  def reset(self):
+    return np.stack([np.asarray(env.reset()) for env in self.envs])
+
+  def step(self, actions):
+    obs_list, rewards, dones, infos = [], [], [], []
+    for env, action in zip(self.envs, actions):
+      obs, reward, done, info = env.step(action)
+      if done:
+        info['terminal_observation'] = np.asarray(obs)
+        obs = env.reset()
+      obs_list.append(np.asarray(obs))
+      rewards.append(reward)
+      dones.append(done)
+      infos.append(info)
+    return np.stack(obs_list), np.array(rewards), np.array(dones), infos
+
+  def call(self, name, *args, **kwargs):
+    # Call a method of every environment (e.g. init) and return the results
+    return [getattr(env, name)(*args, **kwargs) for env in self.envs]
+
+  def close(self):
+    for env in self.envs:
+      env.close()
+
+  def __getattr__(self, name):
+    # Forward other attributes (e.g. game) to the first environment
+    if name == 'envs':
+      raise AttributeError(name)
+    return getattr(self.envs[0], name)
+
+
+def worker(remote, parent_remote, env_fn):
+  parent_remote.close()
+  env = env_fn()
+  while True:
+    cmd, data = remote.recv()
+    if cmd == 'step':
+      obs, reward, done, info = env.step(data)
+      if done:
+        info['terminal_observation'] = np.asarray(obs)
+        obs = env.reset()
+      remote.send((np.asarray(obs), reward, done, info))
+    elif cmd == 'reset':
+      remote.send(np.asarray(env.reset()))
+    elif cmd == 'seed':
+      env.seed(data)
+      remote.send(None)
+    elif cmd == 'spaces':
+      remote.send((env.action_space, env.observation_space))
+    elif cmd == 'call':
+      name, args, kwargs = data
+      remote.send(getattr(env, name)(*args, **kwargs))
+    elif cmd == 'close':
+      env.close()
+      remote.close()
+      break
+
+
+class AsyncVectorEnv(object):
+  '''
+  Run multiple environments in parallel subprocesses, one environment per process.
+  Finished environments are reset automatically, the same as SyncVectorEnv.
+  '''
+  def __init__(self, env_fns):
+    self.num_envs = len(env_fns)
+    self.remotes, work_remotes = zip(*[mp.Pipe() for _ in range(self.num_envs)])
+    self.processes = []
+    for work_remote, remote, env_fn in zip(work_remotes, self.remotes, env_fns):
+      process = mp.Process(target=worker, args=(work_remote, remote, env_fn), daemon=True)
+      process.start()
+      self.processes.append(process)
+      work_remote.close()
+    self.remotes[0].send(('spaces', None))
+    self.action_space, self.observation_space = self.remotes[0].recv()
+    self.closed = False
+
+  def seed(self, seed):
+    for i, remote in enumerate(self.remotes):
+      remote.send(('seed', seed+i))
+    for remote in self.remotes:
+      remote.recv()
+
+  def reset(self):
+    for remote in self.remotes:
+      remote.send(('reset', None))
+    return np.stack([remote.recv() for remote in self.remotes])
+
+  def step(self, actions):
+    for remote, action in zip(self.remotes, actions):
+      remote.send(('step', action))
+    results = [remote.recv() for remote in self.remotes]
+    obs, rewards, dones, infos = zip(*results)
+    return np.stack(obs), np.array(rewards), np.array(dones), list(infos)
+
+  def call(self, name, *args, **kwargs):
+    # Call a method of every environment (e.g. init) and return the results
+    for remote in self.remotes:
+      remote.send(('call', (name, args, kwargs)))
+    return [remote.recv() for remote in self.remotes]
+
+  def close(self):
+    if self.closed:
+      return
+    for remote in self.remotes:
+      remote.send(('close', None))
+    for process in self.processes:
+      process.join()
+    self.closed = True
@@ -1,18 +1,33 @@
+import os
 import gym
-import cv2
 import numpy as np
 from collections import deque
 from gym.spaces.box import Box
 from gym.spaces.discrete import Discrete
 from gym.wrappers.time_limit import TimeLimit
-cv2.ocl.setUseOpenCL(False)
 
+cv2 = None
 
-def make_atari(env, max_episode_steps):
+def import_cv2():
+  '''
+  Import OpenCV on first use: only the frame wrappers of Atari games need it
+  '''
+  global cv2
+  if cv2 is None:
+    import cv2 as _cv2
+    _cv2.ocl.setUseOpenCL(False)
+    # Follow the thread budget of this run (see utils.helper.set_num_threads)
+    if 'OMP_NUM_THREADS' in os.environ:
+      _cv2.setNumThreads(int(os.environ['OMP_NUM_THREADS']))
+    cv2 = _cv2
+  return cv2
+
+
+def make_atari(env, max_episode_steps, inplace=False):
   # assert 'NoFrameskip' in env.spec.id
   print('set time limit:', max_episode_steps)
   env = NoopResetEnv(env, noop_max=30)
-  env = MaxAndSkipEnv(env, skip=4)
+  env = MaxAndSkipEnv(env, skip=4, inplace=inplace)
   if max_episode_steps > 0:
     env = TimeLimit(env, max_episode_steps=max_episode_steps)
   return env
@@ -35,13 +50,14 @@ def make_minatar(env, max_episode_steps, scale=False):
     env = ScaledFloatFrame(env)
   return env
 
-def wrap_deepmind(env, episode_life=True, clip_rewards=True, frame_stack=False, scale=False):
+def wrap_deepmind(env, episode_life=True, clip_rewards=True, frame_stack=False, scale=False, warp_frame=True):
   # Configure environment for DeepMind-style Atari.
   if episode_life:
     env = EpisodicLifeEnv(env)
   if 'FIRE' in env.unwrapped.get_action_meanings():
     env = FireResetEnv(env)
-  env = WarpFrame(env)
+  if warp_frame:
+    env = WarpFrame(env)
   if scale:
     env = ScaledFloatFrame(env)
   if clip_rewards:
@@ -84,12 +100,16 @@ class NoopResetEnv(gym.Wrapper):
 
 class MaxAndSkipEnv(gym.Wrapper):
   # Return only every skip-th frame
-  def __init__(self, env, skip=4):
+  def __init__(self, env, skip=4, inplace=False):
     gym.Wrapper.__init__(self, env)
     # Observation buffer to store most recent raw observations
     # for max pooling across time steps
     self.obs_buffer = np.zeros((2,) + env.observation_space.shape, dtype=np.uint8)
     self.skip = skip
+    # With inplace, max pool into the same frame at every step instead of a new one,
+    # which is only safe if the next wrapper copies it out (e.g. WarpFrameStack)
+    self.inplace = inplace
+    self.max_frame = np.zeros(env.observation_space.shape, dtype=np.uint8)
 
   def step(self, action):
     # Repeat action, sum reward, and max over last observations
@@ -104,7 +124,10 @@ class MaxAndSkipEnv(gym.Wrapper):
       total_reward += reward
       if done:
         break
-    max_frame = self.obs_buffer.max(axis=0)
+    if self.inplace:
+      max_frame = np.maximum(self.obs_buffer[0], self.obs_buffer[1], out=self.max_frame)
+    else:
+      max_frame = self.obs_buffer.max(axis=0)
     return max_frame, total_reward, done, info
 
   def reset(self, **kwargs):
@@ -179,6 +202,7 @@ class WarpFrame(gym.ObservationWrapper):
   """
   def __init__(self, env, width=84, height=84, grayscale=True, dict_spacekey=None):
     super().__init__(env)
+    import_cv2()
     self.width = width
     self.height = height
     self.grayscale = grayscale
@@ -297,6 +321,61 @@ class LazyFrames(object):
     return self._force()[..., i]
 
 
+class WarpFrameStack(gym.Wrapper):
+  """
+  WarpFrame, TransposeImage and FrameStack fused into one wrapper without allocating arrays at every step.
+  RGB frames are converted to grayscale and resized into a preallocated buffer of history frames,
+  and each observation is a read-only (k, height, width) view of the last k frames,
+  the same as the LazyFrames returned by the wrapper chain.
+  An observation stays valid for the next history - 2k steps, copy it to keep it longer.
+  """
+  def __init__(self, env, k=4, width=84, height=84, history=32):
+    gym.Wrapper.__init__(self, env)
+    import_cv2()
+    assert history >= 3 * k, 'history should be at least 3k to keep the last observation through a reset.'
+    shp = env.observation_space.shape
+    assert env.observation_space.dtype == np.uint8 and len(shp) == 3
+    self.k = k
+    self.width = width
+    self.height = height
+    self.gray = np.zeros(shp[:2], dtype=np.uint8)
+    self.frames = np.zeros((history, height, width), dtype=np.uint8)
+    self.pos = len(self.frames) - 1
+    self.observation_space = gym.spaces.Box(low=0, high=255, shape=(k, height, width), dtype=np.uint8)
+
+  def advance(self):
+    # Move to the next slot; at the end of the buffer, move the last k-1 frames to the front
+    if self.pos + 1 == len(self.frames):
+      self.frames[:self.k-1] = self.frames[len(self.frames)-self.k+1:]
+      self.pos = self.k - 2
+    self.pos += 1
+
+  def warp(self, obs):
+    cv2.cvtColor(obs, cv2.COLOR_RGB2GRAY, dst=self.gray)
+    cv2.resize(self.gray, (self.width, self.height), dst=self.frames[self.pos], interpolation=cv2.INTER_AREA)
+
+  def reset(self, **kwargs):
+    obs = self.env.reset(**kwargs)
+    self.advance()
+    self.warp(obs)
+    # Fill the stack with the first frame
+    for _ in range(self.k - 1):
+      self.advance()
+      self.frames[self.pos] = self.frames[self.pos-1]
+    return self._get_ob()
+
+  def step(self, action):
+    obs, reward, done, info = self.env.step(action)
+    self.advance()
+    self.warp(obs)
+    return self._get_ob(), reward, done, info
+
+  def _get_ob(self):
+    ob = self.frames[self.pos-self.k+1:self.pos+1]
+    ob.flags.writeable = False
+    return ob
+
+
 class TransposeImage(gym.ObservationWrapper):
   def __init__(self, env):
     super(TransposeImage, self).__init__(env)
@@ -4,11 +4,13 @@ import copy
 import time
 import json
 import torch
+import signal
 import numpy as np
 import pandas as pd
 
 import agents
 from utils.helper import *
+from utils.status import RunStatus
 
 
 class Experiment(object):
@@ -26,30 +28,91 @@ class Experiment(object):
     self.env_name = cfg['env']['name']
     self.agent_name = cfg['agent']['name']
     if self.cfg['generate_random_seed']:
-      self.cfg['seed'] = np.random.randint(int(1e6))
+      if self.cfg['resume'] and os.path.isfile(self.cfg['cfg_path']):
+        # Keep the seed of the stopped run
+        with open(self.cfg['cfg_path'], 'r') as f:
+          self.cfg['seed'] = json.load(f)['seed']
+      else:
+        self.cfg['seed'] = np.random.randint(int(1e6))
     self.model_path = self.cfg['model_path']
     self.cfg_path = self.cfg['cfg_path']
     self.save_config()
 
   def run(self):
     '''
-    Run the game for multiple times
+    Run the game for multiple times, and record the run status (see utils/status.py)
     '''
-    set_one_thread()
+    self.status = RunStatus(self.cfg['status_path'], self.config_idx, self.cfg['train_steps'], self.cfg['status_interval'], self.cfg['resume'])
+    self.status.write()
     self.start_time = time.time()
+    try:
+      self.run_agent()
+    except BaseException as e:
+      if hasattr(self, 'agent') and hasattr(self.agent, 'step_count'):
+        self.status.finish('failed', f'{type(e).__name__}: {e}', self.agent.step_count, time.time()-self.start_time+self.agent.resumed_time)
+      else:
+        self.status.finish('failed', f'{type(e).__name__}: {e}')
+      raise
+
+  def run_agent(self):
+    set_num_threads(self.cfg['num_threads'], self.cfg['num_interop_threads'])
+    # Save a checkpoint and stop on SIGUSR1 (sent by SLURM before the time limit, see sbatch.sh)
+    self.checkpoint_requested = False
+    self.previous_handler = signal.signal(signal.SIGUSR1, self.request_checkpoint)
     set_random_seed(self.cfg['seed'])
     self.agent = getattr(agents, self.agent_name)(self.cfg)
+    self.agent.checkpoint_requested = self.checkpoint_requested
+    self.agent.status = self.status
+    self.agent.logger.info(f"Threads: {self.cfg['num_threads']} intra-op, {self.cfg['num_interop_threads']} inter-op")
     self.agent.env['Train'].seed(self.cfg['seed'])
     self.agent.env['Train'].action_space.np_random.seed(self.cfg['seed'])
     self.agent.env['Test'].seed(self.cfg['seed'])
     self.agent.env['Test'].action_space.np_random.seed(self.cfg['seed'])
     # Train && Test
     self.agent.run_steps(render=self.cfg['render'])
+    # Wait for Test episodes evaluated in parallel
+    self.agent.close_test_pool()
+    if hasattr(self.agent.replay, 'close'):
+      self.agent.replay.close()
+    self.finished = not self.agent.stopped
+    if not self.finished:
+      self.agent.logger.info(f'Stopped at step {self.agent.step_count} after saving a checkpoint')
+      self.status.finish('stopped', 'checkpoint', self.agent.step_count, time.time()-self.start_time+self.agent.resumed_time)
+      self.close()
+      return
+    # Remove the checkpoints of this run (on SLURM, also the one copied back to ./logs before resuming)
+    self.agent.remove_checkpoint()
+    checkpoint_path = f"./logs/{self.cfg['exp']}/{self.config_idx}/checkpoint.pt"
+    if os.path.isfile(checkpoint_path):
+      os.remove(checkpoint_path)
     # Save model
     # self.save_model()
     self.end_time = time.time()
+    if hasattr(self.agent.replay, 'bytes_per_transition'):
+      self.agent.logger.info(f'Replay memory: {self.agent.replay.bytes_per_transition()} bytes/transition')
     self.agent.logger.info(f'Memory usage: {rss_memory_usage():.2f} MB')
-    self.agent.logger.info(f'Time elapsed: {(self.end_time-self.start_time)/60:.2f} minutes')
+    self.agent.logger.info(f'Time elapsed: {(self.end_time-self.start_time+self.agent.resumed_time)/60:.2f} minutes')
+    self.status.finish('done', 'finished', self.agent.step_count, self.end_time-self.start_time+self.agent.resumed_time)
+    self.close()
+
+  def request_checkpoint(self, signum, frame):
+    # The agent saves a checkpoint and stops at the end of the current episode (or epoch)
+    self.checkpoint_requested = True
+    if hasattr(self, 'agent'):
+      self.agent.checkpoint_requested = True
+
+  def close(self):
+    '''
+    Close the environments and the logger, so that the next run in this process (see main_batch.py) starts clean
+    '''
+    if hasattr(self, 'previous_handler'):
+      signal.signal(signal.SIGUSR1, self.previous_handler)
+      del self.previous_handler
+    if not hasattr(self, 'agent'):
+      return
+    for env in self.agent.env.values():
+      env.close()
+    self.agent.logger.close()
   
   def save_model(self):
     self.agent.save_model(self.model_path)
@@ -6,11 +6,9 @@ def find_one_run():
   agent_config = 'mc_medqn.json'
   config_file = os.path.join('./configs/', agent_config)
   sweeper = Sweeper(config_file)
-  for i in range(1, 1+sweeper.config_dicts['num_combinations']):
-    cfg = sweeper.generate_config_for_idx(i)
-    if cfg['agent']['consod_start'] == cfg['agent']['consod_end']:
-      print(i, end=',')
-  print()
+  # Columns are keyed by config paths, e.g. 'agent.consod_start'
+  idxs = sweeper.where(lambda c: c['agent.consod_start'] == c['agent.consod_end'])
+  print(*idxs, sep=',')
 
 
 def find_many_runs():
@@ -1,46 +1,96 @@
 import os
 import sys
+import copy
+import shutil
 import argparse
 
 from utils.sweeper import Sweeper
-from utils.helper import make_dir
+from utils.helper import make_dir, get_thread_budget
+from utils.status import stopped_exit_code
 from experiment import Experiment
 
-def main(argv):
-  parser = argparse.ArgumentParser(description="Config file")
-  parser.add_argument('--config_file', type=str, default='./configs/catcher.json', help='Configuration file for the chosen model')
-  parser.add_argument('--config_idx', type=int, default=1, help='Configuration index')
-  parser.add_argument('--slurm_dir', type=str, default='', help='slurm tempory directory')
-  args = parser.parse_args()
-  
-  sweeper = Sweeper(args.config_file)
-  cfg = sweeper.generate_config_for_idx(args.config_idx)
+def make_config(sweeper, config_file, config_idx, slurm_dir='', num_jobs=1):
+  '''
+  Generate the config dict of config_idx, with default values and log paths
+  '''
+  # Copy the config so that runs in the same process (see main_batch.py) do not share nested values
+  cfg = copy.deepcopy(sweeper.generate_config_for_idx(config_idx))
   
   # Set config dict default value
   cfg.setdefault('network_update_steps', 1)
   cfg['env'].setdefault('max_episode_steps', -1)
+  cfg['env'].setdefault('fused_preprocessing', False) # Atari only: fused preprocessing into preallocated buffers (see WarpFrameStack)
   cfg.setdefault('show_tb', False)
   cfg.setdefault('render', False)
   cfg.setdefault('gradient_clip', -1)
   cfg.setdefault('hidden_act', 'ReLU')
   cfg.setdefault('output_act', 'Linear')
+  cfg.setdefault('memory_type', 'FiniteReplay')
+  cfg.setdefault('memory_kwargs', {})
+  cfg.setdefault('num_envs', 1)
+  cfg.setdefault('vec_env_type', 'sync')
+  cfg.setdefault('num_actors', 0)
+  cfg.setdefault('ring_size', 1000)
+  cfg.setdefault('sync_weights_updates', 100)
+  cfg.setdefault('test_workers', 0)
+  cfg.setdefault('test_episodes', 1)
+  cfg.setdefault('numpy_acting', True)
+  cfg.setdefault('num_threads', -1) # intra-op threads, -1: split the cores between concurrent jobs
+  cfg.setdefault('num_interop_threads', 1)
+  cfg.setdefault('checkpoint_steps', -1) # save a checkpoint every checkpoint_steps steps, -1: only when signaled (SIGUSR1)
+  cfg.setdefault('status_interval', 60) # update the run status (see utils/status.py) at most every status_interval seconds
+  if cfg['num_threads'] <= 0:
+    cfg['num_threads'] = get_thread_budget(num_jobs, num_processes=1+cfg['num_actors']+cfg['test_workers'])
   
 
   # Set experiment name and log paths
-  cfg['exp'] = args.config_file.split('/')[-1].split('.')[0]
-  if len(args.slurm_dir) > 0:  
-    cfg['logs_dir'] = f"{args.slurm_dir}/{cfg['exp']}/{cfg['config_idx']}/"
+  cfg['exp'] = config_file.split('/')[-1].split('.')[0]
+  if len(slurm_dir) > 0:  
+    cfg['logs_dir'] = f"{slurm_dir}/{cfg['exp']}/{cfg['config_idx']}/"
     make_dir(cfg['logs_dir'])
   else:
     cfg['logs_dir'] = f"./logs/{cfg['exp']}/{cfg['config_idx']}/"
   make_dir(f"./logs/{cfg['exp']}/{cfg['config_idx']}/")
+  if cfg['memory_type'] == 'MemmapReplay':
+    # Store replay files on scratch (not copied back with logs) if possible
+    if len(slurm_dir) > 0:
+      cfg['memory_kwargs'].setdefault('memory_dir', f"{slurm_dir}/replay/{cfg['exp']}/{cfg['config_idx']}/")
+    else:
+      cfg['memory_kwargs'].setdefault('memory_dir', cfg['logs_dir'] + 'replay/')
+    # Raw Atari frames are stored as uint8 and rescaled at sampling, the same as ImageNormalizer
+    if cfg['env']['input_type'] == 'pixel' and 'MinAtar' not in cfg['env']['name']:
+      cfg['memory_kwargs'].setdefault('scale', 1.0 / 255)
   cfg['train_log_path'] = cfg['logs_dir'] + 'result_Train.feather'
   cfg['test_log_path'] = cfg['logs_dir'] + 'result_Test.feather'
   cfg['model_path'] = cfg['logs_dir'] + 'model.pt'
   cfg['cfg_path'] = cfg['logs_dir'] + 'config.json'
+  cfg['checkpoint_path'] = cfg['logs_dir'] + 'checkpoint.pt'
+  # The run status is always written to ./logs (not the SLURM temporary directory), so that it can be read while the run is going on
+  cfg['status_path'] = f"./logs/{cfg['exp']}/{cfg['config_idx']}/status.json"
+  # Resume from the checkpoint of a stopped run of this config index; on SLURM, copy it and the logs to the temporary directory
+  logs_dir = f"./logs/{cfg['exp']}/{cfg['config_idx']}/"
+  if len(slurm_dir) > 0 and os.path.isfile(logs_dir + 'checkpoint.pt'):
+    for file_name in os.listdir(logs_dir):
+      if os.path.isfile(logs_dir + file_name):
+        shutil.copy2(logs_dir + file_name, cfg['logs_dir'] + file_name)
+  cfg['resume'] = os.path.isfile(cfg['checkpoint_path'])
+  return cfg
 
+def main(argv):
+  parser = argparse.ArgumentParser(description="Config file")
+  parser.add_argument('--config_file', type=str, default='./configs/catcher.json', help='Configuration file for the chosen model')
+  parser.add_argument('--config_idx', type=int, default=1, help='Configuration index')
+  parser.add_argument('--slurm_dir', type=str, default='', help='slurm tempory directory')
+  parser.add_argument('--num_jobs', type=int, default=1, help='Number of jobs running concurrently on this machine (sharing its cores)')
+  args = parser.parse_args()
+  
+  sweeper = Sweeper(args.config_file)
+  cfg = make_config(sweeper, args.config_file, args.config_idx, args.slurm_dir, args.num_jobs)
   exp = Experiment(cfg)
   exp.run()
+  if not exp.finished:
+    # Stopped after a checkpoint: exit with stopped_exit_code so that the run is submitted again (see utils/scheduler.py)
+    sys.exit(stopped_exit_code)
 
 if __name__=='__main__':
   main(sys.argv)
\ No newline at end of file
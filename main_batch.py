@@ -0,0 +1,124 @@
+import os
+import sys
+import gc
+import time
+import queue
+import torch
+import random
+import argparse
+import traceback
+import numpy as np
+import multiprocessing as mp
+
+from utils.sweeper import Sweeper
+from utils.helper import get_num_cores
+from utils.status import stopped_exit_code
+from experiment import Experiment
+from main import make_config
+
+
+def parse_indexes(indexes):
+  '''
+  Parse config indexes such as '1-360' or '1,5,9-12' into a list
+  '''
+  idx_list = []
+  for part in indexes.split(','):
+    if '-' in part:
+      start, end = part.split('-')
+      idx_list.extend(range(int(start), int(end)+1))
+    else:
+      idx_list.append(int(part))
+  return idx_list
+
+def run_config(sweeper, config_file, config_idx, slurm_dir, num_jobs):
+  '''
+  Run one config index in this process, as main.py would in a new process.
+  Return False if the run stopped after saving a checkpoint.
+  '''
+  # Each run starts with fresh random states, as in a new process (runs then set their own seeds)
+  random.seed()
+  np.random.seed()
+  torch.seed()
+  exp = None
+  try:
+    cfg = make_config(sweeper, config_file, config_idx, slurm_dir, num_jobs)
+    exp = Experiment(cfg)
+    exp.run()
+    return exp.finished
+  finally:
+    if exp is not None:
+      exp.close()
+    del exp
+    gc.collect()
+
+def worker(config_file, slurm_dir, num_jobs, task_queue, result_queue):
+  # Run config indexes from task_queue until None, reusing the imports and the parsed config file
+  sweeper = Sweeper(config_file)
+  while True:
+    config_idx = task_queue.get()
+    if config_idx is None:
+      break
+    start_time = time.time()
+    try:
+      finished = run_config(sweeper, config_file, config_idx, slurm_dir, num_jobs)
+      error = None
+    except Exception:
+      finished, error = False, traceback.format_exc()
+    result_queue.put((config_idx, finished, error, time.time()-start_time))
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Run many config indexes with a pool of warm worker processes")
+  parser.add_argument('--config_file', type=str, default='./configs/catcher.json', help='Configuration file for the chosen model')
+  parser.add_argument('--config_idxs', type=str, default='1', help="Configuration indexes, e.g. '1-360' or '1,5,9-12'")
+  parser.add_argument('--num_workers', type=int, default=0, help='Number of worker processes (0: number of cores)')
+  parser.add_argument('--slurm_dir', type=str, default='', help='slurm tempory directory')
+  args = parser.parse_args()
+
+  idx_list = parse_indexes(args.config_idxs)
+  num_workers = min(args.num_workers if args.num_workers > 0 else get_num_cores(), len(idx_list))
+  # Workers are forked after the imports above, and are not daemons so that runs can start their own processes
+  ctx = mp.get_context('fork')
+  task_queue, result_queue = ctx.Queue(), ctx.Queue()
+  for config_idx in idx_list:
+    task_queue.put(config_idx)
+  for _ in range(num_workers):
+    task_queue.put(None)
+  workers = [ctx.Process(target=worker, args=(args.config_file, args.slurm_dir, num_workers, task_queue, result_queue)) for _ in range(num_workers)]
+  start_time = time.time()
+  for p in workers:
+    p.start()
+  failed, stopped, finished = [], [], []
+  while len(finished) + len(stopped) + len(failed) < len(idx_list):
+    try:
+      config_idx, run_finished, error, run_time = result_queue.get(timeout=1)
+    except queue.Empty:
+      if any(p.is_alive() for p in workers):
+        continue
+      # All workers exited (e.g. killed) before reporting the remaining runs
+      missing = [idx for idx in idx_list if idx not in finished and idx not in stopped and idx not in failed]
+      failed.extend(missing)
+      print(f'All workers exited, config indexes without results: {missing}', flush=True)
+      break
+    count = f'[{len(finished)+len(stopped)+len(failed)+1}/{len(idx_list)}]'
+    if error is not None:
+      failed.append(config_idx)
+      print(f'{count} config_idx={config_idx} failed in {run_time/60:.2f} minutes:\n{error}', flush=True)
+    elif run_finished:
+      finished.append(config_idx)
+      print(f'{count} config_idx={config_idx} finished in {run_time/60:.2f} minutes', flush=True)
+    else:
+      stopped.append(config_idx)
+      print(f'{count} config_idx={config_idx} stopped after saving a checkpoint in {run_time/60:.2f} minutes', flush=True)
+  for p in workers:
+    p.join()
+  print(f'{len(idx_list)} runs with {num_workers} workers in {(time.time()-start_time)/60:.2f} minutes')
+  if len(stopped) > 0:
+    print(f'Stopped config indexes (to resume from their checkpoints): {stopped}')
+  if len(failed) > 0:
+    print(f'Failed config indexes: {failed}')
+    sys.exit(1)
+  elif len(stopped) > 0:
+    sys.exit(stopped_exit_code)
+
+if __name__=='__main__':
+  main(sys.argv)
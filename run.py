@@ -1,6 +1,7 @@
 import os
 import sys
-from utils.submitter import Submitter
+from utils.sweeper import Sweeper
+from utils.scheduler import Scheduler, LocalBackend, SbatchBackend
 
 
 def make_dir(dir):
@@ -69,8 +70,16 @@ def main(argv):
     'user': 'qlan3',
     # Sbatch script path
     'script-path': './sbatch.sh',
-    # Check time interval in minutes
+    # Backend: 'sbatch' (SLURM) or 'local' (processes on this machine)
+    'backend': 'sbatch',
+    # Number of concurrent jobs of the local backend (0: number of cores)
+    'num-workers': 0,
+    # Check time interval in minutes (sbatch backend)
     'check-time-interval': 5,
+    # Number of times a failed job is submitted again
+    'max-retries': 1,
+    # Job order: 'fifo', 'shortest-first' or 'longest-first' (by run times of finished runs in logs)
+    'priority': 'fifo',
     # Clusters info: {name: capacity}
     'clusters': {'Narval': 1000},
     # Job indexes list
@@ -79,13 +88,21 @@ def main(argv):
     # 'job-list': ll_uniform
     # 'job-list': ll_real
     # 'job-list': ll_dqn
+    # Job indexes of a query on the config file, e.g. all MeDQN_Real runs
+    # 'job-list': list(Sweeper(f"./configs/{sbatch_cfg['job-name']}.json").where(lambda c: c['agent.name'] == 'MeDQN_Real'))
     'job-list': ll_dqn_sm
     # 'job-list': []
   }
 
   make_dir(f"output/{sbatch_cfg['job-name']}")
-  submitter = Submitter(general_cfg, sbatch_cfg)
-  submitter.submit()
+  if general_cfg['backend'] == 'local':
+    backend = LocalBackend(sbatch_cfg['job-name'], general_cfg['num-workers'])
+  else:
+    backend = SbatchBackend(general_cfg, sbatch_cfg)
+  scheduler = Scheduler(sbatch_cfg['job-name'], general_cfg, backend)
+  failed = scheduler.run()
+  if len(failed) > 0:
+    sys.exit(1)
 
 if __name__=='__main__':
   main(sys.argv)
\ No newline at end of file
@@ -1,3 +1,7 @@
 export OMP_NUM_THREADS=1
 # git rev-parse --short HEAD
-parallel --eta --ungroup --jobs 120 python main.py --config_file ./configs/RPG.json --config_idx {1} ::: $(seq 1 360)
\ No newline at end of file
+# Each job gets an equal share of the cores (at least one thread), see --num_jobs in main.py
+JOBS=120
+parallel --eta --ungroup --jobs $JOBS python main.py --config_file ./configs/RPG.json --config_idx {1} --num_jobs $JOBS ::: $(seq 1 360)
+# Or run all indexes with JOBS warm worker processes, which import everything once
+# python main_batch.py --config_file ./configs/RPG.json --config_idxs 1-360 --num_workers $JOBS
\ No newline at end of file
@@ -23,14 +23,31 @@ cleanup()
     echo "Destination directory: $dest"
     cp -rf $sour $dest
 }
-# Call `cleanup` once we receive USR1 or EXIT signal
-trap 'cleanup' USR1 EXIT
+checkpoint()
+{
+    echo "Ask the run to save a checkpoint and stop"
+    kill -USR1 $PID
+}
+# Call `checkpoint` once we receive USR1 signal and `cleanup` once we receive EXIT signal
+trap 'checkpoint' USR1
+trap 'cleanup' EXIT
 # ---------------------------------------------------------------------
-export OMP_NUM_THREADS=1
+export OMP_NUM_THREADS=${SLURM_CPUS_PER_TASK:-1}
 module load gcc/9.3.0 arrow/2.0.0 python/3.7 scipy-stack
 source ~/envs/gym/bin/activate
-python main.py --config_file ./configs/${SLURM_JOB_NAME}.json --config_idx $SLURM_ARRAY_TASK_ID --slurm_dir $SLURM_TMPDIR
-# python main.py --config_file ./configs/${SLURM_JOB_NAME}.json --config_idx $SLURM_ARRAY_TASK_ID
+# Run in the background so that the USR1 trap runs while waiting; a stopped run resumes from its checkpoint when submitted again
+python main.py --config_file ./configs/${SLURM_JOB_NAME}.json --config_idx $SLURM_ARRAY_TASK_ID --slurm_dir $SLURM_TMPDIR &
+# python main.py --config_file ./configs/${SLURM_JOB_NAME}.json --config_idx $SLURM_ARRAY_TASK_ID &
+PID=$!
+wait $PID
+EXIT_CODE=$?
+# wait returns (with a code > 128) when a trap runs: wait for the run to save its checkpoint and exit
+if [ $EXIT_CODE -gt 128 ]; then
+    wait $PID
+    EXIT_CODE=$?
+fi
 # ---------------------------------------------------------------------
-echo "Job finished with exit code $? at: `date`"
+echo "Job finished with exit code $EXIT_CODE at: `date`"
+# A run stopped after a checkpoint exits with code 3 (FAILED with ExitCode 3:0 in sacct): the scheduler submits it again without using a retry
+exit $EXIT_CODE
 # ---------------------------------------------------------------------
\ No newline at end of file
@@ -24,13 +24,51 @@ def str_to_class(module_name, class_name):
   '''
   return getattr(sys.modules[module_name], class_name)
 
+def get_num_cores():
+  '''
+  Return the number of cores this process may run on (limited by CPU affinity and SLURM_CPUS_PER_TASK)
+  '''
+  if hasattr(os, 'sched_getaffinity'):
+    num_cores = len(os.sched_getaffinity(0))
+  else:
+    num_cores = os.cpu_count() or 1
+  if 'SLURM_CPUS_PER_TASK' in os.environ:
+    num_cores = min(num_cores, int(os.environ['SLURM_CPUS_PER_TASK']))
+  return num_cores
+
+def get_thread_budget(num_jobs=1, num_processes=1, num_cores=None):
+  '''
+  Split the cores between num_jobs concurrent jobs and return the number of intra-op threads of one job,
+  where each job runs one multi-threaded main process and num_processes-1 single-threaded helper processes
+  (e.g. async actors and Test workers)
+  '''
+  if num_cores is None:
+    num_cores = get_num_cores()
+  return max(1, num_cores // max(1, num_jobs) - (num_processes - 1))
+
+def set_num_threads(num_threads=1, num_interop_threads=1):
+  '''
+  Set the number of intra-op threads of torch, OpenMP/MKL and OpenCV, and the number of inter-op threads of torch.
+  Environment variables only affect libraries loaded later, e.g. in new processes.
+  '''
+  for name in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+    os.environ[name] = str(num_threads)
+  torch.set_num_threads(num_threads)
+  if torch.get_num_interop_threads() != num_interop_threads:
+    try:
+      torch.set_num_interop_threads(num_interop_threads)
+    except RuntimeError:
+      # Can only be set before any inter-op parallel work has started (e.g. in a forked process)
+      pass
+  # OpenCV is imported on first use (see envs.wrapper.import_cv2) and then follows OMP_NUM_THREADS
+  if 'cv2' in sys.modules:
+    sys.modules['cv2'].setNumThreads(num_threads)
+
 def set_one_thread():
   '''
-  Set number of threads for pytorch to 1
+  Set number of threads for pytorch, OpenMP/MKL and OpenCV to 1
   '''
-  os.environ['OMP_NUM_THREADS'] = '1'
-  os.environ['MKL_NUM_THREADS'] = '1'
-  torch.set_num_threads(1)
+  set_num_threads(1)
 
 def to_tensor(x, device):
   '''
@@ -45,6 +83,16 @@ def to_numpy(t):
   '''
   return t.cpu().detach().numpy()
 
+def shared_forward(net, inputs):
+  '''
+  Evaluate net on a list of input batches with one forward pass:
+  concatenate the inputs along the batch dimension and split the output into one tensor per input
+  '''
+  if len(inputs) == 1:
+    return [net(inputs[0])]
+  sizes = [len(x) for x in inputs]
+  return torch.split(net(torch.cat(inputs)), sizes)
+
 def set_random_seed(seed):
   '''
   Set all random seeds
@@ -57,12 +105,91 @@ def set_random_seed(seed):
     torch.backends.cudnn.deterministic = True
     torch.backends.cudnn.benchmark = False
 
+def get_rng_state():
+  '''
+  Return the states of all random number generators (random, numpy, torch)
+  '''
+  rng_state = {
+    'random': random.getstate(),
+    'numpy': np.random.get_state(),
+    'torch': torch.get_rng_state()
+  }
+  if torch.cuda.is_available():
+    rng_state['cuda'] = torch.cuda.get_rng_state_all()
+  return rng_state
+
+def set_rng_state(rng_state):
+  random.setstate(rng_state['random'])
+  np.random.set_state(rng_state['numpy'])
+  torch.set_rng_state(rng_state['torch'])
+  if torch.cuda.is_available() and 'cuda' in rng_state:
+    torch.cuda.set_rng_state_all(rng_state['cuda'])
+
+def get_np_random_state(rng):
+  # The state of a numpy Generator (e.g. of gym environments and spaces) or RandomState, as a plain dict or tuple
+  return rng.bit_generator.state if hasattr(rng, 'bit_generator') else rng.get_state()
+
+def set_np_random_state(rng, state):
+  if hasattr(rng, 'bit_generator'):
+    rng.bit_generator.state = state
+  else:
+    rng.set_state(state)
+
+def atomic_save(obj, path):
+  '''
+  Save obj with torch.save to a temporary file, then rename it to path:
+  path always holds either the previous or the new complete file, even if the process is killed while saving
+  '''
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    torch.save(obj, f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+
+def load_checkpoint(path, device='cpu'):
+  # Checkpoints hold numpy arrays and Python objects besides tensors, so they are not loaded with weights_only
+  try:
+    return torch.load(path, map_location=device, weights_only=False)
+  except TypeError:
+    # torch < 1.13 has no weights_only
+    return torch.load(path, map_location=device)
+
 def make_dir(dir):
-  if not os.path.exists(dir): 
+  if not os.path.exists(dir):
     os.makedirs(dir, exist_ok=True)
 
 def generate_batch_idxs(length, batch_size):
   idxs = np.asarray(np.random.permutation(length))
   batches = idxs[:length // batch_size * batch_size].reshape(-1, batch_size)
   for batch in batches:
-    yield batch
\ No newline at end of file
+    yield batch
+
+def reverse_linear_scan(a, c, x_last):
+  '''
+  Solve x_t = a_t + c_t * x_{t+1} for t = T-1, ..., 0 with x_T = x_last (a and c are 1-D tensors),
+  using a parallel suffix scan with O(log T) vectorized steps instead of a Python loop over t
+  '''
+  x = torch.cat([a, torch.as_tensor(x_last, dtype=a.dtype, device=a.device).reshape(1)])
+  coef = torch.cat([c, torch.zeros(1, dtype=c.dtype, device=c.device)])
+  shift = 1
+  while shift < len(x):
+    # Compose each element with the one shift steps later; the tail is composed with the identity
+    x = torch.cat([x[:-shift] + coef[:-shift] * x[shift:], x[-shift:]])
+    coef = torch.cat([coef[:-shift] * coef[shift:], coef[-shift:]])
+    shift *= 2
+  return x[:-1]
+
+def compute_returns(reward, mask, last_value, discount):
+  '''
+  Compute discounted returns: ret_t = reward_t + discount * mask_t * ret_{t+1}, ret_T = last_value
+  '''
+  return reverse_linear_scan(reward, discount * mask, last_value)
+
+def compute_gae(reward, mask, v, discount, gae):
+  '''
+  Compute generalized advantage estimates, where v has one more element (the bootstrap value) than reward:
+    adv_t = td_error_t + discount * gae * mask_t * adv_{t+1}, adv_T = 0
+  '''
+  td_error = reward + discount * mask * v[1:] - v[:-1]
+  return reverse_linear_scan(td_error, discount * gae * mask, 0.0)
@@ -3,16 +3,24 @@ from utils.helper import *
 from torch.utils.tensorboard import SummaryWriter
 
 
+class RunFileHandler(logging.FileHandler):
+  # The log file handler of a Logger
+  pass
+
+
 class Logger(object):
   def __init__(self, logs_dir, file_name='log.txt', filemode='w'):
-    logging.basicConfig(
-      format='%(asctime)s - %(levelname)s: %(message)s',
-      filename=f'{logs_dir}{file_name}',
-      filemode=filemode
-    )
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
     # logger.setLevel(logging.DEBUG)
+    # Log to the file of this run only: several runs may share one process (see main_batch.py)
+    for handler in logger.handlers[:]:
+      if isinstance(handler, RunFileHandler):
+        logger.removeHandler(handler)
+        handler.close()
+    self.handler = RunFileHandler(f'{logs_dir}{file_name}', mode=filemode)
+    self.handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s: %(message)s'))
+    logger.addHandler(self.handler)
     self.debug = logger.debug
     self.info = logger.info
     self.warning = logger.warning
@@ -32,4 +40,12 @@ class Logger(object):
     self.writer.add_scalars(main_tag, tag_scalar_dict, global_step)
 
   def add_histogram(self, tag, values, global_step=None):
-    self.writer.add_histogram(tag, values, global_step)
\ No newline at end of file
+    self.writer.add_histogram(tag, values, global_step)
+
+  def close(self):
+    # Stop logging to the file of this run and close the tensorboard writer
+    logging.getLogger().removeHandler(self.handler)
+    self.handler.close()
+    if self.writer is not None:
+      self.writer.close()
+      self.writer = None
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 import json
 import math
+import functools
 import numpy as np
 import pandas as pd
 import seaborn as sns; sns.set(style="ticks"); sns.set_context("paper") #sns.set_context("talk")
@@ -366,14 +367,21 @@ def moving_average(values, window):
   weights = np.repeat(1.0, window) / window
   return np.convolve(values, weights, 'valid')
   
-def get_total_combination(exp):
+@functools.lru_cache(maxsize=None)
+def get_sweeper(exp):
   '''
-  Get total combination of experiment configuration
+  Get the (indexed) sweeper of experiment configuration, parsed once per experiment
   '''
   config_file = f'./configs/{exp}.json'
   assert os.path.isfile(config_file), f'[{exp}]: No config file <{config_file}>!'
-  sweeper = Sweeper(config_file)
-  return sweeper.config_dicts['num_combinations']
+  return Sweeper(config_file)
+
+
+def get_total_combination(exp):
+  '''
+  Get total combination of experiment configuration
+  '''
+  return get_sweeper(exp).config_dicts['num_combinations']
 
 
 def find_key_value(config_dict, key):
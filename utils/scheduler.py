@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import heapq
+import queue
+import threading
+import subprocess
+import numpy as np
+
+from utils.sweeper import Sweeper
+from utils.helper import get_num_cores, make_dir
+from utils.status import read_status, read_log_status, stopped_exit_code
+
+
+def read_run_time(run_dir):
+  '''
+  Return the run time (in minutes) of a finished run in run_dir, from its status file (or log file), or None
+  '''
+  status = read_status(os.path.join(run_dir, 'status.json'))
+  if status is None:
+    status = read_log_status(os.path.join(run_dir, 'log.txt'))
+  if status is None or status['state'] != 'done':
+    return None
+  return status.get('time')
+
+
+class LocalBackend(object):
+  '''
+  Run jobs as processes on this machine, at most num_workers at a time.
+  A thread waits for each process and reports its exit as an event, so freed workers are refilled immediately.
+  '''
+  def __init__(self, exp, num_workers=0, command=None, output_dir=None):
+    self.capacity = num_workers if num_workers > 0 else get_num_cores()
+    assert self.capacity > 0, 'No workers'
+    # command(config_idx) returns the arguments of a job's process
+    if command is None:
+      command = lambda config_idx: [sys.executable, 'main.py', '--config_file', f'./configs/{exp}.json', '--config_idx', str(config_idx), '--num_jobs', str(self.capacity)]
+    self.command = command
+    self.output_dir = f'./output/{exp}/' if output_dir is None else output_dir
+    make_dir(self.output_dir)
+    self.processes = {}
+    self.events = queue.Queue()
+
+  def num_free(self):
+    return self.capacity - len(self.processes)
+
+  def submit(self, job_list):
+    for config_idx in job_list:
+      with open(os.path.join(self.output_dir, f'{config_idx}.txt'), 'w') as f:
+        p = subprocess.Popen(self.command(config_idx), stdout=f, stderr=subprocess.STDOUT)
+      self.processes[config_idx] = p
+      threading.Thread(target=self.wait_process, args=(config_idx, p, time.time()), daemon=True).start()
+
+  def wait_process(self, config_idx, p, start_time):
+    returncode = p.wait()
+    self.events.put((config_idx, returncode, (time.time()-start_time)/60))
+
+  def get_events(self):
+    '''
+    Block until at least one job exits, then return the events (config_idx, returncode, run time in minutes) of all exited jobs
+    '''
+    if len(self.processes) == 0:
+      return []
+    events = [self.events.get()]
+    while not self.events.empty():
+      events.append(self.events.get())
+    for config_idx, _, _ in events:
+      del self.processes[config_idx]
+    return events
+
+  def cancel(self):
+    for p in self.processes.values():
+      p.kill()
+
+
+class SbatchBackend(object):
+  '''
+  Submit jobs as SLURM job arrays with sbatch.
+  SLURM has no job exit callbacks, so job states are polled with sacct every check-time-interval minutes.
+  Failed jobs are reported with the exit code of their script (sbatch.sh exits with the code of main.py), if any.
+  '''
+  # Final job states in sacct
+  done_states = ['COMPLETED']
+  failed_states = ['FAILED', 'TIMEOUT', 'CANCELLED', 'OUT_OF_MEMORY', 'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE']
+
+  def __init__(self, general_cfg, sbatch_cfg):
+    self.user = general_cfg['user']
+    self.script_path = general_cfg['script-path']
+    self.check_time_interval = general_cfg['check-time-interval'] * 60
+    self.capacity = sum(general_cfg['clusters'].values())
+    self.sbatch_cfg = sbatch_cfg
+    # Array job id -> config indexes not finished yet
+    self.jobs = {}
+
+  def num_free(self):
+    # Jobs of the user in the queue, including jobs not submitted by this scheduler
+    lines = os.popen(f'squeue -u {self.user} -r -h').read().split('\n')
+    num_current_jobs = sum(1 for line in lines if self.user in line)
+    print(f'Number of current jobs: {num_current_jobs}')
+    return self.capacity - num_current_jobs
+
+  def submit(self, job_list):
+    # Submit a range of indexes if possible, otherwise a list of indexes
+    if job_list == list(range(job_list[0], job_list[0]+len(job_list))):
+      job_indexes = f'{job_list[0]}-{job_list[-1]}'
+    else:
+      job_indexes = ','.join(map(str, job_list))
+    slurm_input = ' '.join([f'--{k}={v}' for k, v in self.sbatch_cfg.items()])
+    myCmd = os.popen(f'sbatch --parsable --array={job_indexes} {slurm_input} {self.script_path}').read().strip()
+    print(myCmd)
+    # --parsable prints 'job_id' or 'job_id;cluster'
+    job_id = myCmd.split(';')[0]
+    if not job_id.isdigit():
+      raise RuntimeError(f'sbatch failed to submit jobs {job_indexes}: {myCmd}')
+    self.jobs[job_id] = set(job_list)
+
+  def get_events(self):
+    '''
+    Wait check-time-interval, then return the events (config_idx, returncode, run time in minutes) of jobs in a final state
+    '''
+    events = []
+    while len(events) == 0:
+      time.sleep(self.check_time_interval)
+      if len(self.jobs) == 0:
+        break
+      myCmd = os.popen(f"sacct -n -P -X -j {','.join(self.jobs.keys())} -o JobID,State,ElapsedRaw,ExitCode").read()
+      for line in myCmd.split('\n'):
+        if line.count('|') != 3:
+          continue
+        job_id, state, elapsed, exit_code = line.split('|')
+        # Array task ids are 'job_id_config_idx'; pending tasks are listed as 'job_id_[...]'
+        job_id, _, task_id = job_id.partition('_')
+        if not task_id.isdigit() or int(task_id) not in self.jobs.get(job_id, ()):
+          continue
+        state = state.split(' ')[0]
+        if state in self.done_states or state in self.failed_states:
+          # ExitCode is 'exit_code:signal', e.g. '3:0' for a run stopped after a checkpoint (state FAILED)
+          exit_code = exit_code.split(':')[0]
+          if state in self.done_states:
+            returncode = 0
+          else:
+            returncode = int(exit_code) if exit_code.isdigit() and int(exit_code) > 0 else 1
+          events.append((int(task_id), returncode, int(elapsed or 0)/60))
+          self.jobs[job_id].remove(int(task_id))
+      self.jobs = {job_id: job_list for job_id, job_list in self.jobs.items() if len(job_list) > 0}
+      # Always check capacity again, e.g. after jobs of other experiments finished
+      if len(events) == 0 and self.num_free() > 0:
+        break
+    return events
+
+  def cancel(self):
+    for job_id in self.jobs:
+      os.popen(f'scancel {job_id}').read()
+
+
+class Scheduler(object):
+  '''
+  Run the config indexes of an experiment with a backend (LocalBackend or SbatchBackend):
+  submit jobs whenever the backend has free capacity, in priority order, and retry failed jobs.
+  Runs stopped after saving a checkpoint (exit code stopped_exit_code) are submitted again to resume, without using a retry.
+  Priorities use the run times of finished runs, read from the logs and updated with the run times of this scheduler's jobs:
+  - 'fifo': in the order of the job list
+  - 'shortest-first': shortest expected run time first (minimizes the mean time until a run finishes)
+  - 'longest-first': longest expected run time first (usually finishes the whole sweep sooner)
+  '''
+  def __init__(self, exp, general_cfg, backend):
+    self.exp = exp
+    self.job_list = list(general_cfg['job-list'])
+    self.max_retries = general_cfg.get('max-retries', 1)
+    self.priority = general_cfg.get('priority', 'fifo')
+    assert self.priority in ['fifo', 'shortest-first', 'longest-first'], f'Unknown priority: {self.priority}'
+    # Runs of the same config (with different seeds) are config_idx apart by multiples of num_combinations
+    config_file = f'./configs/{exp}.json'
+    self.num_combinations = Sweeper(config_file).config_dicts['num_combinations'] if os.path.isfile(config_file) else None
+    self.backend = backend
+    # Run times of all finished runs of the experiment, including runs not in the job list (e.g. other seeds)
+    self.run_times = {}
+    logs_dir = f'./logs/{exp}/'
+    for name in (os.listdir(logs_dir) if os.path.isdir(logs_dir) else []):
+      run_time = read_run_time(os.path.join(logs_dir, name)) if name.isdigit() else None
+      if run_time is not None:
+        self.run_times[int(name)] = run_time
+    # Job states: pending -> running -> done/failed; failed jobs with retries left are pending again
+    self.states = {config_idx: 'pending' for config_idx in self.job_list}
+    self.attempts = {config_idx: 0 for config_idx in self.job_list}
+
+  def expected_run_time(self, config_idx):
+    '''
+    Return the last run time of config_idx, or else the mean run time of its config (other runs of the same config),
+    or else the mean run time of all finished runs
+    '''
+    if config_idx in self.run_times:
+      return self.run_times[config_idx]
+    if self.num_combinations is not None:
+      same_config = [t for idx, t in self.run_times.items() if (idx-1) % self.num_combinations == (config_idx-1) % self.num_combinations]
+      if len(same_config) > 0:
+        return np.mean(same_config)
+    if len(self.run_times) > 0:
+      return np.mean(list(self.run_times.values()))
+    return 0.0
+
+  def push(self, config_idx):
+    if self.priority == 'shortest-first':
+      key = self.expected_run_time(config_idx)
+    elif self.priority == 'longest-first':
+      key = -self.expected_run_time(config_idx)
+    else:
+      key = 0
+    # Ties (and fifo) keep the order of the job list
+    heapq.heappush(self.pending, (key, self.order[config_idx], config_idx))
+
+  def submit_jobs(self):
+    num_jobs = min(self.backend.num_free(), len(self.pending))
+    if num_jobs <= 0:
+      return
+    job_list = [heapq.heappop(self.pending)[2] for _ in range(num_jobs)]
+    self.backend.submit(job_list)
+    for config_idx in job_list:
+      self.states[config_idx] = 'running'
+      self.attempts[config_idx] += 1
+    print(f'Submit jobs: {job_list}', flush=True)
+
+  def handle_event(self, config_idx, returncode, run_time):
+    count = f'[{self.count("done")+self.count("failed")+1}/{len(self.job_list)}]'
+    if returncode == 0:
+      self.states[config_idx] = 'done'
+      self.run_times[config_idx] = run_time
+      print(f'{count} config_idx={config_idx} finished in {run_time:.2f} minutes', flush=True)
+    elif returncode == stopped_exit_code:
+      self.states[config_idx] = 'pending'
+      self.attempts[config_idx] -= 1
+      self.push(config_idx)
+      print(f'config_idx={config_idx} stopped after saving a checkpoint, resubmit', flush=True)
+    elif self.attempts[config_idx] <= self.max_retries:
+      self.states[config_idx] = 'pending'
+      self.push(config_idx)
+      print(f'config_idx={config_idx} failed with exit code {returncode} (attempt {self.attempts[config_idx]}), retry', flush=True)
+    else:
+      self.states[config_idx] = 'failed'
+      print(f'{count} config_idx={config_idx} failed with exit code {returncode} after {self.attempts[config_idx]} attempts', flush=True)
+
+  def count(self, state):
+    return sum(1 for s in self.states.values() if s == state)
+
+  def run(self):
+    '''
+    Run all jobs and return the failed config indexes
+    '''
+    start_time = time.time()
+    self.order = {config_idx: i for i, config_idx in enumerate(self.job_list)}
+    self.pending = []
+    for config_idx in self.job_list:
+      self.push(config_idx)
+    try:
+      while len(self.pending) > 0 or self.count('running') > 0:
+        self.submit_jobs()
+        for config_idx, returncode, run_time in self.backend.get_events():
+          self.handle_event(config_idx, returncode, run_time)
+    except KeyboardInterrupt:
+      self.backend.cancel()
+      raise
+    failed = [config_idx for config_idx in self.job_list if self.states[config_idx] == 'failed']
+    print(f'{self.count("done")} jobs finished and {len(failed)} jobs failed in {(time.time()-start_time)/60:.2f} minutes', flush=True)
+    if len(failed) > 0:
+      print(f'Failed config indexes: {failed}')
+    return failed
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import socket
+import pandas as pd
+
+from utils.sweeper import Sweeper
+from utils.helper import rss_memory_usage, make_dir
+
+
+# Exit code of a run stopped after saving a checkpoint, to be submitted again (see utils/scheduler.py)
+stopped_exit_code = 3
+
+# Columns of the status table, in order
+status_columns = ['config_idx', 'state', 'step', 'train_steps', 'steps_per_sec', 'memory', 'peak_memory', 'time', 'exit_reason', 'host', 'updated']
+
+def write_json(obj, path):
+  '''
+  Write obj as JSON to a temporary file, then rename it to path:
+  readers always see either the previous or the new complete record
+  '''
+  tmp_path = f'{path}.{os.getpid()}.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(obj, f)
+  os.replace(tmp_path, path)
+
+def read_status(status_file):
+  '''
+  Return the status record in status_file, or None
+  '''
+  try:
+    with open(status_file, 'r') as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+def read_log_status(log_file, max_line_length=10000):
+  '''
+  Return a status record for a run without a status file (logged before status files existed),
+  from the memory and time info in the last two lines of its log file, or None
+  '''
+  try:
+    with open(log_file, 'rb') as f:
+      f.seek(0, os.SEEK_END)
+      f.seek(max(0, f.tell()-max_line_length))
+      lines = [line.decode(errors='ignore').strip() for line in f.readlines()[-2:]]
+  except OSError:
+    return None
+  status = {'state': 'running'}
+  for line in lines:
+    try:
+      if 'Memory usage' in line:
+        status['memory'] = status['peak_memory'] = float(line.split(' ')[-2])
+      elif 'Time elapsed' in line:
+        status['time'] = float(line.split(' ')[-2])
+        status['state'], status['exit_reason'] = 'done', 'finished'
+    except ValueError:
+      continue
+  return status
+
+
+class RunStatus(object):
+  '''
+  The status record of a run in logs/<exp>/<config_idx>/status.json, updated atomically (see write_json):
+    - state: 'running', 'stopped' (after a checkpoint, to be resumed), 'done' or 'failed'
+    - step, train_steps: progress; steps_per_sec: speed since the previous update
+    - memory, peak_memory: resident memory (MB) at the last update and the maximum over all updates
+    - time: wall time (minutes), including the time before resuming; exit_reason: why the run ended
+  Progress updates are written at most every interval seconds.
+  '''
+  def __init__(self, status_path, config_idx, train_steps, interval=60, resume=False):
+    self.status_path = status_path
+    self.interval = interval
+    self.status = {
+      'config_idx': config_idx,
+      'state': 'running',
+      'step': 0,
+      'train_steps': int(train_steps),
+      'steps_per_sec': 0.0,
+      'memory': 0.0,
+      'peak_memory': 0.0,
+      'time': 0.0,
+      'exit_reason': None,
+      'host': socket.gethostname(),
+      'updated': None
+    }
+    self.last_update = None
+    # Keep the peak memory of a resumed run
+    previous = read_status(status_path) if resume else None
+    if previous is not None:
+      self.status['peak_memory'] = previous.get('peak_memory') or 0.0
+
+  def update(self, step, time_elapsed, force=False):
+    '''
+    Record the progress of the run at step after time_elapsed seconds
+    '''
+    now = time.time()
+    if not force and self.last_update is not None and now - self.last_update[0] < self.interval:
+      return
+    if self.last_update is not None and now > self.last_update[0]:
+      self.status['steps_per_sec'] = (step - self.last_update[1]) / (now - self.last_update[0])
+    elif time_elapsed > 0:
+      self.status['steps_per_sec'] = step / time_elapsed
+    self.last_update = (now, step)
+    memory = rss_memory_usage()
+    self.status['step'] = int(step)
+    self.status['memory'] = memory
+    self.status['peak_memory'] = max(self.status['peak_memory'], memory)
+    self.status['time'] = time_elapsed / 60
+    self.write()
+
+  def finish(self, state, exit_reason, step=None, time_elapsed=None):
+    # Record the end of the run: 'done', 'stopped' or 'failed'
+    self.status['state'] = state
+    self.status['exit_reason'] = exit_reason
+    if step is not None:
+      self.update(step, time_elapsed, force=True)
+    else:
+      self.write()
+
+  def write(self):
+    self.status['updated'] = time.time()
+    write_json(self.status, self.status_path)
+
+
+def collect_status(exp, runs=1, file_name='status.json', save=True):
+  '''
+  Build the status table of an experiment in one pass over its log directories: one row per config index
+  in 1..runs*num_combinations (with state 'missing' for runs without logs), indexed by config_idx.
+  Runs without a status file are read from their log files (see read_log_status).
+  The table is saved to logs/<exp>/0/status.csv if save is True.
+  '''
+  num_runs = runs * Sweeper(f'./configs/{exp}.json').config_dicts['num_combinations']
+  logs_dir = f'./logs/{exp}/'
+  rows = []
+  for config_idx in range(1, num_runs+1):
+    run_dir = os.path.join(logs_dir, str(config_idx))
+    status = read_status(os.path.join(run_dir, file_name))
+    if status is None:
+      status = read_log_status(os.path.join(run_dir, 'log.txt'))
+    if status is None:
+      status = {'state': 'missing'}
+    status['config_idx'] = config_idx
+    rows.append(status)
+  table = pd.DataFrame(rows, columns=status_columns).set_index('config_idx')
+  if save:
+    make_dir(os.path.join(logs_dir, '0'))
+    table.to_csv(os.path.join(logs_dir, '0', 'status.csv'))
+  return table
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import bisect
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,11 +13,18 @@ class Sweeper(object):
   '''
   This class generates a Config object and corresponding config dict
   given an index and the config file.
+
+  A config index is a mixed-radix number: each list in a config dict is one digit, whose radix is the number
+  of combinations of the list. The index of the digits (see build_dict_index) is built once, so that
+  decoding an index only visits the lists on its path, and all indexes can be decoded at once with
+  array operations to query them (see get_columns and where).
   '''
   def __init__(self, config_file):
     with open(config_file, 'r') as f:
       self.config_dicts = json.load(f)
     self.get_num_combinations_of_dict(self.config_dicts)
+    self.index = self.build_dict_index(self.config_dicts)
+    self.columns = None
 
   def get_num_combinations_of_dict(self, config_dict):
     '''
@@ -44,13 +52,33 @@ class Sweeper(object):
         num_combinations_of_list += 1
     return num_combinations_of_list
 
+  def build_dict_index(self, config_dict):
+    # The digits of a config dict: a list of (key, index of its config list), from the lowest digit
+    return [(key, self.build_list_index(values)) for key, values in config_dict.items() if key != 'num_combinations']
+
+  def build_list_index(self, config_list):
+    '''
+    The index of a config list: (# of combinations, the first combination of each value, values),
+    where a value is (False, value) or (True, index of a config dict)
+    '''
+    num_combinations, offsets, values = 0, [], []
+    for value in config_list:
+      offsets.append(num_combinations)
+      if type(value) == dict:
+        values.append((True, self.build_dict_index(value)))
+        num_combinations += value['num_combinations']
+      else:
+        values.append((False, value))
+        num_combinations += 1
+    return num_combinations, offsets, values
+
   def generate_config_for_idx(self, idx):
     '''
     Generate a config dict for the index.
     Index is from 1 to # of conbinations.
     '''
     # Get config dict given the index
-    cfg = self.get_dict_value(self.config_dicts, (idx-1) % self.config_dicts['num_combinations'])
+    cfg = self.decode(self.index, (idx-1) % self.config_dicts['num_combinations'])
     # Set config index
     cfg['config_idx'] = idx
     # Set number of combinations
@@ -58,158 +86,119 @@ class Sweeper(object):
 
     return cfg
 
-  def get_list_value(self, config_list, idx):
-    for value in config_list:
-      if type(value) == dict:
-        if idx + 1 - value['num_combinations'] <= 0:
-          return self.get_dict_value(value, idx)
-        else:
-          idx -= value['num_combinations']
-      else:
-        if idx == 0:
-          return value
-        else:
-          idx -= 1
-  
-  def get_dict_value(self, config_dict, idx):
+  def decode(self, dict_index, idx):
+    # Decode idx (from 0) into the config dict of dict_index
     cfg = dict()
-    for key, values in config_dict.items():
-      if key == 'num_combinations':
-        continue
-      num_combinations_of_list = self.get_num_combinations_of_list(values)
-      value = self.get_list_value(values, idx % num_combinations_of_list)
-      cfg[key] = value
-      idx = idx // num_combinations_of_list
+    for key, (num_combinations, offsets, values) in dict_index:
+      idx, i = divmod(idx, num_combinations)
+      # The value whose combinations contain i (the i-th value if there are no config dicts in the list)
+      j = i if len(offsets) == num_combinations else bisect.bisect_right(offsets, i) - 1
+      is_dict, value = values[j]
+      cfg[key] = self.decode(value, i - offsets[j]) if is_dict else value
     return cfg
+
+  def get_columns(self):
+    '''
+    Decode all indexes at once and return the config values as columns: a dict from key paths to arrays,
+    e.g. columns['agent.name'][i] is cfg['agent']['name'] of config index i+1 (None if there is no such key)
+    '''
+    if self.columns is None:
+      self.columns = {}
+      idx = np.arange(self.config_dicts['num_combinations'])
+      self.fill_columns(self.index, '', idx, idx)
+    return self.columns
+
+  def fill_columns(self, dict_index, prefix, rows, idx):
+    # Decode idx (from 0) into the config values of dict_index, for the given rows of the columns
+    for key, (num_combinations, offsets, values) in dict_index:
+      idx, i = np.divmod(idx, num_combinations)
+      j = np.searchsorted(offsets, i, side='right') - 1
+      for k, (is_dict, value) in enumerate(values):
+        mask = j == k
+        if not mask.any():
+          continue
+        if is_dict:
+          self.fill_columns(value, f'{prefix}{key}.', rows[mask], i[mask] - offsets[k])
+        else:
+          if prefix + key not in self.columns:
+            self.columns[prefix + key] = np.full(self.config_dicts['num_combinations'], None, dtype=object)
+          # Assign the same object (e.g. a list) to all rows
+          value_array = np.empty(1, dtype=object)
+          value_array[0] = value
+          self.columns[prefix + key][rows[mask]] = value_array
+
+  def where(self, *conditions):
+    '''
+    Return the config indexes (from 1 to # of combinations) that satisfy all conditions, as an array.
+    A condition is a function of the columns (see get_columns) that returns a boolean array, e.g.
+      sweeper.where(lambda c: c['agent.consod_start'] == c['agent.consod_end'], lambda c: isin(c['env.name'], ['Acrobot-v1']))
+    '''
+    columns = self.get_columns()
+    mask = np.ones(self.config_dicts['num_combinations'], dtype=bool)
+    for condition in conditions:
+      mask &= np.asarray(condition(columns), dtype=bool)
+    return np.flatnonzero(mask) + 1
   
   def print_config_dict(self, config_dict):
     cfg_json = json.dumps(config_dict, indent=2)
     print(cfg_json, end='\n')
 
 
-def unfinished_index(exp, file_name='log.txt', runs=1, max_line_length=10000):
+def isin(column, values):
   '''
-  Find unfinished config indexes based on the existence of time info in the log file
+  Return a boolean array: whether each value of a column (see Sweeper.get_columns) is in values
+  '''
+  return np.array([x in values for x in column], dtype=bool)
+
+
+def unfinished_index(exp, runs=1, table=None):
   '''
-  # Read config files
-  config_file = f'./configs/{exp}.json'
-  sweeper = Sweeper(config_file)
-  # Read a list of logs
+  Find unfinished config indexes: runs not done in the status table of the experiment (see utils.status.collect_status)
+  '''
+  if table is None:
+    from utils.status import collect_status
+    table = collect_status(exp, runs=runs)
   print(f'[{exp}]: ', end=' ')
-  for i in range(runs * sweeper.config_dicts['num_combinations']):
-    log_file = f'./logs/{exp}/{i+1}/{file_name}'
-    try:
-      with open(log_file, 'r') as f:
-        # Get last line
-        try:
-          f.seek(-max_line_length, os.SEEK_END)
-        except IOError:
-          # either file is too small, or too many lines requested
-          f.seek(0)
-        last_line = f.readlines()[-1]
-        # Get time info in last line
-        try:
-          t = float(last_line.split(' ')[-2])
-        except:
-          print(i+1, end=', ')
-          continue
-    except:
-      print(i+1, end=', ')
-      continue
-  print()
-
-
-def time_info(exp, file_name='log.txt', runs=1, nbins=10, max_line_length=10000):
-  time_list = []
-  # Read config file
-  config_file = f'./configs/{exp}.json'
-  sweeper = Sweeper(config_file)
-  # Read a list of logs
-  for i in range(runs * sweeper.config_dicts['num_combinations']):
-    log_file = f'./logs/{exp}/{i+1}/{file_name}'
-    try:
-      with open(log_file, 'r') as f:
-        # Get last line
-        try:
-          f.seek(-max_line_length, os.SEEK_END)
-        except IOError:
-          # either file is too small, or too many lines requested
-          f.seek(0)
-        last_line = f.readlines()[-1]
-        # Get time info in last line
-        try:
-          t = float(last_line.split(' ')[-2])
-          time_list.append(t)
-        except:
-          print('No time info in file: '+log_file)
-          continue
-    except:
-      continue
-  
+  print(*table.index[table['state'] != 'done'], sep=', ')
+
+
+def plot_histogram(exp, values, nbins, xlabel, file_name):
+  # Plot histogram of values to logs/<exp>/0/<file_name>
+  from utils.helper import make_dir
+  make_dir(f'./logs/{exp}/0/')
+  num, bins, patches = plt.hist(values, nbins)
+  plt.xlabel(xlabel)
+  plt.ylabel('Counts in the bin')
+  plt.savefig(f'./logs/{exp}/0/{file_name}')
+  # plt.show()
+  plt.clf()   # clear figure
+  plt.cla()   # clear axis
+  plt.close() # close window
+
+
+def time_info(exp, runs=1, nbins=10, table=None):
+  if table is None:
+    from utils.status import collect_status
+    table = collect_status(exp, runs=runs)
+  time_list = table['time'][table['state'] == 'done'].dropna().to_numpy(dtype=float)
   if len(time_list) > 0:
-    time_list = np.array(time_list)
     print(f'{exp} max time: {np.max(time_list):.2f} minutes')
     print(f'{exp} mean time: {np.mean(time_list):.2f} minutes')
     print(f'{exp} min time: {np.min(time_list):.2f} minutes')
-    
-    # Plot histogram of time distribution
-    from utils.helper import make_dir
-    make_dir(f'./logs/{exp}/0/')
-    num, bins, patches = plt.hist(time_list, nbins)
-    plt.xlabel('Time (min)')
-    plt.ylabel('Counts in the bin')
-    plt.savefig(f'./logs/{exp}/0/time_info.png')
-    # plt.show()
-    plt.clf()   # clear figure
-    plt.cla()   # clear axis
-    plt.close() # close window
+    plot_histogram(exp, time_list, nbins, 'Time (min)', 'time_info.png')
   else:
     print(f'{exp}: no time info!')
-  
-def memory_info(exp, file_name='log.txt', runs=1, nbins=10, max_line_length=10000):
-  mem_list = []
-  # Read config file
-  config_file = f'./configs/{exp}.json'
-  sweeper = Sweeper(config_file)
-  # Read a list of logs
-  for i in range(runs * sweeper.config_dicts['num_combinations']):
-    log_file = f'./logs/{exp}/{i+1}/{file_name}'
-    try:
-      with open(log_file, 'r') as f:
-        # Get last line
-        try:
-          f.seek(-max_line_length, os.SEEK_END)
-        except IOError:
-          # either file is too small, or too many lines requested
-          f.seek(0)
-        last_second_line = f.readlines()[-2]
-        # Get memory info in last line
-        try:
-          m = float(last_second_line.split(' ')[-2])
-          mem_list.append(m)
-        except:
-          print('No memory info in file: '+log_file)
-          continue
-    except:
-      continue
-  
+
+def memory_info(exp, runs=1, nbins=10, table=None):
+  if table is None:
+    from utils.status import collect_status
+    table = collect_status(exp, runs=runs)
+  mem_list = table['peak_memory'][table['state'] == 'done'].dropna().to_numpy(dtype=float)
   if len(mem_list) > 0:
-    mem_list = np.array(mem_list)
     print(f'{exp} max memory: {np.max(mem_list):.2f} MB')
     print(f'{exp} mean memory: {np.mean(mem_list):.2f} MB')
     print(f'{exp} min memory: {np.min(mem_list):.2f} MB')
-    
-    # Plot histogram of time distribution
-    from utils.helper import make_dir
-    make_dir(f'./logs/{exp}/0/')
-    num, bins, patches = plt.hist(mem_list, nbins)
-    plt.xlabel('Memory (MB)')
-    plt.ylabel('Counts in the bin')
-    plt.savefig(f'./logs/{exp}/0/memory_info.png')
-    # plt.show()
-    plt.clf()   # clear figure
-    plt.cla()   # clear axis
-    plt.close() # close window
+    plot_histogram(exp, mem_list, nbins, 'Memory (MB)', 'memory_info.png')
   else:
     print(f'{exp}: no memory info!')
 